@@ -1,13 +1,16 @@
 import socketio
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.requests import Request
 import uvicorn
 from datetime import datetime, timedelta
 import pandas as pd
+import asyncio
 import os
+import signal
+import threading
 
 app = FastAPI()
 
@@ -24,58 +27,139 @@ sio_app = socketio.ASGIApp(sio)
 # Mount Socket.IO app
 app.mount("/socket.io", sio_app)
 
+PREDICTIONS_FILE = 'static/predicted_fire_sizes.csv'
+YEAR_FILES_DIR = 'static/output_by_year'
+WATCH_INTERVAL_SECONDS = float(os.environ.get('WATCH_INTERVAL_SECONDS', 5))
+
+# Columns sent to the frontend and the CSV columns they come from
+RECORD_COLUMNS = {
+    'fips': 'fips',
+    'fire_size': 'fire_size',
+    'LATITUDE': 'lat',
+    'LONGITUDE': 'lon',
+    'fmc': 'fmc',
+    'tmax': 'tmax',
+    'tmin': 'tmin',
+    'prcp': 'prcp',
+    'wind_speed': 'wind_speed',
+}
+
+
+class Partition:
+    """One prediction/year CSV held in memory, sorted by date so a day is a contiguous slice"""
+
+    def __init__(self, file_path):
+        stat = os.stat(file_path)
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+
+        df = pd.read_csv(file_path)
+        df['date'] = pd.to_datetime(df['date']).dt.normalize()
+        df = df[df['fire_size'] >= 0]
+        df = df.sort_values('date', kind='stable')
+
+        self.dates = df['date'].values
+        self.records = df[list(RECORD_COLUMNS.values())].set_axis(list(RECORD_COLUMNS), axis=1).reset_index(drop=True)
+
+    def is_stale(self, file_path):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return True
+        return stat.st_mtime_ns != self.mtime or stat.st_size != self.size
+
+    def records_for(self, requested_date):
+        day = pd.Timestamp(requested_date).to_datetime64()
+        start, end = self.dates.searchsorted(day, side='left'), self.dates.searchsorted(day, side='right')
+        return self.records.iloc[start:end].to_dict(orient='records')
+
+
+class PartitionStore:
+    """
+    In-memory cache of the prediction and year files.
+
+    Readers only look up self._partitions, which is replaced as a whole once a partition is fully loaded,
+    so a request never sees a half-loaded dataset and never waits for a reload.
+    """
+
+    def __init__(self):
+        self._partitions = {}
+        self._reload_lock = threading.Lock()
+        self._reload_requested = threading.Event()
+
+    def get(self, file_path):
+        partition = self._partitions.get(file_path)
+        if partition is None:
+            # First request for this file: load it once, later changes are picked up by the watcher
+            partition = self._load(file_path)
+        return partition
+
+    def _load(self, file_path):
+        partition = Partition(file_path)
+        with self._reload_lock:
+            self._partitions = {**self._partitions, file_path: partition}
+        print(f"Loaded {len(partition.records)} records from {file_path}")
+        return partition
+
+    def reload(self, force=False):
+        """Rebuild the cached partitions whose file changed (or all of them if force) and swap them in"""
+        for file_path, partition in list(self._partitions.items()):
+            if not os.path.exists(file_path):
+                with self._reload_lock:
+                    self._partitions = {k: v for k, v in self._partitions.items() if k != file_path}
+                print(f"Dropped {file_path} from cache: file was removed")
+            elif force or partition.is_stale(file_path):
+                try:
+                    self._load(file_path)
+                except Exception as e:
+                    # Keep serving the previous version, e.g. if the file is being rewritten in place
+                    print(f"Error reloading {file_path}: {str(e)}")
+
+    def request_reload(self):
+        """Ask the watcher thread to rebuild every cached partition"""
+        self._reload_requested.set()
+
+    def watch(self, interval=WATCH_INTERVAL_SECONDS):
+        """Poll the cached files for changes and handle reload requests; runs in a daemon thread"""
+        while True:
+            force = self._reload_requested.wait(timeout=interval)
+            self._reload_requested.clear()
+            try:
+                self.reload(force=force)
+            except Exception as e:
+                print(f"Error in reload watcher: {str(e)}")
+
+
+store = PartitionStore()
+
+
 def load_data(requested_date=None):
-    """Load wildfire and weather data from CSV files for the requested date"""
+    """Load wildfire and weather data for the requested date from the in-memory cache"""
     try:
         if requested_date is not None:
             requested_date = pd.to_datetime(requested_date).date()
         
         if requested_date and requested_date <= datetime(2021, 1, 1).date():
             year = requested_date.year
-            file_path = f'static/output_by_year/merged_data_{year}.csv'
+            file_path = f'{YEAR_FILES_DIR}/merged_data_{year}.csv'
         
             if not os.path.exists(file_path):
                 print(f"Warning: No data file found for year {year} at {file_path}")
                 return []
         else:
-            file_path = 'static/predicted_fire_sizes.csv'
+            file_path = PREDICTIONS_FILE
 
         if not os.path.exists(file_path):
             print(f"Error: File not found at {file_path}")
             return []
-            
-        # Read the Data
-        df = pd.read_csv(file_path)
 
-        # Convert date column to datetime and extract only the date part
-        df['date'] = pd.to_datetime(df['date']).dt.date
-        df = df[df['fire_size'] >= 0]
-        # Convert requested date to date only (remove time component)
-        if requested_date is not None:
-            requested_date = pd.to_datetime(requested_date).date()
-        
         # Filter for the specific date
-        df_filtered = df[df['date'] == requested_date]
-        
-        if len(df_filtered) == 0:
+        data = store.get(file_path).records_for(requested_date)
+
+        if len(data) == 0:
             print(f"No records found for {requested_date}")
             return []
-        print(df_filtered.head())
-        # Convert to list of dictionaries with required format
-        data = []
-        for _, row in df_filtered.iterrows():
-            data.append({
-                'fips': row['fips'],
-                'fire_size': row['fire_size'],
-                'LATITUDE': row['lat'],
-                'LONGITUDE': row['lon'],
-                'fmc': row['fmc'],
-                'tmax': row['tmax'],
-                'tmin': row['tmin'],
-                'prcp': row['prcp'],
-                'wind_speed': row['wind_speed'],
-            })
-        
+
         return data
         
     except Exception as e:
@@ -84,6 +168,23 @@ def load_data(requested_date=None):
         print(f"Full traceback: {traceback.format_exc()}")
         return []
 
+
+@app.on_event("startup")
+async def start_reload_watcher():
+    threading.Thread(target=store.watch, name='partition-reload-watcher', daemon=True).start()
+    # `kill -HUP <pid>` reloads every cached file
+    if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, lambda signum, frame: store.request_reload())
+
+
+@app.post("/admin/reload")
+async def admin_reload(request: Request):
+    """Rebuild the cached prediction/year data in the background. Only accepted from the local machine."""
+    if request.client is None or request.client.host not in ('127.0.0.1', '::1', 'localhost'):
+        return JSONResponse({"status": "forbidden"}, status_code=403)
+    store.request_reload()
+    return {"status": "reload scheduled"}
+
 # Socket.IO events
 @sio.event
 async def connect(sid, environ):
@@ -106,7 +207,7 @@ async def data_request(sid, data):
         date = datetime.fromtimestamp(timestamp)
 
         # Load wildfire data for the requested date
-        wildfire_data = load_data(date)
+        wildfire_data = await asyncio.to_thread(load_data, date)
         print(f"Loaded {len(wildfire_data)} wildfire records")
         if wildfire_data:
             print(f"Sample wildfire record: {wildfire_data[0]}")
@@ -0,0 +1,223 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from obtain_real_time_weather_data import load_california_fips, fetch_weather_data
+from merge_real_time_weather_and_fuel import refresh_latest_fmc_index, merge_weather_with_fuel
+from predict import MODEL_PATH, SCALER_PATH, FEATURE_NAMES_PATH, load_model_artifacts, predict_fire_sizes
+
+'''
+    This script is used for refreshing the forecast shown by the backend on a schedule:
+    fetch weather -> merge fuel -> predict -> publish to static/.
+
+    - Only forecast dates whose weather (or the fuel index / model) changed since the last run are merged and
+      predicted again; the predictions of unchanged dates are reused.
+    - The backend files are published with an atomic rename, so the backend never reads a half-written file.
+      The predictions file is renamed last (see publish_window()).
+    - The duration and row count of every stage are appended to forecast_runs/metrics.jsonl.
+    - A lock file makes sure two refreshes (e.g. the daemon and a manual --once run) never write at the same time.
+'''
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+STATE_DIR = './forecast_runs'
+PREDICTIONS_FILE = './static/predicted_fire_sizes.csv'
+WEATHER_WITH_FUEL_FILE = './static/future_weather_data_with_fuel.csv'
+
+
+def _hash_frame(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+def _hash_file(path):
+    if not os.path.exists(path):
+        return None
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def publish_atomically(df, path):
+    """Write df next to path and rename it into place, so readers see either the old or the new file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def publish_window(window, predictions_file, weather_with_fuel_file):
+    """
+    Publish the weather+fuel rows and the predictions of the forecast window for the backend.
+
+    The two files are renamed one after the other, weather+fuel first and predictions last, so the predictions
+    file is the commit point of a refresh: once a reader sees new predictions, the matching weather+fuel file
+    is already in place. In between, the weather+fuel file may be newer than the predictions. Readers that need
+    both to match should only read the predictions file, which carries every weather+fuel column.
+    """
+    publish_atomically(window.drop(columns=['fire_size']), weather_with_fuel_file)
+    publish_atomically(window, predictions_file)
+    return window
+
+
+class RunLock:
+    """Exclusive, non-blocking lock on a file shared by every refresh process"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self):
+        self.file = open(self.path, 'w')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            self.file = None
+            return False
+        return True
+
+    def release(self):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+
+class StageRecorder:
+    """Record the duration and row counts of each stage of one refresh"""
+
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, func, *args, rows_in=None, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        duration = time.perf_counter() - start
+        rows_out = len(result) if hasattr(result, '__len__') else None
+        self.stages.append({'stage': name, 'seconds': round(duration, 3), 'rows_in': rows_in, 'rows_out': rows_out})
+        logging.info(f"Stage {name}: {duration:.2f}s, rows in={rows_in}, rows out={rows_out}")
+        return result
+
+
+def refresh_forecast(days=14, state_dir=STATE_DIR, fuel_file='./filled_fips_fuel_data.csv',
+                     predictions_file=PREDICTIONS_FILE, weather_with_fuel_file=WEATHER_WITH_FUEL_FILE):
+    """
+    Run one fetch -> merge -> predict -> publish cycle for the next `days` days.
+
+    Returns the run record (also appended to metrics.jsonl), or None if another refresh holds the lock.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    lock = RunLock(os.path.join(state_dir, 'refresh.lock'))
+    if not lock.acquire():
+        logging.warning("Another forecast refresh is running, skipping this one")
+        return None
+
+    try:
+        recorder = StageRecorder()
+        started_at = datetime.now()
+        start_date = datetime(started_at.year, started_at.month, started_at.day)
+        end_date = start_date + timedelta(days=days - 1)
+
+        # 1. Fetch the weather for the whole window
+        fips_df = load_california_fips()
+        weather = recorder.run('fetch', fetch_weather_data, fips_df, start_date, end_date, rows_in=len(fips_df))
+
+        # 2. Find the dates whose inputs changed since the last run
+        hashes_file = os.path.join(state_dir, 'window_hashes.json')
+        previous = {}
+        if os.path.exists(hashes_file):
+            with open(hashes_file, 'r') as f:
+                previous = json.load(f)
+
+        index = recorder.run('fuel_index', refresh_latest_fmc_index, fuel_file, os.path.join(state_dir, 'latest_fmc_index.csv'))
+        model, scaler, feature_names = load_model_artifacts(MODEL_PATH, SCALER_PATH, FEATURE_NAMES_PATH)
+        # The artifacts predict.py loads: a new model, scaler or feature list invalidates every cached date
+        upstream = {
+            'fuel_index': _hash_frame(index),
+            'model': _hash_file(MODEL_PATH),
+            'scaler': _hash_file(SCALER_PATH),
+            'feature_names': _hash_file(FEATURE_NAMES_PATH),
+        }
+        upstream_changed = upstream != previous.get('upstream')
+
+        date_hashes = {
+            date: _hash_frame(group.sort_values('fips').reset_index(drop=True))
+            for date, group in weather.groupby('date')
+        }
+        previous_dates = previous.get('dates', {})
+        changed_dates = sorted(
+            date for date, digest in date_hashes.items()
+            if upstream_changed or previous_dates.get(date) != digest
+        )
+
+        old_predictions = pd.DataFrame()
+        if not upstream_changed and os.path.exists(predictions_file):
+            old_predictions = pd.read_csv(predictions_file)
+            old_predictions = old_predictions[
+                old_predictions['date'].isin(date_hashes) & ~old_predictions['date'].isin(changed_dates)
+            ]
+        logging.info(f"{len(changed_dates)} of {len(date_hashes)} forecast dates changed")
+
+        # 3. Merge fuel and predict only the changed dates
+        changed_weather = weather[weather['date'].isin(changed_dates)]
+        merged = recorder.run('merge', merge_weather_with_fuel, changed_weather, index, rows_in=len(changed_weather))
+        predicted = recorder.run('predict', predict_fire_sizes, merged, model, scaler, feature_names, rows_in=len(merged))
+
+        # 4. Publish the whole window atomically
+        if len(changed_dates) > 0 or not os.path.exists(predictions_file):
+            window = pd.concat([old_predictions, predicted], ignore_index=True).sort_values(['date', 'fips'])
+            recorder.run('publish', publish_window, window, predictions_file, weather_with_fuel_file, rows_in=len(window))
+
+        with open(hashes_file + '.tmp', 'w') as f:
+            json.dump({'upstream': upstream, 'dates': date_hashes}, f)
+        os.replace(hashes_file + '.tmp', hashes_file)
+
+        record = {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'window': [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')],
+            'changed_dates': changed_dates,
+            'stages': recorder.stages,
+        }
+        with open(os.path.join(state_dir, 'metrics.jsonl'), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        return record
+    finally:
+        lock.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the wildfire forecast used by the backend on a schedule")
+    parser.add_argument('--interval-minutes', type=float, default=360, help="Minutes between two refreshes")
+    parser.add_argument('--days', type=int, default=14, help="Number of forecast days, starting today")
+    parser.add_argument('--fuel-file', default='./filled_fips_fuel_data.csv', help="Filled fuel data CSV")
+    parser.add_argument('--once', action='store_true', help="Run a single refresh and exit")
+    args = parser.parse_args()
+
+    while True:
+        started = time.monotonic()
+        try:
+            refresh_forecast(days=args.days, fuel_file=args.fuel_file)
+        except Exception as e:
+            logging.error(f"Forecast refresh failed: {str(e)}")
+            import traceback
+            logging.error(f"Full traceback: {traceback.format_exc()}")
+
+        if args.once:
+            break
+        # Runs are sequential, so a slow refresh delays the next one instead of overlapping it
+        time.sleep(max(0.0, args.interval_minutes * 60 - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,159 @@
 import pandas as pd
+import hashlib
+import json
+import os
+import logging
 
-# Load the fuel and weather data
-fuel_data = pd.read_csv('./filled_fips_fuel_data.csv')
-weather_data = pd.read_csv('./weather_data.csv')
+'''
+    This script is used for merging the real-time weather data with the latest fuel moisture (fmc) of each FIPS.
 
-# Ensure 'date' is parsed as a date object
-fuel_data['date'] = pd.to_datetime(fuel_data['date']).dt.date
-weather_data['date'] = pd.to_datetime(weather_data['date']).dt.date
+    Instead of re-reading the whole 1992-2020 fuel history on every run, the latest fmc per FIPS is kept in a small
+    index (latest_fmc_index.csv). The index is refreshed incrementally: only fuel rows appended to the fuel file
+    since the last run are read. The forecast rows then take the latest fmc of their FIPS with a single map.
+'''
 
-# Step 1: Left join weather to fuel to keep all weather rows
-merged_data = pd.merge(weather_data, fuel_data, on=['fips', 'date'], how='left')
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Step 2: Fill missing 'fmc' by finding the latest available for the same 'fips'
-# Get the latest available FMC per fips
-latest_fuel = fuel_data.sort_values('date').drop_duplicates('fips', keep='last')[['fips', 'fmc']]
-latest_fuel = latest_fuel.rename(columns={'fmc': 'latest_fmc'})
+FUEL_FILE = './filled_fips_fuel_data.csv'
+WEATHER_FILE = './weather_data.csv'
+INDEX_FILE = './latest_fmc_index.csv'
+OUTPUT_FILE = 'future_weather_data_with_fuel.csv'
 
-# Merge latest_fuel back into merged_data
-merged_data = pd.merge(merged_data, latest_fuel, on='fips', how='left')
 
-# If original fmc is NaN, use latest_fmc
-merged_data['fmc'] = merged_data['fmc'].fillna(merged_data['latest_fmc'])
+# Bytes at the end of the indexed part of the fuel file that must be unchanged for an incremental refresh
+TAIL_BYTES = 64 * 1024
 
-# Drop the helper column
-merged_data.drop(columns='latest_fmc', inplace=True)
 
-# Save to CSV
-merged_data.to_csv('future_weather_data_with_fuel.csv', index=False)
+def _state_file(index_file):
+    return os.path.splitext(index_file)[0] + '.state.json'
 
-print("Filled missing fuel data and saved to 'future_weather_data_with_fuel.csv'")
-print(f"Number of rows: {len(merged_data)}")
-print(merged_data.head())
+
+def _tail_hash(fuel_file, size):
+    """sha256 of the TAIL_BYTES before offset size, which end with the last indexed line"""
+    with open(fuel_file, 'rb') as f:
+        f.seek(max(0, size - TAIL_BYTES))
+        return hashlib.sha256(f.read(min(size, TAIL_BYTES))).hexdigest()
+
+
+def _latest_per_fips(fuel_data):
+    """Keep the most recent fmc sample of each FIPS"""
+    fuel_data = fuel_data.dropna(subset=['fips', 'date', 'fmc'])
+    return fuel_data.sort_values('date', kind='stable').drop_duplicates('fips', keep='last')[['fips', 'date', 'fmc']]
+
+
+def _read_fuel(fuel_file, skip_rows=0):
+    fuel_data = pd.read_csv(
+        fuel_file,
+        usecols=['fips', 'date', 'fmc'],
+        skiprows=range(1, skip_rows + 1) if skip_rows else None
+    )
+    fuel_data['fips'] = fuel_data['fips'].astype(int)
+    fuel_data['date'] = pd.to_datetime(fuel_data['date'])
+    return fuel_data
+
+
+def refresh_latest_fmc_index(fuel_file=FUEL_FILE, index_file=INDEX_FILE, new_samples=None):
+    """
+    Load the latest fmc per FIPS index, updating it with fuel samples that arrived since the last run.
+
+    Parameters:
+    -----------
+    fuel_file : str
+        Path to the fuel data CSV. Rows appended to it since the last refresh are read incrementally.
+        If the file was rewritten (it shrank, its header changed or the end of the indexed part is not the same
+        bytes as at the last refresh), the index is rebuilt from scratch.
+    index_file : str
+        Path of the persistent index (fips, date, fmc)
+    new_samples : DataFrame, optional
+        Extra fuel samples (fips, date, fmc) to fold into the index, e.g. freshly downloaded field samples
+
+    Returns:
+    --------
+    DataFrame with one row per FIPS: fips, date of the latest sample, and its fmc
+    """
+    state_file = _state_file(index_file)
+    state = {}
+    index = None
+    if os.path.exists(index_file) and os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+        index = pd.read_csv(index_file, parse_dates=['date'])
+
+    updates = []
+    if os.path.exists(fuel_file):
+        stat = os.stat(fuel_file)
+        with open(fuel_file, 'r') as f:
+            header = f.readline()
+
+        unchanged = (
+            index is not None
+            and state.get('source') == os.path.abspath(fuel_file)
+            and state.get('header') == header
+        )
+        if unchanged and stat.st_size == state.get('size') and stat.st_mtime == state.get('mtime'):
+            logging.info("Fuel data unchanged since last refresh")
+        elif (unchanged and stat.st_size > state.get('size', 0)
+              and state.get('tail_sha256') == _tail_hash(fuel_file, state['size'])):
+            logging.info(f"Reading fuel rows appended after row {state['rows']}...")
+            appended = _read_fuel(fuel_file, skip_rows=state['rows'])
+            logging.info(f"Found {len(appended)} new fuel rows")
+            updates.append(appended)
+            state['rows'] += len(appended)
+        else:
+            logging.info("Building latest fmc index from the full fuel history...")
+            index = None
+            history = _read_fuel(fuel_file)
+            updates.append(history)
+            state = {'source': os.path.abspath(fuel_file), 'header': header, 'rows': len(history)}
+
+        state['size'] = stat.st_size
+        state['mtime'] = stat.st_mtime
+        state['tail_sha256'] = _tail_hash(fuel_file, stat.st_size)
+    elif index is None:
+        raise FileNotFoundError(f"Neither the fuel data {fuel_file} nor the index {index_file} exist")
+
+    if new_samples is not None and len(new_samples) > 0:
+        new_samples = new_samples[['fips', 'date', 'fmc']].copy()
+        new_samples['fips'] = new_samples['fips'].astype(int)
+        new_samples['date'] = pd.to_datetime(new_samples['date'])
+        logging.info(f"Adding {len(new_samples)} new fuel samples")
+        updates.append(new_samples)
+
+    if updates:
+        # The index is tiny (one row per FIPS), so folding the updates into it is cheap
+        frames = ([index] if index is not None else []) + [_latest_per_fips(u) for u in updates]
+        index = _latest_per_fips(pd.concat(frames, ignore_index=True)).sort_values('fips').reset_index(drop=True)
+
+        index.to_csv(index_file, index=False, date_format='%Y-%m-%d')
+        with open(state_file, 'w') as f:
+            json.dump(state, f)
+        logging.info(f"Saved latest fmc index with {len(index)} FIPS to '{index_file}'")
+
+    return index
+
+
+def merge_weather_with_fuel(weather_data, index):
+    """
+    Attach the latest fmc of its FIPS to every weather row.
+
+    The index only keeps the latest sample of each FIPS, so this is a plain per-FIPS lookup, whatever the date of
+    the row (the forecast days come after the fuel history anyway). FIPS missing from the index get NaN.
+    """
+    merged_data = weather_data.drop(columns=['fmc'], errors='ignore').copy()
+    merged_data['fmc'] = merged_data['fips'].astype(int).map(index.set_index('fips')['fmc'])
+    return merged_data
+
+
+if __name__ == "__main__":
+    index = refresh_latest_fmc_index(FUEL_FILE, INDEX_FILE)
+
+    weather_data = pd.read_csv(WEATHER_FILE)
+    merged_data = merge_weather_with_fuel(weather_data, index)
+
+    # Save to CSV
+    merged_data.to_csv(OUTPUT_FILE, index=False)
+
+    print(f"Filled missing fuel data and saved to '{OUTPUT_FILE}'")
+    print(f"Number of rows: {len(merged_data)}")
+    print(merged_data.head())
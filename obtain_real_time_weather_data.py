@@ -1,67 +1,82 @@
 import requests
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Load the CSV file containing FIPS codes and their coordinates
-input_csv = "./preprocess/all_fips_code.csv"
-df = pd.read_csv(input_csv, usecols=["fips", "lat", "lon"])
+WEATHER_COLUMNS = ["date", "fips", "lat", "lon", "tmax", "tmin", "prcp", "wind_speed"]
 
-# Filter for California counties (FIPS from 6001 to 6115)
-df = df[(df['fips'] >= 6001) & (df['fips'] <= 6115)]
 
-# Prepare an empty list for storing results
-data_list = []
+def load_california_fips(input_csv="./preprocess/all_fips_code.csv"):
+    """Load the FIPS codes and their coordinates for California counties (FIPS from 6001 to 6115)"""
+    df = pd.read_csv(input_csv, usecols=["fips", "lat", "lon"])
+    return df[(df['fips'] >= 6001) & (df['fips'] <= 6115)]
 
-# Define date range: May 9 to May 20, 2025
-start_date = datetime(2025, 5, 6)
-end_date = datetime(2025, 5, 8)
-date_range = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
 
-logging.info("Starting to fetch weather data for California FIPS codes.")
+def fetch_weather_data(fips_df, start_date, end_date):
+    """
+    Fetch the daily forecast of every FIPS in fips_df between start_date and end_date (inclusive).
 
-for single_date in date_range:
-    date_str = single_date.strftime('%Y-%m-%d')
-    for _, row in df.iterrows():
+    One request is made per FIPS for the whole date window.
+
+    Returns:
+    --------
+    DataFrame with columns date, fips, lat, lon, tmax, tmin, prcp, wind_speed
+    """
+    start_str = start_date.strftime('%Y-%m-%d')
+    end_str = end_date.strftime('%Y-%m-%d')
+    data_list = []
+
+    for _, row in fips_df.iterrows():
         fips = row['fips']
         lat = row['lat']
         lon = row['lon']
 
         # FIPS code sanity check (optional if already filtered)
-        if 1001 <= fips <= 72153:
-            url = (
-                f"https://api.open-meteo.com/v1/forecast?"
-                f"latitude={lat}&longitude={lon}"
-                f"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max"
-                f"&timezone=auto&start_date={date_str}&end_date={date_str}"
-            )
-            response = requests.get(url)
-            if response.status_code != 200:
-                logging.error(f"Error fetching data for FIPS {fips} on {date_str}: {response.status_code}")
-                continue
-
-            weather_data = response.json().get("daily", {})
-            if not weather_data or not weather_data.get("time"):
-                logging.warning(f"No weather data returned for FIPS {fips} on {date_str}")
-                continue
-
-            tmax = weather_data["temperature_2m_max"][0]
-            tmin = weather_data["temperature_2m_min"][0]
-            prcp = weather_data["precipitation_sum"][0]
-            wind_speed = weather_data["wind_speed_10m_max"][0]
+        if not 1001 <= fips <= 72153:
+            continue
+
+        url = (
+            f"https://api.open-meteo.com/v1/forecast?"
+            f"latitude={lat}&longitude={lon}"
+            f"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max"
+            f"&timezone=auto&start_date={start_str}&end_date={end_str}"
+        )
+        response = requests.get(url)
+        if response.status_code != 200:
+            logging.error(f"Error fetching data for FIPS {fips} from {start_str} to {end_str}: {response.status_code}")
+            continue
+
+        weather_data = response.json().get("daily", {})
+        if not weather_data or not weather_data.get("time"):
+            logging.warning(f"No weather data returned for FIPS {fips} from {start_str} to {end_str}")
+            continue
 
+        for i, date_str in enumerate(weather_data["time"]):
+            tmax = weather_data["temperature_2m_max"][i]
+            tmin = weather_data["temperature_2m_min"][i]
+            prcp = weather_data["precipitation_sum"][i]
+            wind_speed = weather_data["wind_speed_10m_max"][i]
             data_list.append([date_str, fips, lat, lon, tmax, tmin, prcp, wind_speed])
-            logging.info(f"Fetched data for FIPS {fips} on {date_str}: tmax={tmax}, tmin={tmin}, prcp={prcp}, wind_speed={wind_speed}")
+        logging.info(f"Fetched {len(weather_data['time'])} days of data for FIPS {fips}")
+
+    # Convert to DataFrame
+    return pd.DataFrame(data_list, columns=WEATHER_COLUMNS)
+
+
+if __name__ == "__main__":
+    # Define date range: May 6 to May 8, 2025
+    start_date = datetime(2025, 5, 6)
+    end_date = datetime(2025, 5, 8)
 
-# Convert to DataFrame
-output_df = pd.DataFrame(data_list, columns=["date", "fips", "lat", "lon", "tmax", "tmin", "prcp", "wind_speed"])
-print("Converted to DataFrame.")
+    logging.info("Starting to fetch weather data for California FIPS codes.")
+    output_df = fetch_weather_data(load_california_fips(), start_date, end_date)
+    print("Converted to DataFrame.")
 
-# Save to CSV
-output_csv = "weather_data_CA_2025_05_06_to_2025_05_08.csv"
-output_df.to_csv(output_csv, index=False)
-print("Saved to CSV.")
-print(f"Weather data from May 9 to May 20 saved to '{output_csv}'")
+    # Save to CSV
+    output_csv = "weather_data_CA_2025_05_06_to_2025_05_08.csv"
+    output_df.to_csv(output_csv, index=False)
+    print("Saved to CSV.")
+    print(f"Weather data from May 6 to May 8 saved to '{output_csv}'")
@@ -0,0 +1,113 @@
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from gap_fill import build_grid, build_neighbor_index, fill_nearest_in_time, fill_grid, grid_to_frame
+
+'''
+    This script is used for benchmarking the dense-array gap-filling engine (gap_fill.py) against the pandas
+    implementation previously copied in the tp, wind and fuel fill scripts, on synthetic data.
+
+    Example: python benchmark_gap_fill.py --fips 500 --start 2018-01-01 --end 2020-12-31 --columns 3
+'''
+
+
+def pandas_step1(df, columns, all_fips, full_date_range):
+    """Step 1 of the previous pandas implementation"""
+    all_combinations = pd.MultiIndex.from_product(
+        [all_fips, full_date_range], names=['fips', 'date']
+    ).to_frame(index=False)
+    combined = all_combinations.merge(df, on=['fips', 'date'], how='left')
+    for col in columns:
+        combined[col] = combined.groupby('fips')[col].transform(
+            lambda x: x.interpolate(method='nearest', limit_direction='both')
+        )
+    return combined
+
+
+def pandas_fill(df, columns, all_fips, full_date_range):
+    """The full previous pandas implementation (steps 1-3)"""
+    combined = pandas_step1(df, columns, all_fips, full_date_range)
+    for col in columns:
+        if combined[col].isna().sum() > 0:
+            nearby_fips = pd.concat(
+                [df.assign(fips=df['fips'] + i) for i in range(-10, 11) if i != 0]
+            ).sort_values(by=['fips', 'date'])
+            missing_mask = combined[col].isna()
+            missing_data = combined[missing_mask].sort_values(by='date')
+            if len(missing_data) > 0:
+                fallback_filled = pd.merge_asof(
+                    missing_data,
+                    nearby_fips.sort_values(by='date'),
+                    on='date',
+                    by='fips',
+                    direction='nearest'
+                )
+                combined.loc[missing_mask, col] = fallback_filled[f'{col}_y']
+    for col in columns:
+        combined[col] = combined[col].fillna(combined.groupby('date')[col].transform('mean'))
+    return combined.sort_values(by=['fips', 'date']).reset_index(drop=True)
+
+
+def engine_fill(df, columns, all_fips, lat, lon, full_date_range):
+    grid = build_grid(df, columns, all_fips, full_date_range)
+    fill_grid(grid, columns, build_neighbor_index(lat, lon))
+    return grid_to_frame(grid, columns, all_fips, full_date_range)
+
+
+def measure(func, *args):
+    """Wall-clock seconds of an untraced run, and peak MiB traced by tracemalloc in a second run"""
+    start = time.perf_counter()
+    result = func(*args)
+    duration = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak / 1024 ** 2
+
+
+def make_data(n_fips, full_date_range, n_columns, observed_fraction, seed=42):
+    rng = np.random.default_rng(seed)
+    all_fips = np.unique(rng.choice(np.arange(1001, 56046), size=n_fips, replace=False))
+    lat = rng.uniform(25, 49, size=len(all_fips))
+    lon = rng.uniform(-125, -67, size=len(all_fips))
+    cells = rng.random((len(all_fips), len(full_date_range))) < observed_fraction
+    fips_idx, day_idx = np.nonzero(cells)
+    df = pd.DataFrame({'fips': all_fips[fips_idx], 'date': full_date_range[day_idx]})
+    columns = [f'value_{i}' for i in range(n_columns)]
+    for col in columns:
+        df[col] = rng.normal(size=len(df)).round(1)
+    return df, columns, all_fips, lat, lon
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the gap-filling engine against the pandas path")
+    parser.add_argument('--fips', type=int, default=300)
+    parser.add_argument('--start', default='2019-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--columns', type=int, default=3)
+    parser.add_argument('--observed-fraction', type=float, default=0.3)
+    args = parser.parse_args()
+
+    full_date_range = pd.date_range(start=args.start, end=args.end)
+    df, columns, all_fips, lat, lon = make_data(args.fips, full_date_range, args.columns, args.observed_fraction)
+    print(f"{len(all_fips)} FIPS x {len(full_date_range)} days, {len(columns)} columns, {len(df)} observed rows")
+
+    # Step 1 must give the same values as interpolate(method='nearest')
+    expected = pandas_step1(df, columns, all_fips, full_date_range)
+    grid = build_grid(df, columns, all_fips, full_date_range)
+    fill_nearest_in_time(grid)
+    for i, col in enumerate(columns):
+        same = np.allclose(grid[i].ravel(), expected[col].values.astype(np.float32), equal_nan=True)
+        print(f"Step 1 matches pandas for {col}: {same}")
+
+    _, pandas_seconds, pandas_peak = measure(pandas_fill, df, columns, all_fips, full_date_range)
+    _, engine_seconds, engine_peak = measure(engine_fill, df, columns, all_fips, lat, lon, full_date_range)
+
+    print(f"{'':<10}{'seconds':>10}{'peak MiB':>12}")
+    print(f"{'pandas':<10}{pandas_seconds:>10.2f}{pandas_peak:>12.1f}")
+    print(f"{'engine':<10}{engine_seconds:>10.2f}{engine_peak:>12.1f}")
+    print(f"Speed-up: {pandas_seconds / engine_seconds:.1f}x, peak memory: {pandas_peak / engine_peak:.1f}x lower")
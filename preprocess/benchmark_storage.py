@@ -0,0 +1,116 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+import schema
+import storage
+
+'''
+    This script is used for benchmarking the storage formats of storage.py on the tables the pipeline stages hand
+    to each other: for every table, the time its writer stage takes to save it and its reader stage takes to load it
+    (with the dates the reader asks for), as CSV, Parquet and Feather, on synthetic (fips x day) data.
+
+    Example: python benchmark_storage.py --fips 500 --days 1461
+'''
+
+# Table, its columns, and the dates its reader stage loads ('datetime' for the fill stages, 'offset' for the merges)
+TABLES = [
+    ('fips_tp_no_na_averaged', ['fips', 'date', 'tmin', 'prcp', 'tmax'], 'datetime'),
+    ('fips_wind_no_na_averaged', ['fips', 'date', 'wind_speed'], 'datetime'),
+    ('filled_fips_fuel_data', ['fips', 'date', 'fmc'], 'offset'),
+    ('filled_fips_wind_data', ['fips', 'date', 'wind_speed'], 'offset'),
+    ('aggregated_daily_fire_size_filled', ['fips', 'date', 'FIRE_SIZE', 'lon', 'lat'], 'offset'),
+    ('merged_data', ['date', 'fmc', 'fips', 'tmax', 'tmin', 'prcp', 'wind_speed', 'fire_size', 'lat', 'lon'],
+     'datetime'),
+]
+# CSV first, it is the baseline
+FORMATS = ['csv', 'parquet', 'feather']
+
+
+def make_table(columns, n_fips, n_days, seed=42):
+    """Synthetic (fips x day) table with the schema dtypes of the pipeline"""
+    rng = np.random.default_rng(seed)
+    fips = np.sort(rng.choice(np.arange(1001, 56046), size=n_fips, replace=False)).astype(schema.FIPS_DTYPE)
+    dates = pd.date_range('1992-01-01', periods=n_days)
+    lat = rng.uniform(25, 49, size=n_fips)
+    lon = rng.uniform(-125, -67, size=n_fips)
+    n_rows = n_fips * n_days
+
+    df = pd.DataFrame()
+    for col in columns:
+        if col == 'fips':
+            df[col] = np.repeat(fips, n_days)
+        elif col == 'date':
+            df[col] = np.tile(dates.values, n_fips)
+        elif col in ('lat', 'lon'):
+            df[col] = np.repeat(lat if col == 'lat' else lon, n_days)
+        elif col in ('FIRE_SIZE', 'fire_size'):
+            burning = rng.random(n_rows) < 0.01
+            df[col] = np.where(burning, rng.exponential(50, n_rows), 0).astype(schema.MEASUREMENT_DTYPE)
+        else:
+            df[col] = rng.normal(20, 10, n_rows).astype(schema.MEASUREMENT_DTYPE)
+    return df
+
+
+def best_of(repeat, func, *args, **kwargs):
+    """Result of func and its fastest wall-clock seconds over repeat runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return result, best
+
+
+def benchmark_table(df, name, dates, work_dir, repeat):
+    """Write and read seconds and file MiB of df in every format; checks that every format reads back the same"""
+    results = {}
+    expected = None
+    for fmt in FORMATS:
+        path = os.path.join(work_dir, name)
+        file, write_seconds = best_of(repeat, storage.write_table, df, path, fmt=fmt, csv_export=False)
+        loaded, read_seconds = best_of(repeat, storage.read_table, path, dates=dates, fmt=fmt)
+        if expected is None:
+            expected = loaded
+        else:
+            pd.testing.assert_frame_equal(loaded, expected, check_dtype=False)
+        results[fmt] = (write_seconds, read_seconds, os.path.getsize(file) / 1024 ** 2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CSV vs Parquet vs Feather on the pipeline tables")
+    parser.add_argument('--fips', type=int, default=300)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement, the fastest is kept")
+    args = parser.parse_args()
+
+    print(f"{args.fips} FIPS x {args.days} days = {args.fips * args.days} rows per table")
+    header = f"{'table':<36}{'format':<9}{'write s':>9}{'read s':>9}{'total s':>9}{'MiB':>8}{'saved s':>9}"
+    print(header)
+    print('-' * len(header))
+
+    totals = {fmt: 0.0 for fmt in FORMATS}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, columns, dates in TABLES:
+            df = make_table(columns, args.fips, args.days)
+            results = benchmark_table(df, name, dates, work_dir, args.repeat)
+            csv_total = sum(results['csv'][:2])
+            for fmt, (write_seconds, read_seconds, mib) in results.items():
+                total = write_seconds + read_seconds
+                totals[fmt] += total
+                saved = f"{csv_total - total:>9.2f}" if fmt != 'csv' else f"{'':>9}"
+                print(f"{name if fmt == 'csv' else '':<36}{fmt:<9}{write_seconds:>9.2f}{read_seconds:>9.2f}"
+                      f"{total:>9.2f}{mib:>8.1f}{saved}")
+
+    print('-' * len(header))
+    for fmt, total in totals.items():
+        if fmt == 'csv':
+            print(f"All tables, csv: {total:.2f}s")
+        else:
+            print(f"All tables, {fmt}: {total:.2f}s ({totals['csv'] / total:.1f}x faster than CSV, "
+                  f"{totals['csv'] - total:.2f}s saved)")
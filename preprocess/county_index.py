@@ -0,0 +1,121 @@
+import logging
+import os
+import pickle
+import numpy as np
+
+'''
+    Shared county reference data for the spatial-join scripts (tp stations, fuel sites, wind grid cells, wildfires).
+
+    cb_2022_us_county_500k.shp is parsed once with geopandas, reprojected to EPSG:4326 (the lon/lat of all the
+    point data) and cached next to the shapefile as a pickle of WKB geometries, GEOID and NAME, which loads in a
+    fraction of the time the shapefile takes to parse. The cache is rebuilt when the .shp or .dbf changes.
+
+    load_county_index() returns a CountyIndex holding the polygons and a prebuilt STRtree (once per process), and
+    points_to_geoid(lon, lat) finds the county of whole arrays of points with one vectorized tree query, without
+    building a shapely Point per row.
+'''
+
+SHAPEFILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'tp', 'cb_2022_us_county_500k', 'cb_2022_us_county_500k.shp'
+)
+CRS = "EPSG:4326"
+
+_indexes = {}
+
+
+def _source_key(shapefile):
+    """Size and modification time of the .shp and .dbf files"""
+    key = []
+    for path in (shapefile, os.path.splitext(shapefile)[0] + '.dbf'):
+        stat = os.stat(path)
+        key.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+    return key
+
+
+class CountyIndex:
+    """County polygons (EPSG:4326) with their GEOID and NAME and an STRtree over them"""
+
+    def __init__(self, geoid, name, geometries):
+        import shapely
+
+        self.geoid = np.asarray(geoid, dtype=object)
+        self.name = np.asarray(name, dtype=object)
+        self.geometries = geometries
+        self.tree = shapely.STRtree(geometries)
+
+    def locate(self, lon, lat):
+        """Position of the county each point falls within, -1 outside all counties or without coordinates"""
+        import shapely
+
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        located = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+        points = shapely.points(lon[located], lat[located])
+        point_idx, county_idx = self.tree.query(points, predicate='within')
+
+        # Counties do not overlap, so a point is within at most one; keep the first match if it ever happens
+        county = np.full(len(lon), -1, dtype=np.int64)
+        first = np.unique(point_idx, return_index=True)[1]
+        county[located[point_idx[first]]] = county_idx[first]
+        return county
+
+    def points_to_geoid(self, lon, lat):
+        """GEOID string of the county each point falls within, NaN where there is none"""
+        county = self.locate(lon, lat)
+        return np.where(county >= 0, self.geoid[county], np.nan)
+
+    def points_to_name(self, lon, lat):
+        """NAME of the county each point falls within, NaN where there is none"""
+        county = self.locate(lon, lat)
+        return np.where(county >= 0, self.name[county], np.nan)
+
+    def to_geodataframe(self):
+        """The counties as a GeoDataFrame with GEOID, NAME and geometry columns"""
+        import geopandas as gpd
+
+        return gpd.GeoDataFrame({'GEOID': self.geoid, 'NAME': self.name}, geometry=self.geometries, crs=CRS)
+
+
+def _read_shapefile(shapefile):
+    import geopandas as gpd
+
+    counties = gpd.read_file(shapefile)[['GEOID', 'NAME', 'geometry']].to_crs(CRS)
+    return (
+        np.asarray(counties['GEOID'], dtype=object), np.asarray(counties['NAME'], dtype=object),
+        np.asarray(counties.geometry.values)
+    )
+
+
+def load_county_index(shapefile=SHAPEFILE):
+    """The CountyIndex of shapefile, from the binary cache when it is up to date (built once per process)"""
+    import shapely
+
+    shapefile = os.path.abspath(shapefile)
+    key = _source_key(shapefile)
+    if shapefile in _indexes and _indexes[shapefile][0] == key:
+        return _indexes[shapefile][1]
+
+    cache_file = shapefile + '.county_index.pkl'
+    cached = None
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get('source') != key:
+            cached = None
+
+    if cached is None:
+        logging.info(f"Parsing {shapefile} and caching the counties to {cache_file}")
+        geoid, name, geometries = _read_shapefile(shapefile)
+        cached = {'source': key, 'geoid': geoid, 'name': name, 'wkb': shapely.to_wkb(geometries)}
+        with open(cache_file + '.tmp', 'wb') as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file + '.tmp', cache_file)
+
+    index = CountyIndex(cached['geoid'], cached['name'], shapely.from_wkb(cached['wkb']))
+    _indexes[shapefile] = (key, index)
+    return index
+
+
+def points_to_geoid(lon, lat, shapefile=SHAPEFILE):
+    """GEOID of the county each (lon, lat) point falls within, NaN where there is none"""
+    return load_county_index(shapefile).points_to_geoid(lon, lat)
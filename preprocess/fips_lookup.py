@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+from county_index import SHAPEFILE, load_county_index
+
+'''
+    Cached station/site ID -> FIPS lookup shared by the spatial-join scripts (tp stations, fuel sites).
+
+    The daily data has tens of millions of rows but only tens of thousands of distinct stations, so the county lookup
+    (county_index.py) runs once over one (lon, lat) point per ID. The resulting table is saved as a
+    CSV next to a .json sidecar holding a hash of those points and of the shapefile. Reruns reuse the table unless
+    the station list, their coordinates or the shapefile changed, and the daily rows are tagged with a hash join
+    on the ID.
+'''
+
+def unique_points(df, id_col, lon_col, lat_col):
+    """One (id, lon, lat) row per ID of df, sorted by ID so the hash does not depend on row order"""
+    points = df[[id_col, lon_col, lat_col]].drop_duplicates()
+    moved = points[id_col].duplicated()
+    if moved.any():
+        logging.warning(f"{points.loc[moved, id_col].nunique()} IDs have several coordinates, keeping the first")
+        points = points[~moved]
+    return points.sort_values(id_col, kind='stable').reset_index(drop=True)
+
+
+def points_hash(points, shapefile):
+    """Hash of the unique points and of the shapefile size and modification time"""
+    digest = hashlib.sha256(pd.util.hash_pandas_object(points, index=False).values.tobytes())
+    stat = os.stat(shapefile)
+    digest.update(f'{os.path.abspath(shapefile)}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()
+
+
+def build_lookup(points, id_col, lon_col, lat_col, shapefile=SHAPEFILE):
+    """County of each of the unique points: one row per ID with its fips and county name (NaN outside all counties)"""
+    index = load_county_index(shapefile)
+    county = index.locate(points[lon_col].values, points[lat_col].values)
+    return pd.DataFrame({
+        id_col: points[id_col].values,
+        'fips': np.where(county >= 0, index.geoid[county], np.nan),
+        'county': np.where(county >= 0, index.name[county], np.nan),
+    })
+
+
+def load_or_build_lookup(df, id_col, lon_col, lat_col, cache_file, shapefile=SHAPEFILE):
+    """
+    ID -> FIPS table for the stations in df, read from cache_file when it was built for the same stations.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Station/site list with an ID and its coordinates; the first coordinates of every ID are used
+    id_col, lon_col, lat_col : str
+        Column names of the station/site ID and of its longitude and latitude
+    cache_file : str
+        CSV the table is saved to; its hash is kept in cache_file + '.json'
+    shapefile : str
+        County boundaries with GEOID and NAME columns
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Columns id_col, fips (5-character GEOID string, NaN outside all counties) and county
+    """
+    points = unique_points(df, id_col, lon_col, lat_col)
+    key = points_hash(points, shapefile)
+    meta_file = cache_file + '.json'
+
+    if os.path.exists(cache_file) and os.path.exists(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta.get('hash') == key:
+            logging.info(f"Reusing FIPS lookup {cache_file} ({meta['stations']} stations)")
+            return pd.read_csv(cache_file, dtype={id_col: points[id_col].dtype, 'fips': str, 'county': str})
+
+    logging.info(f"Building FIPS lookup for {len(points)} stations...")
+    lookup = build_lookup(points, id_col, lon_col, lat_col, shapefile)
+    lookup.to_csv(cache_file, index=False)
+    with open(meta_file, 'w') as f:
+        json.dump({'hash': key, 'stations': len(points), 'rows': len(lookup)}, f, indent=2)
+    logging.info(f"Saved FIPS lookup to {cache_file}")
+    return lookup
+
+
+def tag_with_fips(df, lookup, id_col):
+    """Add the fips and county columns of lookup to df with a hash join on id_col, keeping the row order of df"""
+    return df.merge(lookup, on=id_col, how='left')
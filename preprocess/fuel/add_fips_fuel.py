@@ -1,28 +1,31 @@
+import os
+import sys
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fips_lookup import load_or_build_lookup, tag_with_fips
+from storage import write_table
 
 # This script is used for adding fips to the Fuel data by lat and long
+# The county of every site is found once, with a spatial join over the site list, and cached in
+# site_fips_lookup.csv; the samples are then tagged with a join on the site ID.
 
 
 # Load your data into a DataFrame
-data = pd.read_csv("./fuel_data_with_lat_long.csv")  # Replace with your file path
-
-# Load the U.S. county boundaries shapefile
-counties = gpd.read_file("../tp/cb_2022_us_county_500k/cb_2022_us_county_500k.shp")  # Replace with your shapefile path
-
-# Convert your data to a GeoDataFrame
-geometry = [Point(xy) for xy in zip(data["Longitude"], data["Latitude"])]
-gdf = gpd.GeoDataFrame(data, geometry=geometry, crs="EPSG:4326")  # Assuming WGS84 coordinates
+data = pd.read_csv("./fuel_data_with_lat_long.csv")
 
-# Perform a spatial join to find the county for each point
-gdf = gpd.sjoin(gdf, counties, how="left", predicate="within")  # Use 'predicate' instead of 'op'
+# Find the county of every site (reused from the cache unless the site list changed)
+lookup = load_or_build_lookup(
+    data, "SiteId", "Longitude", "Latitude", cache_file="./site_fips_lookup.csv"
+)
 
-# Extract relevant columns (e.g., county name and FIPS code)
-gdf = gdf[["Sample Avg Value", "Date", "NAME", "GEOID"]]  # Adjust column names as needed
-gdf.rename(columns={"Sample Avg Value": "fmc", "Date": "date", "NAME": "county", "GEOID": "fips"}, inplace=True)
+# Tag the samples with the county name and FIPS code of their site
+data = tag_with_fips(data, lookup, "SiteId")
+data = data[["Sample Avg Value", "Date", "county", "fips"]]
+data = data.rename(columns={"Sample Avg Value": "fmc", "Date": "date"})
+data["date"] = pd.to_datetime(data["date"], format="ISO8601")
 
 
-# Save the updated DataFrame to a new CSV file
-gdf.to_csv("fips_fuel_data.csv", index=False)
-print("County and FIPS Code added successfully!")
\ No newline at end of file
+# Save the updated DataFrame to the fips_fuel_data table (see storage.py)
+output_path = write_table(data, "fips_fuel_data")
+print(f"County and FIPS Code added successfully to {output_path}!")
@@ -18,7 +18,8 @@ merged_data = pd.merge(
     how="left"  # Keep all rows from fuel data
 )
 
-merged_data = merged_data.drop(columns=["Site ID", "SiteId"])
+# Keep SiteId, add_fips_fuel.py looks up the county of each site by it
+merged_data = merged_data.drop(columns=["Site ID"])
 
 # Save the merged data to a new CSV file
 merged_data.to_csv("fuel_data_with_lat_long.csv", index=False)
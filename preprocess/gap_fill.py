@@ -0,0 +1,366 @@
+import pandas as pd
+import numpy as np
+import logging
+import os
+import glob
+import tempfile
+import schema
+import storage
+from scipy.spatial import cKDTree
+
+'''
+    Gap-filling engine shared by preprocess/tp/fill_missing_value.py, preprocess/wind/assign_missing_wind.py and
+    preprocess/fuel/fill_missing_value.py.
+
+    Every variable is held as a dense float32 (fips x day) array, all variables stacked into one
+    (column x fips x day) grid, so each step below is a vectorized pass over all columns at once:
+    - Step 1: Fill a missing day with the nearest observed day of the same FIPS (ties go to the earlier day).
+      Days before the first or after the last observation are left for the next steps, like
+      interpolate(method='nearest').
+    - Step 2: Fill what is still missing from the geographically nearest counties that have a value on the same
+      day. The neighbors come from a KD-tree over the county centroids in all_fips_code.csv.
+    - Step 3: Fill what is still missing with the mean over all FIPS on that day.
+
+    The input and output tables are read and written through storage.py (Parquet unless configured otherwise).
+'''
+
+
+def load_fips_codes(all_fips_file):
+    """Sorted unique FIPS codes of the complete FIPS list, with the lat and lon of each county centroid"""
+    all_fips_df = pd.read_csv(all_fips_file)
+    all_fips_df['fips'] = all_fips_df['fips'].astype(np.int64)
+    all_fips_df = all_fips_df.drop_duplicates('fips').sort_values('fips')
+    return all_fips_df['fips'].values, all_fips_df['lat'].values, all_fips_df['lon'].values
+
+
+def build_neighbor_index(lat, lon, k=8):
+    """
+    Positions of the k nearest counties of each county (excluding itself), closest first.
+
+    Distances are chord lengths between centroids on the unit sphere, so the order is the great-circle order.
+    """
+    lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+    xyz = np.column_stack([
+        np.cos(lat_rad) * np.cos(lon_rad),
+        np.cos(lat_rad) * np.sin(lon_rad),
+        np.sin(lat_rad),
+    ])
+    k = min(k, len(xyz) - 1)
+    _, neighbors = cKDTree(xyz).query(xyz, k=k + 1)
+    return neighbors[:, 1:].astype(np.int64)
+
+
+def locate_cells(df, fips_codes, dates):
+    """
+    Row (position in fips_codes) and day (position in dates) of every row of df, and a mask of the rows that fall
+    inside the grid. Rows whose FIPS is not in fips_codes or whose date is outside dates are masked out.
+    """
+    fips = df['fips'].values.astype(np.int64)
+    rows = np.minimum(np.searchsorted(fips_codes, fips), len(fips_codes) - 1)
+    days = (df['date'].values.astype('datetime64[D]') - dates[0].to_datetime64().astype('datetime64[D]')).astype(np.int64)
+    keep = (fips_codes[rows] == fips) & (days >= 0) & (days < len(dates))
+    return rows, days, keep
+
+
+def scatter_cells(rows, days, values, n_rows, n_days):
+    """
+    (column x row x day) float32 grid from observed cells, NaN where there is no observation.
+    values is a (column x cell) array; several observations of the same cell are averaged.
+    """
+    cells = rows * n_days + days
+    grid = np.full((len(values), n_rows, n_days), np.nan, dtype=np.float32)
+    for i, column_values in enumerate(values):
+        observed = ~np.isnan(column_values)
+        sums = np.bincount(cells[observed], weights=column_values[observed], minlength=n_rows * n_days)
+        counts = np.bincount(cells[observed], minlength=n_rows * n_days)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grid[i] = (sums / counts).reshape(n_rows, n_days)
+    return grid
+
+
+def column_values(df, columns, keep=None):
+    """(column x row) float64 array of the numeric columns of df"""
+    values = np.vstack([pd.to_numeric(df[col], errors='coerce').values.astype(np.float64) for col in columns])
+    return values if keep is None else values[:, keep]
+
+
+def build_grid(df, columns, fips_codes, dates):
+    """
+    Scatter the observed rows of df into a (column x fips x day) float32 grid, NaN where there is no observation.
+
+    Rows whose FIPS is not in fips_codes or whose date is outside dates are ignored.
+    Several rows for the same FIPS and day are averaged.
+    """
+    rows, days, keep = locate_cells(df, fips_codes, dates)
+    return scatter_cells(rows[keep], days[keep], column_values(df, columns, keep), len(fips_codes), len(dates))
+
+
+def fill_nearest_in_time(grid, block_rows=256):
+    """Step 1: fill interior gaps of each (column, fips) series with the nearest observed day, in place"""
+    n_days = grid.shape[-1]
+    day_index = np.arange(n_days, dtype=np.int32)
+    for start in range(0, grid.shape[1], block_rows):
+        block = grid[:, start:start + block_rows]
+        valid = ~np.isnan(block)
+
+        # Index of the last observed day at or before each day, and of the first one at or after it
+        previous = np.where(valid, day_index, -1)
+        np.maximum.accumulate(previous, axis=-1, out=previous)
+        following = np.where(valid, day_index, n_days)
+        following = np.minimum.accumulate(following[..., ::-1], axis=-1)[..., ::-1]
+
+        interior = ~valid & (previous >= 0) & (following < n_days)
+        nearest = np.where(day_index - previous <= following - day_index, previous, following)
+        np.clip(nearest, 0, n_days - 1, out=nearest)
+        filled = np.take_along_axis(block, nearest, axis=-1)
+        block[interior] = filled[interior]
+    return grid
+
+
+def fill_from_neighbors(grid, neighbors, block_rows=256):
+    """
+    Step 2: fill cells still missing with the value of the nearest neighboring county (from build_neighbor_index)
+    that has a value on the same day, in place. Values are borrowed from the step 1 result, never from cells filled
+    by this step.
+    """
+    source = grid.copy()
+    for start in range(0, grid.shape[1], block_rows):
+        block = grid[:, start:start + block_rows]
+        for j in range(neighbors.shape[1]):
+            missing = np.isnan(block)
+            if not missing.any():
+                break
+            borrowed = source[:, neighbors[start:start + block_rows, j]]
+            block[missing] = borrowed[missing]
+    return grid
+
+
+def accumulate_daily_sums(grid, sums, counts):
+    """
+    Add the per-day sum and count of the non-missing values of every column of grid to sums and counts
+    (column x day, float64 and int64), in place. Rows are added one at a time in order, so accumulating a grid
+    block by block gives exactly the same sums as accumulating it at once.
+    """
+    for r in range(grid.shape[1]):
+        row = grid[:, r, :]
+        observed = ~np.isnan(row)
+        sums += np.where(observed, row, 0)
+        counts += observed
+    return sums, counts
+
+
+def daily_mean_from_sums(sums, counts):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Days without any value stay NaN
+        return (sums / counts).astype(np.float32)
+
+
+def fill_with_daily_mean(grid, daily_mean=None):
+    """
+    Step 3: fill cells still missing with the mean of that column over all FIPS on the same day, in place.
+    daily_mean (column x day) can be given when grid is only a block of FIPS.
+    """
+    if daily_mean is None:
+        sums = np.zeros((grid.shape[0], grid.shape[2]), dtype=np.float64)
+        counts = np.zeros((grid.shape[0], grid.shape[2]), dtype=np.int64)
+        daily_mean = daily_mean_from_sums(*accumulate_daily_sums(grid, sums, counts))
+    missing = np.isnan(grid)
+    grid[missing] = np.broadcast_to(daily_mean[:, np.newaxis, :], grid.shape)[missing]
+    return grid
+
+
+def grid_to_frame(grid, columns, fips_codes, dates):
+    """Long (fips, date, columns...) DataFrame sorted by fips and date"""
+    data = {
+        'fips': np.repeat(fips_codes.astype(schema.FIPS_DTYPE), len(dates)),
+        'date': np.tile(dates.values, len(fips_codes)),
+    }
+    for i, col in enumerate(columns):
+        data[col] = grid[i].ravel()
+    return pd.DataFrame(data)
+
+
+def log_missing(grid, columns, step):
+    for i, col in enumerate(columns):
+        logging.info(f"Missing values for {col} {step}: {np.isnan(grid[i]).sum()}")
+
+
+def fill_grid(grid, columns, neighbors):
+    """Run steps 1-3 on a grid in place"""
+    log_missing(grid, columns, "before filling")
+
+    logging.info("Step 1: Filling missing values within same FIPS...")
+    fill_nearest_in_time(grid)
+    log_missing(grid, columns, "after step 1")
+
+    logging.info("Step 2: Filling remaining missing values using neighboring counties...")
+    fill_from_neighbors(grid, neighbors)
+    log_missing(grid, columns, "after step 2")
+
+    logging.info("Step 3: Filling remaining missing values with daily means...")
+    fill_with_daily_mean(grid)
+    log_missing(grid, columns, "after step 3")
+    return grid
+
+
+def fill_missing_values(input_file, output_file, columns, all_fips_file='../all_fips_code.csv',
+                        start_date='1992-01-01', end_date='2020-12-31', prepare=None, n_neighbors=8,
+                        csv_export=None):
+    """
+    Build the complete (fips x day) dataset of `columns` from input_file and save it to output_file.
+
+    Parameters:
+    -----------
+    input_file : str
+        Table (see storage.py) with fips, date and the columns to fill
+    output_file : str
+        Table to save the filled data to (fips, date, columns...)
+    columns : list of str
+        Numeric columns to fill
+    all_fips_file : str
+        CSV with the complete list of FIPS codes
+    start_date, end_date : str
+        Date range of the output, in 'YYYY-MM-DD' format
+    prepare : callable, optional
+        Function applied to the loaded DataFrame before filling, for dataset-specific cleaning
+    n_neighbors : int
+        Number of nearest counties tried, closest first, in step 2
+    csv_export : bool, optional
+        Also save output_file as CSV (storage.write_table())
+    """
+    # Read the complete list of FIPS codes
+    logging.info("Loading complete FIPS code list...")
+    fips_codes, lat, lon = load_fips_codes(all_fips_file)
+    neighbors = build_neighbor_index(lat, lon, k=n_neighbors)
+    logging.info(f"Loaded {len(fips_codes)} FIPS codes")
+
+    logging.info(f"Loading data from {input_file}...")
+    df = storage.read_table(input_file)
+    if prepare is not None:
+        df = prepare(df)
+    df = df.dropna(subset=['fips'])
+    logging.info(f"Loaded {len(df)} data points")
+    schema.report_memory(df, f"load {input_file}")
+
+    dates = pd.date_range(start=start_date, end=end_date)
+    logging.info(f"Created date range from {dates[0]} to {dates[-1]}")
+
+    logging.info("Building (fips x day) grid...")
+    grid = build_grid(df, columns, fips_codes, dates)
+    del df
+    logging.info(f"Total combinations: {grid[0].size}")
+
+    fill_grid(grid, columns, neighbors)
+
+    logging.info("Saving results...")
+    filled_df = grid_to_frame(grid, columns, fips_codes, dates)
+    schema.report_memory(filled_df, "filled output")
+    output_path = storage.write_table(filled_df, output_file, csv_export=csv_export)
+    logging.info(f"Data saved to '{output_path}' ({len(filled_df)} records, {len(dates)} days per FIPS)")
+    return filled_df
+
+
+def _partition_input(input_file, columns, fips_codes, dates, block_size, tmp_dir, chunksize, prepare):
+    """Stream input_file once and write the observed cells of each block of FIPS to its own files"""
+    n_rows = 0
+    for chunk_id, chunk in enumerate(storage.iter_table(input_file, chunksize=chunksize)):
+        if prepare is not None:
+            chunk = prepare(chunk)
+        chunk = chunk.dropna(subset=['fips'])
+        n_rows += len(chunk)
+
+        rows, days, keep = locate_cells(chunk, fips_codes, dates)
+        rows, days, values = rows[keep], days[keep], column_values(chunk, columns, keep)
+        blocks = rows // block_size
+        for block_id in np.unique(blocks):
+            in_block = blocks == block_id
+            np.savez(
+                os.path.join(tmp_dir, f'raw_{block_id}_{chunk_id}.npz'),
+                rows=rows[in_block], days=days[in_block], values=values[:, in_block]
+            )
+        logging.info(f"Partitioned chunk {chunk_id + 1} ({n_rows} rows so far)")
+    return n_rows
+
+
+def _load_raw_rows(tmp_dir, wanted_rows, block_size, n_columns):
+    """Observed cells of wanted_rows (sorted global row positions), read from the files of their blocks"""
+    parts_rows, parts_days, parts_values = [], [], []
+    for block_id in np.unique(wanted_rows // block_size):
+        for path in glob.glob(os.path.join(tmp_dir, f'raw_{block_id}_*.npz')):
+            with np.load(path) as part:
+                keep = np.isin(part['rows'], wanted_rows)
+                parts_rows.append(part['rows'][keep])
+                parts_days.append(part['days'][keep])
+                parts_values.append(part['values'][:, keep])
+    if not parts_rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty((n_columns, 0))
+    return np.concatenate(parts_rows), np.concatenate(parts_days), np.concatenate(parts_values, axis=1)
+
+
+def fill_missing_values_partitioned(input_file, output_file, columns, all_fips_file='../all_fips_code.csv',
+                                    start_date='1992-01-01', end_date='2020-12-31', prepare=None, n_neighbors=8,
+                                    block_size=256, chunksize=1_000_000, tmp_dir=None, csv_export=None):
+    """
+    Same result as fill_missing_values, computed block by block of `block_size` FIPS so that peak memory is set
+    by the block size instead of the whole (fips x day) grid.
+
+    - Pass 1 streams input_file in chunks and writes the observed cells of each FIPS block to temporary files.
+    - Pass 2 runs steps 1-2 for each block, loading the block plus the neighboring counties it borrows from, saves
+      the block and adds its values to per-day sums and counts.
+    - Pass 3 fills the remaining cells of each block with the daily means and appends the block to output_file.
+    """
+    logging.info("Loading complete FIPS code list...")
+    fips_codes, lat, lon = load_fips_codes(all_fips_file)
+    neighbors = build_neighbor_index(lat, lon, k=n_neighbors)
+    dates = pd.date_range(start=start_date, end=end_date)
+    n_blocks = -(-len(fips_codes) // block_size)
+    logging.info(f"{len(fips_codes)} FIPS codes x {len(dates)} days in {n_blocks} blocks of {block_size} FIPS")
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as work_dir, \
+            storage.TableWriter(output_file, csv_export=csv_export) as writer:
+        logging.info(f"Pass 1: Partitioning {input_file} by FIPS block...")
+        n_input = _partition_input(input_file, columns, fips_codes, dates, block_size, work_dir, chunksize, prepare)
+        logging.info(f"Loaded {n_input} data points")
+
+        logging.info("Pass 2: Filling each block within same FIPS and from neighboring counties...")
+        sums = np.zeros((len(columns), len(dates)), dtype=np.float64)
+        counts = np.zeros((len(columns), len(dates)), dtype=np.int64)
+        for block_id in range(n_blocks):
+            block_rows = np.arange(block_id * block_size, min((block_id + 1) * block_size, len(fips_codes)))
+            block_neighbors = neighbors[block_rows]
+            # The block first, then the neighboring counties it borrows from
+            local_rows = np.concatenate([block_rows, np.setdiff1d(block_neighbors, block_rows)])
+            order = np.argsort(local_rows)
+
+            rows, days, values = _load_raw_rows(work_dir, np.sort(local_rows), block_size, len(columns))
+            local_index = order[np.searchsorted(local_rows[order], rows)]
+            grid = scatter_cells(local_index, days, values, len(local_rows), len(dates))
+
+            fill_nearest_in_time(grid)
+            local_neighbors = order[np.searchsorted(local_rows[order], block_neighbors)]
+            # Only the block rows are filled; the neighbors only lend their step 1 values
+            source = grid.copy()
+            block = grid[:, :len(block_rows)]
+            for j in range(local_neighbors.shape[1]):
+                missing = np.isnan(block)
+                if not missing.any():
+                    break
+                block[missing] = source[:, local_neighbors[:, j]][missing]
+            del source
+
+            accumulate_daily_sums(block, sums, counts)
+            np.save(os.path.join(work_dir, f'filled_{block_id}.npy'), block)
+            logging.info(f"Filled block {block_id + 1}/{n_blocks} ({len(local_rows) - len(block_rows)} neighbor FIPS loaded)")
+
+        logging.info("Pass 3: Filling remaining missing values with daily means and saving results...")
+        daily_mean = daily_mean_from_sums(sums, counts)
+        n_records = 0
+        for block_id in range(n_blocks):
+            block = np.load(os.path.join(work_dir, f'filled_{block_id}.npy'))
+            fill_with_daily_mean(block, daily_mean)
+            block_codes = fips_codes[block_id * block_size:(block_id + 1) * block_size]
+            writer.write(grid_to_frame(block, columns, block_codes, dates))
+            n_records += block.shape[1] * block.shape[2]
+            log_missing(block, columns, f"in block {block_id + 1} after step 3")
+
+    logging.info(f"Data saved to '{writer.path}' ({n_records} records, {len(dates)} days per FIPS)")
@@ -0,0 +1,110 @@
+import pandas as pd
+import numpy as np
+import logging
+
+'''
+    Compact dtype schema shared by the readers and writers of the preprocessing pipeline:
+    - fips: int32 (nullable Int32 while rows without a FIPS are still present)
+    - date: datetime64, or int32 day offsets since EPOCH for the join stages
+    - measurements (tmin, tmax, prcp, fmc, wind_speed, fire size): float32
+    - lat / lon stay float64, they are coordinates and model features, not measurements
+
+    report_memory() logs the memory used by a frame next to what pandas' default dtypes
+    (int64 / float64 / Python strings) would use for the same data.
+'''
+
+EPOCH = np.datetime64('1992-01-01', 'D')
+DATE_FORMAT = '%Y-%m-%d'
+
+FIPS_DTYPE = np.int32
+DAY_DTYPE = np.int32
+MEASUREMENT_DTYPE = np.float32
+
+MEASUREMENT_COLUMNS = ['tmin', 'tmax', 'prcp', 'fmc', 'wind_speed', 'fire_size', 'FIRE_SIZE']
+
+# Bytes per value with pandas' default dtypes: 8 for int64/float64, pointer + str object for text
+_DEFAULT_NUMERIC_BYTES = 8
+_DEFAULT_TEXT_BYTES = 8 + 59
+
+
+def to_day_offset(dates):
+    """int32 days since EPOCH of a Series/array of dates (strings or datetimes)"""
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, format='ISO8601')
+    days = np.asarray(dates).astype('datetime64[D]') - EPOCH
+    return days.astype(DAY_DTYPE)
+
+
+def from_day_offset(days):
+    """datetime64[D] array of int day offsets since EPOCH"""
+    return EPOCH + np.asarray(days).astype('timedelta64[D]')
+
+
+def to_fips(values):
+    """FIPS codes as int32, or nullable Int32 if some are missing. Accepts numbers or strings like '06037'."""
+    fips = pd.to_numeric(pd.Series(values), errors='coerce')
+    if fips.isna().any():
+        return fips.astype('Int32').values
+    return fips.values.astype(FIPS_DTYPE)
+
+
+def compact(df, dates='datetime'):
+    """
+    Convert the known columns of df to the schema dtypes.
+
+    dates: 'datetime' keeps date as datetime64, 'offset' stores int32 days since EPOCH, None leaves it as is.
+    """
+    if 'fips' in df.columns:
+        df['fips'] = to_fips(df['fips'])
+    for col in MEASUREMENT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(MEASUREMENT_DTYPE)
+    for col in ('date', 'end_date'):
+        if col in df.columns and dates is not None:
+            if dates == 'offset':
+                df[col] = to_day_offset(df[col])
+            elif not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], format='ISO8601')
+    return df
+
+
+def read_csv(path, dates='datetime', chunksize=None, **kwargs):
+    """pd.read_csv with the schema dtypes applied (per chunk if chunksize is given)"""
+    dtype = {col: MEASUREMENT_DTYPE for col in MEASUREMENT_COLUMNS}
+    dtype['fips'] = 'float64'
+    dtype.update(kwargs.pop('dtype', {}))
+    if chunksize is not None:
+        return (compact(chunk, dates) for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunksize, **kwargs))
+    return compact(pd.read_csv(path, dtype=dtype, **kwargs), dates)
+
+
+def write_csv(df, path, **kwargs):
+    """df.to_csv writing int32 day offsets in date columns back as 'YYYY-MM-DD'"""
+    out = df
+    for col in ('date', 'end_date'):
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]):
+            if out is df:
+                out = df.copy(deep=False)
+            out[col] = pd.DatetimeIndex(from_day_offset(df[col].values)).strftime(DATE_FORMAT)
+    out.to_csv(path, index=False, date_format=kwargs.pop('date_format', DATE_FORMAT), **kwargs)
+
+
+def default_memory(df):
+    """Bytes the columns of df would use when read with pandas' default dtypes"""
+    total = 0
+    for col in df.columns:
+        is_text = col in ('date', 'end_date') or not pd.api.types.is_numeric_dtype(df[col])
+        total += len(df) * (_DEFAULT_TEXT_BYTES if is_text else _DEFAULT_NUMERIC_BYTES)
+    return total
+
+
+def report_memory(df, stage):
+    """Log the memory of df with the schema dtypes vs pandas' default dtypes; returns (schema_bytes, default_bytes)"""
+    schema_bytes = int(df.memory_usage(index=False, deep=True).sum())
+    default_bytes = default_memory(df)
+    saved = 1 - schema_bytes / default_bytes if default_bytes else 0
+    logging.info(
+        f"[{stage}] {len(df)} rows: {schema_bytes / 1024 ** 2:.1f} MiB with compact dtypes vs "
+        f"{default_bytes / 1024 ** 2:.1f} MiB with default dtypes ({saved:.0%} saved)"
+    )
+    return schema_bytes, default_bytes
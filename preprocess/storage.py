@@ -0,0 +1,296 @@
+import logging
+import os
+import pandas as pd
+
+import schema
+
+'''
+    Storage layer for the tables handed from one pipeline stage to the next.
+
+    The stages name their tables without an extension (e.g. 'fips_tp_no_na_averaged') and the format decides it:
+    - parquet (default): columnar and compressed, keeps the schema dtypes (int32 fips, float32 measurements,
+      dates as timestamps), so the next stage reads it without parsing text or dates
+    - feather: Arrow IPC (lz4 compressed), memory-mapped on read, the fastest to read and write
+    - csv: the previous plain-text tables
+
+    The format is set with the PIPELINE_TABLE_FORMAT environment variable (run_pipeline.py passes it on to every
+    stage). A CSV copy of a table is only written when asked for, with csv_export=True or PIPELINE_CSV_EXPORT=1,
+    e.g. for the files read outside the pipeline. A path with an extension always uses the format of its extension.
+
+    read_table() falls back to the table in another format when there is none in the default one, so the CSV
+    files of earlier runs can still be read. Tables read back go through schema.compact(), like schema.read_csv().
+    Its filters are pushed down to Parquet, which skips the row groups whose min/max statistics rule them out.
+'''
+
+FORMATS = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+DEFAULT_FORMAT = 'parquet'
+
+FORMAT_ENV = 'PIPELINE_TABLE_FORMAT'
+CSV_EXPORT_ENV = 'PIPELINE_CSV_EXPORT'
+
+DATE_COLUMNS = ('date', 'end_date')
+
+
+def default_format():
+    """Table format of the pipeline, from PIPELINE_TABLE_FORMAT (parquet when not set)"""
+    fmt = os.environ.get(FORMAT_ENV, DEFAULT_FORMAT).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"{FORMAT_ENV} must be one of {list(FORMATS)}, got {fmt!r}")
+    return fmt
+
+
+def csv_export_enabled():
+    return os.environ.get(CSV_EXPORT_ENV, '').lower() in ('1', 'true', 'yes')
+
+
+def split_format(path, fmt=None):
+    """(path without extension, format) of a table path; the extension of path wins over fmt"""
+    base, ext = os.path.splitext(path)
+    for name, extension in FORMATS.items():
+        if ext == extension:
+            return base, name
+    return path, fmt or default_format()
+
+
+def table_path(path, fmt=None):
+    """File of the table `path` in format fmt (the default format when not given)"""
+    base, fmt = split_format(path, fmt)
+    return base + FORMATS[fmt]
+
+
+def find_table(path, fmt=None):
+    """(file, format) of the table `path`: the file in the wanted format, else the first existing other format"""
+    base, fmt = split_format(path, fmt)
+    wanted = base + FORMATS[fmt]
+    if os.path.exists(wanted) or os.path.splitext(path)[1] in FORMATS.values():
+        return wanted, fmt
+    for other, extension in FORMATS.items():
+        if os.path.exists(base + extension):
+            logging.info(f"No {wanted}, reading the {other} table {base + extension}")
+            return base + extension, other
+    raise FileNotFoundError(f"No table {base} in any of the formats {list(FORMATS)}")
+
+
+def _typed_dates(df):
+    """df with int day offset date columns as datetime64, so the file holds real dates"""
+    out = df
+    for col in DATE_COLUMNS:
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]):
+            if out is df:
+                out = df.copy(deep=False)
+            out[col] = schema.from_day_offset(df[col].values)
+    return out
+
+
+def _to_arrow(df, arrow_schema=None):
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(_typed_dates(df), schema=arrow_schema, preserve_index=False)
+
+
+def _apply_dates(df, dates):
+    """Date columns as datetime64 ('datetime') or int32 day offsets ('offset'); None leaves them as stored"""
+    for col in DATE_COLUMNS:
+        if col not in df.columns or dates is None:
+            continue
+        if dates == 'offset':
+            df[col] = schema.to_day_offset(df[col])
+        elif not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format='ISO8601')
+    return df
+
+
+def _from_arrow(table, dates, compact):
+    df = table.to_pandas()
+    if compact:
+        return schema.compact(df, dates)
+    return _apply_dates(df, dates)
+
+
+def _filter_arrow(table, filters, columns):
+    """Rows of an Arrow table matching the pyarrow filters, then only `columns`"""
+    import pyarrow.parquet as pq
+
+    table = table.filter(pq.filters_to_expression(filters))
+    return table.select(columns) if columns is not None else table
+
+
+def _read_columns(columns, filters):
+    """Columns to read from disk to apply filters, None for all"""
+    if columns is None or not filters:
+        return columns
+    filtered = [f[0] for group in (filters if isinstance(filters[0], list) else [filters]) for f in group]
+    return list(columns) + [col for col in dict.fromkeys(filtered) if col not in columns]
+
+
+def _read_csv(path, columns, dates, compact, chunksize=None):
+    if compact:
+        return schema.read_csv(path, dates=dates, usecols=columns, chunksize=chunksize)
+    if chunksize is not None:
+        return (_apply_dates(chunk, dates) for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize))
+    return _apply_dates(pd.read_csv(path, usecols=columns), dates)
+
+
+def write_table(df, path, fmt=None, csv_export=None):
+    """
+    Save df as the table `path`.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Table to save; the index is not saved
+    path : str
+        Table name without extension (the format decides it), or a file name whose extension sets the format
+    fmt : str, optional
+        'parquet', 'feather' or 'csv'; PIPELINE_TABLE_FORMAT when not given
+    csv_export : bool, optional
+        Also write a CSV copy next to the table; PIPELINE_CSV_EXPORT when not given
+
+    Returns:
+    --------
+    str
+        Path of the file written in the table format
+    """
+    with TableWriter(path, fmt, csv_export) as writer:
+        writer.write(df)
+    return writer.path
+
+
+def read_table(path, columns=None, dates='datetime', fmt=None, compact=True, filters=None):
+    """
+    Load the table `path` (see find_table()) as a DataFrame.
+
+    Parameters:
+    -----------
+    columns : list of str, optional
+        Columns to load; the binary formats only read those from disk
+    dates : str
+        'datetime', 'offset' (int32 days since schema.EPOCH) or None, as in schema.compact()
+    compact : bool
+        Convert the known columns to the schema dtypes; False keeps the stored dtypes (float64 measurements
+        stay float64) and only converts the dates
+    filters : list, optional
+        Rows to keep, in the pyarrow filters form, e.g. [('date', '>=', pd.Timestamp('2018-01-01')),
+        ('fips', 'in', [6037])]; dates are compared as timestamps. Parquet only reads the row groups that can
+        match, the other formats are read whole and then filtered
+    """
+    file, fmt = find_table(path, fmt)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        return _from_arrow(pq.read_table(file, columns=columns, filters=filters), dates, compact)
+    if not filters:
+        if fmt == 'csv':
+            return _read_csv(file, columns, dates, compact)
+        import pyarrow.feather as feather
+
+        return _from_arrow(feather.read_table(file, columns=columns, memory_map=True), dates, compact)
+
+    import pyarrow as pa
+    read_columns = _read_columns(columns, filters)
+    if fmt == 'csv':
+        table = pa.Table.from_pandas(_read_csv(file, read_columns, 'datetime', False), preserve_index=False)
+    else:
+        import pyarrow.feather as feather
+
+        table = feather.read_table(file, columns=read_columns, memory_map=True)
+    return _from_arrow(_filter_arrow(table, filters, columns), dates, compact)
+
+
+def iter_table(path, chunksize=1_000_000, columns=None, dates='datetime', fmt=None, compact=True):
+    """Yield the table `path` as DataFrames of up to chunksize rows, with the same options as read_table()"""
+    file, fmt = find_table(path, fmt)
+    if fmt == 'csv':
+        yield from _read_csv(file, columns, dates, compact, chunksize=chunksize)
+        return
+
+    import pyarrow as pa
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(file).iter_batches(batch_size=chunksize, columns=columns)
+    else:
+        import pyarrow.feather as feather
+
+        batches = feather.read_table(file, columns=columns, memory_map=True).to_batches(max_chunksize=chunksize)
+    for batch in batches:
+        yield _from_arrow(pa.Table.from_batches([batch]), dates, compact)
+
+
+class TableWriter:
+    """
+    Appends DataFrames to the table `path`, for stages that write their output one chunk at a time.
+
+    Parquet chunks become row groups (split in row groups of row_group_size rows when given) and feather chunks
+    record batches of one file; every chunk must have the columns of the first one and is cast to its types. The
+    file is written under a temporary name and only replaces `path` when the writer is closed without an error.
+    """
+
+    def __init__(self, path, fmt=None, csv_export=None, row_group_size=None):
+        self.path = table_path(path, fmt)
+        self.fmt = split_format(path, fmt)[1]
+        export = csv_export_enabled() if csv_export is None else csv_export
+        self.csv_path = table_path(path, 'csv') if export and self.fmt != 'csv' else None
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._first = True
+
+    def _tmp(self, path):
+        return path + '.tmp'
+
+    def write(self, df):
+        if self.fmt == 'csv':
+            schema.write_csv(df, self._tmp(self.path), mode='w' if self._first else 'a', header=self._first)
+        else:
+            table = _to_arrow(df, self._schema)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = self._open(table.schema)
+            if self.fmt == 'parquet':
+                self._writer.write_table(table, row_group_size=self.row_group_size)
+            else:
+                self._writer.write_table(table)
+        if self.csv_path is not None:
+            schema.write_csv(df, self._tmp(self.csv_path), mode='w' if self._first else 'a', header=self._first)
+        self._first = False
+        self.rows += len(df)
+
+    def _open(self, arrow_schema):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.fmt == 'parquet':
+            return pq.ParquetWriter(self._tmp(self.path), arrow_schema)
+        return pa.ipc.new_file(self._tmp(self.path), arrow_schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+
+    def _outputs(self):
+        return [self.path] + ([self.csv_path] if self.csv_path else [])
+
+    def close(self):
+        """Finish the file and move it in place; nothing is written when no chunk was"""
+        if self._writer is not None:
+            self._writer.close()
+        if self._first:
+            logging.warning(f"No rows to write to {self.path}")
+            return
+        for path in self._outputs():
+            os.replace(self._tmp(path), path)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        for path in self._outputs():
+            if os.path.exists(self._tmp(path)):
+                os.remove(self._tmp(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
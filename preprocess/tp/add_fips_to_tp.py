@@ -1,26 +1,28 @@
+import os
+import sys
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
 
-# This script is used for adding fips to the TP data by lat and long
-
-# Load your data into a DataFrame
-data = pd.read_csv("./lat_long_tp_data.csv")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fips_lookup import load_or_build_lookup, tag_with_fips
+from storage import TableWriter, iter_table
 
-# Load the U.S. county boundaries shapefile
-counties = gpd.read_file("./cb_2022_us_county_500k/cb_2022_us_county_500k.shp")
+# This script is used for adding fips to the TP data by lat and long
+# The county of every station is found once, with a spatial join over the station list, and cached in
+# station_fips_lookup.csv; the daily rows are then tagged with a join on the station ID, one chunk at a time.
 
-# Convert your data to a GeoDataFrame
-geometry = [Point(xy) for xy in zip(data["longitude"], data["latitude"])]
-gdf = gpd.GeoDataFrame(data, geometry=geometry, crs="EPSG:4326") 
+# Find the county of every station (reused from the cache unless the station list changed)
+stations = pd.read_csv("../../datasets/tp/filtered_us_stations.csv")
+lookup = load_or_build_lookup(
+    stations, "station", "longitude", "latitude", cache_file="./station_fips_lookup.csv"
+)[["station", "fips"]]
 
-# Perform a spatial join to find the county for each point
-gdf = gpd.sjoin(gdf, counties, how="left", predicate="within") 
+# Tag the daily TP data with the FIPS of its station
+with TableWriter("fips_tp_data") as writer:
+    columns = ["station", "date", "tmin", "prcp", "tmax"]
+    for chunk in iter_table("./lat_long_tp_data", chunksize=5_000_000, columns=columns):
+        tagged = tag_with_fips(chunk, lookup, "station")[["date", "tmin", "prcp", "tmax", "fips"]]
 
-# Extract relevant columns (e.g., county name and FIPS code)
-gdf = gdf[["date", "tmin", "prcp", "tmax", "GEOID"]]
-gdf.rename(columns={"GEOID": "fips"}, inplace=True)
+        # Append the chunk to the output table
+        writer.write(tagged)
 
-# Save the updated DataFrame to a new CSV file
-gdf.to_csv("fips_tp_data.csv", index=False)
-print("County and FIPS Code added successfully!")
\ No newline at end of file
+print("County and FIPS Code added successfully!")
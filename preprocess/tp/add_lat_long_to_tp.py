@@ -1,21 +1,30 @@
+import os
+import sys
 import pandas as pd
 
-# This script is used for extracting and adding lat and long from the station data to the TP data 
+from filter_us_tp import read_partitions
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from storage import TableWriter
+
+# This script is used for extracting and adding lat and long from the station data to the TP data
+# The TP data is the partitioned dataset written by filter_us_tp.py (one file per year), merged one year at a time
+# and appended to the lat_long_tp_data table (see storage.py)
 
 # Load the station data into a DataFrame
-station_data = pd.read_csv("../../datasets/tp/filtered_us_stations.csv") 
+station_data = pd.read_csv("../../datasets/tp/filtered_us_stations.csv")
+station_data = station_data[["station", "latitude", "longitude", "elevation", "state", "name"]]
 
-# Load the TP data into a DataFrame
-tp_data = pd.read_csv("../tp/filtered_us_tp.csv")
+with TableWriter("lat_long_tp_data") as writer:
+    for year, tp_data in read_partitions("../tp/filtered_us_tp"):
+        # Merge the two datasets on the 'station' column
+        merged_data = pd.merge(tp_data, station_data, how="left", on="station")
+        merged_data["date"] = pd.to_datetime(merged_data["date"], format="%Y-%m-%d")
 
-# Merge the two datasets on the 'station' column
-merged_data = pd.merge(
-    tp_data,
-    station_data[["station", "latitude", "longitude", "elevation", "state", "name"]],
-    how="left",
-    on="station"
-)
+        # Append the merged year to the output table
+        writer.write(merged_data)
+        print(f"{year}: {len(merged_data)} rows merged")
 
-# Save the merged data to a new CSV file
-merged_data.to_csv("lat_long_tp_data.csv", index=False)
-print("Data merged successfully!")
\ No newline at end of file
+if writer.rows == 0:
+    raise SystemExit("No partitions found in ../tp/filtered_us_tp, run filter_us_tp.py first")
+print(f"Data merged successfully to {writer.path}!")
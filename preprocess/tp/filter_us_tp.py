@@ -1,58 +1,183 @@
+import argparse
+import glob
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 
-
-# This script is used for extracting station, date, tmin (Min temperature), prcp (Precipitaion), and tmax (Max temperature) from weather data csv files
-
-
-# Adjust file names accordingly
-input_file = '../../datasets/tp/2019.csv'
-output_file = '../../preprocess/tp/filtered_us_tp_2019.csv'
-
-# Read the CSV file with only relevant columns
-df = pd.read_csv(input_file, header=None, usecols=[0, 1, 2, 3], names=['station', 'date', 'type', 'value'])
-
-# Filter rows where the station code starts with 'US' and type is 'PRCP', 'TMAX', 'TMIN'
-filtered_df = df[
-    (df['station'].str.startswith('US')) &
-    (df['type'].isin(['PRCP', 'TMAX', 'TMIN']))
-]
-
-# Pivot table to merge rows with the same station and date
-merged_df = filtered_df.pivot(index=['station', 'date'], columns='type', values='value').reset_index()
-
-# Convert 'date' column to datetime format and then to 'YYYY-MM-DD' string format
-merged_df['date'] = pd.to_datetime(merged_df['date'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
-
-# Reorder and keep only the desired columns
-merged_df = merged_df[['station', 'date', 'TMIN', 'PRCP', 'TMAX']]
-
-# Rename columns
-merged_df = merged_df.rename(columns={'TMIN': 'tmin', 'PRCP': 'prcp', 'TMAX': 'tmax'})
-
-# Remove rows with NaN values in 'tmin', 'prcp', or 'tmax'
-merged_df = merged_df.dropna(subset=['tmin', 'prcp', 'tmax'])
-
-# Step 1: Filter rows where 'tmin' or 'tmax' are outside the range -900 to 1000
-valid_range = (-900, 1000)
-merged_df = merged_df[
-    (merged_df['tmin'].between(*valid_range)) &
-    (merged_df['tmax'].between(*valid_range))
-]
-
-# Step 2: Convert 'tmin' and 'tmax' to normal Celsius by dividing by 10
-merged_df['tmin'] = merged_df['tmin'] / 10
-merged_df['tmax'] = merged_df['tmax'] / 10
-
-# Step 3: Filter rows where 'prcp' is outside the range -100 to 1000
-temp_valid_range = (-70, 60)
-prcp_valid_range = (0, 1500)
-merged_df = merged_df[
-    (merged_df['tmin'].between(*temp_valid_range)) &
-    (merged_df['tmax'].between(*temp_valid_range)) &
-    (merged_df['prcp'].between(*prcp_valid_range))
-]
-
-# Export the merged data to a new CSV file
-merged_df.to_csv(output_file, index=False)
-
-print(f'Merged records exported to {output_file}')
\ No newline at end of file
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+'''
+    This script is used for extracting station, date, tmin (Min temperature), prcp (Precipitaion), and tmax (Max temperature)
+    from the GHCN-Daily by_year weather data csv files (plain or .csv.gz), for all years in one run.
+
+    Every year file is read in chunks of --chunksize rows. Each chunk is filtered right away to US stations and
+    PRCP/TMAX/TMIN, then pivoted to one row per station and date. Rows that already have all three elements are
+    cleaned in the chunk; the few that are split across chunks are combined at the end of the year. Years run in a
+    process pool and each one is written to its own partition of the output dataset:
+
+        <output-dir>/filtered_us_tp_<year>.csv
+
+    Example: python filter_us_tp.py --start-year 1992 --end-year 2020 --workers 4
+'''
+
+ELEMENTS = ['TMIN', 'PRCP', 'TMAX']
+OUTPUT_COLUMNS = ['station', 'date', 'tmin', 'prcp', 'tmax']
+PARTITION_PATTERN = 'filtered_us_tp_{year}.csv'
+
+# Raw values are tenths of a degree; the temperature range is checked again in degrees after the conversion
+RAW_TEMP_RANGE = (-900, 1000)
+TEMP_RANGE = (-70, 60)
+PRCP_RANGE = (0, 1500)
+
+
+def find_year_file(input_dir, year):
+    """Path of <year>.csv or <year>.csv.gz in input_dir, or None if neither exists"""
+    for name in (f'{year}.csv', f'{year}.csv.gz'):
+        path = os.path.join(input_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def pivot_chunk(chunk):
+    """Keep US stations and the PRCP/TMAX/TMIN elements, then pivot to one row per (station, date)"""
+    chunk = chunk[chunk['station'].str.startswith('US') & chunk['type'].isin(ELEMENTS)]
+    wide = chunk.pivot_table(index=['station', 'date'], columns='type', values='value', aggfunc='first')
+    return wide.reindex(columns=ELEMENTS)
+
+
+def clean(wide):
+    """Drop rows missing an element or out of range, convert temperatures to Celsius, and name the columns"""
+    wide = wide.dropna(subset=ELEMENTS)
+    wide = wide[wide['TMIN'].between(*RAW_TEMP_RANGE) & wide['TMAX'].between(*RAW_TEMP_RANGE)]
+    df = wide.reset_index().rename(columns={'TMIN': 'tmin', 'PRCP': 'prcp', 'TMAX': 'tmax'})
+    df['tmin'] = df['tmin'] / 10
+    df['tmax'] = df['tmax'] / 10
+    df = df[
+        (df['tmin'].between(*TEMP_RANGE)) &
+        (df['tmax'].between(*TEMP_RANGE)) &
+        (df['prcp'].between(*PRCP_RANGE))
+    ]
+    return df[OUTPUT_COLUMNS]
+
+
+def filter_year(input_file, output_file, chunksize=5_000_000):
+    """
+    Filter one GHCN-Daily year file to US stations with tmin, prcp and tmax, streaming it in chunks.
+
+    Parameters:
+    -----------
+    input_file : str
+        Year file with rows station,date(YYYYMMDD),element,value,... (plain or gzip compressed)
+    output_file : str
+        Partition to write, sorted by station and date
+    chunksize : int
+        Number of raw rows read at a time
+
+    Returns:
+    --------
+    dict
+        Raw rows read, rows written and seconds taken
+    """
+    start = time.perf_counter()
+    complete, partial = [], []
+    raw_rows = 0
+    reader = pd.read_csv(
+        input_file, header=None, usecols=[0, 1, 2, 3], names=['station', 'date', 'type', 'value'],
+        dtype={'station': str, 'date': str, 'type': str, 'value': 'float64'}, chunksize=chunksize
+    )
+    for chunk in reader:
+        raw_rows += len(chunk)
+        wide = pivot_chunk(chunk)
+        has_all = wide.notna().all(axis=1)
+        complete.append(clean(wide[has_all]))
+        partial.append(wide[~has_all])
+
+    # A station and date whose elements fell into different chunks is complete once its chunks are combined
+    partial = pd.concat(partial)
+    if partial.index.has_duplicates:
+        partial = partial.groupby(level=['station', 'date']).first()
+    complete.append(clean(partial))
+
+    df = pd.concat(complete, ignore_index=True).sort_values(['station', 'date'], kind='stable')
+    df['date'] = pd.to_datetime(df['date'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
+
+    # Write next to the partition and rename, so an interrupted run never leaves a truncated partition behind
+    tmp_file = output_file + '.tmp'
+    df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, output_file)
+    return {'raw_rows': raw_rows, 'rows': len(df), 'seconds': time.perf_counter() - start}
+
+
+def filter_years(years, input_dir, output_dir, workers=None, chunksize=5_000_000, overwrite=False):
+    """
+    Run filter_year for every year with an input file, in a process pool, into the partitioned output_dir.
+
+    Every year runs to the end even if another one fails; then a RuntimeError lists the failed years, so a
+    caller (or the pipeline runner, through the exit code) never goes on with years missing from the dataset.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = {}
+    for year in years:
+        input_file = find_year_file(input_dir, year)
+        output_file = os.path.join(output_dir, PARTITION_PATTERN.format(year=year))
+        if input_file is None:
+            logging.warning(f"No {year}.csv or {year}.csv.gz in {input_dir}, skipping {year}")
+        elif os.path.exists(output_file) and not overwrite:
+            logging.info(f"{output_file} already exists, skipping {year} (use --overwrite to redo it)")
+        else:
+            jobs[year] = (input_file, output_file)
+
+    results = {}
+    failed = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(filter_year, input_file, output_file, chunksize): year
+            for year, (input_file, output_file) in jobs.items()
+        }
+        for future in as_completed(futures):
+            year = futures[future]
+            try:
+                results[year] = future.result()
+            except Exception as e:
+                logging.error(f"Filtering {year} failed: {e}")
+                failed[year] = e
+                continue
+            logging.info(
+                f"{year}: {results[year]['raw_rows']} raw rows -> {results[year]['rows']} rows "
+                f"in {results[year]['seconds']:.1f}s"
+            )
+    if failed:
+        raise RuntimeError(f"Filtering failed for {len(failed)} of {len(jobs)} years: "
+                           + ', '.join(f"{year} ({failed[year]})" for year in sorted(failed)))
+    return results
+
+
+def read_partitions(output_dir):
+    """Yield (year, DataFrame) for every partition written by filter_years, in year order"""
+    for path in sorted(glob.glob(os.path.join(output_dir, PARTITION_PATTERN.format(year='*')))):
+        year = int(os.path.basename(path)[len('filtered_us_tp_'):-len('.csv')])
+        yield year, pd.read_csv(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filter GHCN-Daily year files to US tmin, prcp and tmax")
+    parser.add_argument('--start-year', type=int, default=1992)
+    parser.add_argument('--end-year', type=int, default=2020)
+    parser.add_argument('--input-dir', default='../../datasets/tp')
+    parser.add_argument('--output-dir', default='../../preprocess/tp/filtered_us_tp')
+    parser.add_argument('--workers', type=int, default=None, help="Processes to use (default: number of CPUs)")
+    parser.add_argument('--chunksize', type=int, default=5_000_000, help="Raw rows read at a time per year")
+    parser.add_argument('--overwrite', action='store_true', help="Redo years whose partition already exists")
+    args = parser.parse_args()
+
+    try:
+        results = filter_years(
+            range(args.start_year, args.end_year + 1), args.input_dir, args.output_dir,
+            workers=args.workers, chunksize=args.chunksize, overwrite=args.overwrite
+        )
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    print(f'Filtered {len(results)} years into {args.output_dir}')
@@ -1,6 +1,11 @@
-import pandas as pd
+import os
+import sys
 import logging
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import schema
+import storage
+
 ''' 
     This script is used for:
     - Calculate average for rows with same FIPS and date.
@@ -13,7 +18,8 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # Load the CSV file
 logging.info("Loading data...")
-df = pd.read_csv('./fips_tp_data.csv')
+df = storage.read_table('./fips_tp_data', dates='offset')
+schema.report_memory(df, 'load ./fips_tp_data')
 initial_rows = len(df)
 logging.info(f"Initial number of rows: {initial_rows}")
 
@@ -63,5 +69,5 @@ logging.info(f"Remaining rows: {len(filtered_df)}")
 
 # Save the filtered DataFrame
 logging.info("\nSaving filtered data...")
-filtered_df.to_csv('fips_tp_no_na_averaged.csv', index=False)
-logging.info("Filtered data saved to 'fips_tp_no_na_averaged.csv'")
+output_path = storage.write_table(filtered_df, 'fips_tp_no_na_averaged')
+logging.info(f"Filtered data saved to '{output_path}'")
@@ -0,0 +1,280 @@
+import argparse
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+import schema
+import storage
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+'''
+    This script is used for validating the (fips, date) tables of the pipeline:
+    - rows, FIPS codes and date range
+    - days per FIPS over the expected date range (len(pd.date_range(START_DATE, END_DATE)): 10,593 days for
+      1992-01-01 to 2020-12-31, 29 years and 8 leap days), and the FIPS with missing days
+    - duplicate (fips, date) keys
+    - NaN counts per column
+    - values outside the expected range of their column (VALUE_RANGES)
+    - for the filled tables, the expected grid: every FIPS x every day, exactly once
+
+    The table is streamed in chunks with dates as int day offsets. Every (fips, date) key is mapped to a cell of a
+    boolean (fips x day) grid, so days per FIPS, missing days and duplicates come from a few vectorized numpy passes
+    instead of one mask per FIPS. The results are written as a JSON report.
+
+    Example: python validation.py --dataset tp_filled fuel_filled --report validation_report.json
+'''
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+ALL_FIPS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'all_fips_code.csv')
+START_DATE = '1992-01-01'
+END_DATE = '2020-12-31'
+
+# Expected (min, max) of each column; None leaves that side open
+VALUE_RANGES = {
+    'tmin': (-70, 60), 'tmax': (-70, 60), 'prcp': (0, None), 'fmc': (0, 500), 'wind_speed': (0, 150),
+    'fire_size': (0, None), 'FIRE_SIZE': (0, None), 'lat': (-90, 90), 'lon': (-180, 180),
+}
+
+# Pipeline tables (relative to the repository root): value columns, whether it is a filled (fips x day) grid over
+# all_fips_code.csv ('all') or over its own FIPS ('observed'), and whether (fips, date) must be unique
+DATASETS = {
+    'tp': dict(path='preprocess/tp/fips_tp_no_na_averaged', columns=['tmin', 'prcp', 'tmax'], grid=None,
+               unique=True),
+    'tp_filled': dict(path='preprocess/tp/filled_fips_tp_data', columns=['tmin', 'prcp', 'tmax'], grid='all',
+                      unique=True),
+    'wind': dict(path='preprocess/wind/fips_wind_no_na_averaged', columns=['wind_speed'], grid=None, unique=True),
+    'wind_filled': dict(path='processed_datasets/wind/filled_fips_wind_data', columns=['wind_speed'], grid='all',
+                        unique=True),
+    'fuel': dict(path='preprocess/fuel/fips_fuel_data', columns=['fmc'], grid=None, unique=False),
+    'fuel_filled': dict(path='processed_datasets/fuel/filled_fips_fuel_data', columns=['fmc'], grid='all',
+                        unique=True),
+    'wildfire_filled': dict(path='processed_datasets/wildfire/aggregated_daily_fire_size_filled',
+                            columns=['FIRE_SIZE', 'lat', 'lon'], grid='observed', unique=True),
+    'merged': dict(path='processed_datasets/merge_data/merged_data',
+                   columns=['fmc', 'tmax', 'tmin', 'prcp', 'wind_speed', 'fire_size', 'lat', 'lon'], grid=None,
+                   unique=True),
+}
+
+
+def load_fips(all_fips_file=ALL_FIPS_FILE):
+    """Sorted unique FIPS codes of all_fips_code.csv"""
+    return np.unique(schema.to_fips(pd.read_csv(all_fips_file, usecols=['fips'])['fips']))
+
+
+def observed_fips(path):
+    """Sorted unique FIPS codes of the table `path`"""
+    fips = storage.read_table(path, columns=['fips'])['fips']
+    return np.unique(fips.dropna().to_numpy(dtype=np.int64))
+
+
+def _fips_values(series):
+    """FIPS codes as float64, NaN where missing"""
+    return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def validate_table(path, columns=None, fips_codes=None, start_date=START_DATE, end_date=END_DATE, grid=False,
+                   unique=True, value_ranges=VALUE_RANGES, chunksize=1_000_000, max_listed=10):
+    """
+    Validate the (fips, date) table `path`.
+
+    Parameters:
+    -----------
+    path : str
+        Table (see storage.py) with fips and date columns
+    columns : list of str, optional
+        Value columns to check for NaN and ranges; every column but fips and date when not given
+    fips_codes : numpy.ndarray, optional
+        Expected FIPS codes; the FIPS codes of the table when not given
+    start_date, end_date : str
+        Expected date range
+    grid : bool
+        The table must hold every expected FIPS on every day, once
+    unique : bool
+        (fips, date) must be unique
+    value_ranges : dict
+        Column -> (min, max) expected values
+    chunksize : int
+        Rows read at a time
+    max_listed : int
+        FIPS codes listed by name in the summary fields
+
+    Returns:
+    --------
+    dict
+        The report; 'failed' lists the failed checks
+    """
+    if fips_codes is None:
+        fips_codes = observed_fips(path)
+    fips_codes = np.asarray(fips_codes, dtype=np.int64)
+    start = int(schema.to_day_offset(pd.Series([pd.Timestamp(start_date)]))[0])
+    n_days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+    n_fips = len(fips_codes)
+
+    # One cell per (fips, day): seen at least once, and seen more than once
+    seen = np.zeros(n_fips * n_days, dtype=bool)
+    duplicated = np.zeros(n_fips * n_days, dtype=bool)
+
+    rows = missing_fips = unknown_fips_rows = out_of_range_dates = duplicate_rows = 0
+    unknown_fips = set()
+    first_day = last_day = None
+    nan_counts, below, above, minimum, maximum = {}, {}, {}, {}, {}
+
+    read_columns = None if columns is None else ['fips', 'date'] + list(columns)
+    for chunk in storage.iter_table(path, chunksize=chunksize, columns=read_columns, dates='offset'):
+        rows += len(chunk)
+        value_columns = [col for col in chunk.columns if col not in ('fips', 'date')]
+        for col in value_columns:
+            values = chunk[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            nan_counts[col] = nan_counts.get(col, 0) + int(np.isnan(values).sum())
+            low, high = value_ranges.get(col, (None, None))
+            if low is not None:
+                below[col] = below.get(col, 0) + int((values < low).sum())
+            if high is not None:
+                above[col] = above.get(col, 0) + int((values > high).sum())
+            if not np.isnan(values).all():
+                minimum[col] = min(minimum.get(col, np.inf), float(np.nanmin(values)))
+                maximum[col] = max(maximum.get(col, -np.inf), float(np.nanmax(values)))
+
+        fips = _fips_values(chunk['fips'])
+        days = chunk['date'].to_numpy(dtype=np.int64) - start
+        has_fips = ~np.isnan(fips)
+        missing_fips += int((~has_fips).sum())
+        fips = fips[has_fips].astype(np.int64)
+        days = days[has_fips]
+        if len(days):
+            first_day = int(days.min()) if first_day is None else min(first_day, int(days.min()))
+            last_day = int(days.max()) if last_day is None else max(last_day, int(days.max()))
+
+        pos = np.searchsorted(fips_codes, fips).clip(max=max(n_fips - 1, 0))
+        known = fips_codes[pos] == fips if n_fips else np.zeros(len(fips), dtype=bool)
+        unknown_fips_rows += int((~known).sum())
+        unknown_fips.update(np.unique(fips[~known]).tolist())
+        in_range = (days >= 0) & (days < n_days)
+        out_of_range_dates += int((known & ~in_range).sum())
+
+        cells, counts = np.unique(pos[known & in_range] * n_days + days[known & in_range], return_counts=True)
+        repeated = (counts > 1) | seen[cells]
+        duplicate_rows += int((counts - 1).sum() + seen[cells].sum())
+        duplicated[cells[repeated]] = True
+        seen[cells] = True
+
+    days_per_fips = seen.reshape(n_fips, n_days).sum(axis=1)
+    missing_days = n_days - days_per_fips
+    incomplete = np.flatnonzero(missing_days > 0)
+    worst = incomplete[np.argsort(-missing_days[incomplete], kind='stable')[:max_listed]]
+
+    report = {
+        'path': path,
+        'rows': rows,
+        'fips_expected': n_fips,
+        'fips_observed': int((days_per_fips > 0).sum()) + len(unknown_fips),
+        'date_range': [
+            None if first_day is None else str(schema.from_day_offset(first_day + start)),
+            None if last_day is None else str(schema.from_day_offset(last_day + start)),
+        ],
+        'expected_days': n_days,
+        'days_per_fips': {
+            'min': int(days_per_fips.min()) if n_fips else 0,
+            'median': float(np.median(days_per_fips)) if n_fips else 0.0,
+            'max': int(days_per_fips.max()) if n_fips else 0,
+        },
+        'fips_with_missing_days': len(incomplete),
+        'fips_without_data': int((days_per_fips == 0).sum()),
+        'missing_days_by_fips': {str(fips_codes[i]): int(missing_days[i]) for i in incomplete},
+        'most_missing_days': {str(fips_codes[i]): int(missing_days[i]) for i in worst},
+        'duplicate_rows': duplicate_rows,
+        'duplicate_keys': int(duplicated.sum()),
+        'rows_without_fips': missing_fips,
+        'rows_with_unknown_fips': unknown_fips_rows,
+        'unknown_fips': sorted(int(f) for f in unknown_fips)[:max_listed],
+        'rows_outside_date_range': out_of_range_dates,
+        'nan_counts': nan_counts,
+        'below_range': below,
+        'above_range': above,
+        'min': minimum,
+        'max': maximum,
+        'expected_grid_rows': n_fips * n_days if grid else None,
+    }
+
+    failed = []
+    if unique and duplicate_rows:
+        failed.append('duplicates')
+    if any(above.values()) or any(below.values()):
+        failed.append('value_ranges')
+    if grid and (len(incomplete) or rows != n_fips * n_days or unknown_fips_rows or out_of_range_dates
+                 or missing_fips or any(nan_counts.values())):
+        failed.append('grid')
+    report['failed'] = failed
+    return report
+
+
+def validate_dataset(name, root=ROOT, all_fips_file=ALL_FIPS_FILE, **kwargs):
+    """Validate the pipeline table DATASETS[name] with its columns, expected FIPS and grid"""
+    spec = DATASETS[name]
+    path = os.path.join(root, spec['path'])
+    fips_codes = load_fips(all_fips_file) if spec['grid'] == 'all' else None
+    report = validate_table(path, spec['columns'], fips_codes, grid=spec['grid'] is not None,
+                            unique=spec['unique'], **kwargs)
+    report['dataset'] = name
+    return report
+
+
+def summary(report):
+    """Printable lines of a report"""
+    name = report.get('dataset', report['path'])
+    lines = [
+        f"{name}: {report['rows']} rows, {report['fips_observed']} FIPS, dates {report['date_range'][0]} to "
+        f"{report['date_range'][1]}",
+        f"  days per FIPS: min {report['days_per_fips']['min']}, median {report['days_per_fips']['median']:g}, "
+        f"max {report['days_per_fips']['max']} of {report['expected_days']}; "
+        f"{report['fips_with_missing_days']} FIPS with missing days",
+        f"  duplicate (fips, date) rows: {report['duplicate_rows']}; NaN: "
+        + (', '.join(f"{col} {n}" for col, n in report['nan_counts'].items() if n) or 'none'),
+    ]
+    out_of_range = {col: report['below_range'].get(col, 0) + report['above_range'].get(col, 0)
+                    for col in report['nan_counts']}
+    if any(out_of_range.values()):
+        lines.append("  out of range: " + ', '.join(f"{col} {n}" for col, n in out_of_range.items() if n))
+    if report['expected_grid_rows'] is not None:
+        lines.append(f"  grid: {report['rows']} of {report['expected_grid_rows']} expected rows")
+    lines.append(f"  {'FAILED: ' + ', '.join(report['failed']) if report['failed'] else 'OK'}")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate the completeness of the pipeline tables")
+    parser.add_argument('--dataset', nargs='+', choices=list(DATASETS),
+                        help="Pipeline tables to validate (all that exist when neither this nor --table is given)")
+    parser.add_argument('--table', help="Validate this table instead")
+    parser.add_argument('--columns', nargs='+', help="Value columns of --table")
+    parser.add_argument('--grid', action='store_true', help="--table must hold every FIPS on every day")
+    parser.add_argument('--all-fips', action='store_true', help="Expect the FIPS of all_fips_code.csv in --table")
+    parser.add_argument('--start-date', default=START_DATE)
+    parser.add_argument('--end-date', default=END_DATE)
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help="Rows read at a time")
+    parser.add_argument('--report', default='validation_report.json', help="JSON report file")
+    args = parser.parse_args()
+
+    options = dict(start_date=args.start_date, end_date=args.end_date, chunksize=args.chunksize)
+    reports = []
+    if args.table:
+        fips_codes = load_fips() if args.all_fips else None
+        reports.append(validate_table(args.table, args.columns, fips_codes, grid=args.grid, **options))
+    else:
+        for name in args.dataset or DATASETS:
+            spec_path = os.path.join(ROOT, DATASETS[name]['path'])
+            if args.dataset is None and not any(
+                    os.path.exists(storage.table_path(spec_path, fmt)) for fmt in storage.FORMATS):
+                continue
+            logging.info(f"Validating {name}...")
+            reports.append(validate_dataset(name, **options))
+
+    for report in reports:
+        print('\n'.join(summary(report)))
+    with open(args.report, 'w') as f:
+        json.dump(reports, f, indent=2)
+    print(f"Report saved to {args.report}")
+    raise SystemExit(1 if any(report['failed'] for report in reports) else 0)
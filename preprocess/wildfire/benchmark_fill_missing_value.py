@@ -0,0 +1,104 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from fill_missing_value import fill_missing_dates
+
+'''
+    This script is used for benchmarking fill_missing_value.py against its previous implementation (one scan of the
+    DataFrame per FIPS and one Python dict per FIPS and day) on synthetic data, and checking both write the same CSV.
+
+    Example: python benchmark_fill_missing_value.py --fips 200 --start 2016-01-01 --end 2020-12-31
+'''
+
+
+def fill_missing_dates_previous(input_file, output_file, start_date, end_date):
+    """The previous implementation of fill_missing_dates"""
+    df = pd.read_csv(input_file)
+    df['date'] = pd.to_datetime(df['date'])
+    fips_codes = df['fips'].unique()
+    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
+
+    fips_coords = {}
+    for fips in fips_codes:
+        fips_data = df[df['fips'] == fips].iloc[0]
+        fips_coords[fips] = (fips_data['lon'], fips_data['lat'])
+
+    filled_data = []
+    for fips in fips_codes:
+        fips_data = df[df['fips'] == fips].copy()
+        existing_dates = {}
+        for _, row in fips_data.iterrows():
+            existing_dates[row['date']] = row['FIRE_SIZE']
+        lon, lat = fips_coords[fips]
+        for date in date_range:
+            filled_data.append({
+                'fips': fips,
+                'date': date,
+                'FIRE_SIZE': existing_dates.get(date, 0),
+                'lon': lon,
+                'lat': lat
+            })
+
+    filled_df = pd.DataFrame(filled_data).sort_values(['fips', 'date'])
+    filled_df.to_csv(output_file, index=False)
+    return filled_df
+
+
+def measure(func, *args):
+    """Wall-clock seconds of an untraced run, and peak MiB traced by tracemalloc in a second run"""
+    start = time.perf_counter()
+    func(*args)
+    duration = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak / 1024 ** 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the wildfire zero-filling against the previous version")
+    parser.add_argument('--fips', type=int, default=100)
+    parser.add_argument('--start', default='2018-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--fire-fraction', type=float, default=0.02)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    date_range = pd.date_range(start=args.start, end=args.end)
+    fips_codes = rng.choice(np.arange(1001, 56046), size=args.fips, replace=False)
+    fips_idx, day_idx = np.nonzero(rng.random((len(fips_codes), len(date_range))) < args.fire_fraction)
+    coords = rng.uniform(-120, -70, size=(len(fips_codes), 2))
+    data = pd.DataFrame({
+        'fips': fips_codes[fips_idx],
+        'date': date_range[day_idx],
+        'FIRE_SIZE': rng.exponential(10, size=len(fips_idx)),
+        'lon': coords[fips_idx, 0],
+        'lat': coords[fips_idx, 1],
+    })
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = os.path.join(tmp_dir, 'aggregated_daily_fire_size.csv')
+        previous_file = os.path.join(tmp_dir, 'previous.csv')
+        vectorized_file = os.path.join(tmp_dir, 'vectorized.csv')
+        data.to_csv(input_file, index=False)
+        print(f"{len(fips_codes)} FIPS x {len(date_range)} days, {len(data)} fire rows")
+
+        previous_seconds, previous_peak = measure(
+            fill_missing_dates_previous, input_file, previous_file, args.start, args.end)
+        vectorized_seconds, vectorized_peak = measure(
+            fill_missing_dates, input_file, vectorized_file, args.start, args.end)
+
+        with open(previous_file) as a, open(vectorized_file) as b:
+            print(f"Same CSV output: {a.read() == b.read()}")
+
+    print(f"{'':<12}{'seconds':>10}{'peak MiB':>12}")
+    print(f"{'previous':<12}{previous_seconds:>10.2f}{previous_peak:>12.1f}")
+    print(f"{'vectorized':<12}{vectorized_seconds:>10.2f}{vectorized_peak:>12.1f}")
+    print(f"Speed-up: {previous_seconds / vectorized_seconds:.1f}x, "
+          f"peak memory: {previous_peak / vectorized_peak:.1f}x lower")
@@ -1,74 +1,173 @@
+import argparse
+import logging
+import os
 import sqlite3
+import sys
+import time
+from collections import defaultdict
+from contextlib import closing, contextmanager
+import numpy as np
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
 
-# This script is used to extract wildfire data, and assiging FIPS to missing data
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from county_index import SHAPEFILE, load_county_index
+from storage import TableWriter, table_path
 
-# Path to your SQLite database
-db_path = '../../datasets/wildfire/FPA_FOD_20221014.sqlite'
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Connect to the SQLite database
-conn = sqlite3.connect(db_path)
+'''
+    This script is used to extract wildfire data, and assiging FIPS to missing data
 
-# SQL query to fetch data
-query = """
-SELECT DISCOVERY_DATE, LATITUDE, LONGITUDE, FIPS_CODE, FIRE_SIZE, FIRE_SIZE_CLASS, STATE, CONT_DATE
-FROM Fires;
-"""
+    - The year and state filters are pushed down into the SQL query, and the result is read --chunksize rows at a time.
+    - The 5-digit FIPS is built vectorized from the STATE abbreviation and the 3-digit county FIPS_CODE.
+    - Only fires whose FIPS cannot be built that way are located in the county polygons (county_index.py).
+    - The fires are appended chunk by chunk to the output table (see storage.py).
+    - The time spent in each phase is logged at the end.
 
-# Load query result into DataFrame
-df = pd.read_sql_query(query, conn)
+    Example: python extract_wild_fire_data.py --start-year 1992 --end-year 2020 --states CA OR WA
+'''
 
-# Close DB connection
-conn.close()
+DB_PATH = '../../datasets/wildfire/FPA_FOD_20221014.sqlite'
+OUTPUT_FILE = 'wildfire'
 
-# Convert date columns to datetime
-df['DISCOVERY_DATE'] = pd.to_datetime(df['DISCOVERY_DATE'], errors='coerce')
-df['CONT_DATE'] = pd.to_datetime(df['CONT_DATE'], errors='coerce')
-
-# Use DISCOVERY_DATE as end_date if CONT_DATE is null
-df['end_date'] = df['CONT_DATE'].fillna(df['DISCOVERY_DATE'])
+COLUMNS = ['DISCOVERY_DATE', 'LATITUDE', 'LONGITUDE', 'FIPS_CODE', 'FIRE_SIZE', 'FIRE_SIZE_CLASS', 'STATE', 'CONT_DATE']
 
 # State abbreviation to FIPS code map
 state_fips_map = {
-    'AL': '01', 'AK': '02', 'AZ': '04', 'AR': '05', 'CA': '06', 'CO': '08', 'CT': '09', 
-    'DE': '10', 'FL': '12', 'GA': '13', 'HI': '15', 'ID': '16', 'IL': '17', 'IN': '18', 
-    'IA': '19', 'KS': '20', 'KY': '21', 'LA': '22', 'ME': '23', 'MD': '24', 'MA': '25', 
-    'MI': '26', 'MN': '27', 'MS': '28', 'MO': '29', 'MT': '30', 'NE': '31', 'NV': '32', 
-    'NH': '33', 'NJ': '34', 'NM': '35', 'NY': '36', 'NC': '37', 'ND': '38', 'OH': '39', 
-    'OK': '40', 'OR': '41', 'PA': '42', 'RI': '44', 'SC': '45', 'SD': '46', 'TN': '47', 
-    'TX': '48', 'UT': '49', 'VT': '50', 'VA': '51', 'WA': '53', 'WV': '54', 'WI': '55', 
+    'AL': '01', 'AK': '02', 'AZ': '04', 'AR': '05', 'CA': '06', 'CO': '08', 'CT': '09',
+    'DE': '10', 'FL': '12', 'GA': '13', 'HI': '15', 'ID': '16', 'IL': '17', 'IN': '18',
+    'IA': '19', 'KS': '20', 'KY': '21', 'LA': '22', 'ME': '23', 'MD': '24', 'MA': '25',
+    'MI': '26', 'MN': '27', 'MS': '28', 'MO': '29', 'MT': '30', 'NE': '31', 'NV': '32',
+    'NH': '33', 'NJ': '34', 'NM': '35', 'NY': '36', 'NC': '37', 'ND': '38', 'OH': '39',
+    'OK': '40', 'OR': '41', 'PA': '42', 'RI': '44', 'SC': '45', 'SD': '46', 'TN': '47',
+    'TX': '48', 'UT': '49', 'VT': '50', 'VA': '51', 'WA': '53', 'WV': '54', 'WI': '55',
     'WY': '56'
 }
 
-# Construct full FIPS code
-df['FIPS_CODE'] = df.apply(
-    lambda row: state_fips_map.get(row['STATE'], '') + str(row['FIPS_CODE']).zfill(3)
-    if pd.notna(row['STATE']) and pd.notna(row['FIPS_CODE'])
-    else None,
-    axis=1
-)
-
-# Load U.S. county shapefile
-counties = gpd.read_file("../../preprocess/tp/cb_2022_us_county_500k/cb_2022_us_county_500k.shp")
-
-# Convert to GeoDataFrame
-geometry = [Point(xy) for xy in zip(df["LONGITUDE"], df["LATITUDE"])]
-gdf = gpd.GeoDataFrame(df, geometry=geometry, crs="EPSG:4326")
-
-# Spatial join with counties
-gdf = gpd.sjoin(gdf, counties, how="left", predicate="within")
-
-# Select and rename columnsa
-gdf = gdf[["DISCOVERY_DATE", "FIRE_SIZE", "GEOID", "LONGITUDE", "LATITUDE", "end_date"]]
-gdf.rename(columns={
-    "DISCOVERY_DATE": "date",
-    "GEOID": "fips",
-    "LONGITUDE": "lon",
-    "LATITUDE": "lat"
-}, inplace=True)
-
-# Save result
-gdf.to_csv("wildfire.csv", index=False)
-print("County and FIPS Code added successfully with fallback for end_date!")
+
+class PhaseTimer:
+    """Accumulates the wall-clock seconds spent in each named phase"""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+
+    @contextmanager
+    def __call__(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[phase] += time.perf_counter() - start
+
+    def report(self):
+        total = sum(self.seconds.values())
+        for phase, seconds in self.seconds.items():
+            logging.info(f"{phase:<14}{seconds:>8.2f}s ({seconds / total if total else 0:.0%})")
+        logging.info(f"{'total':<14}{total:>8.2f}s")
+
+
+def build_query(start_year=None, end_year=None, states=None):
+    """SELECT of the needed columns with the year and state filters as SQL parameters"""
+    conditions, params = [], []
+    if start_year is not None:
+        conditions.append("FIRE_YEAR >= ?")
+        params.append(start_year)
+    if end_year is not None:
+        conditions.append("FIRE_YEAR <= ?")
+        params.append(end_year)
+    if states:
+        conditions.append(f"STATE IN ({', '.join('?' * len(states))})")
+        params.extend(states)
+    query = f"SELECT {', '.join(COLUMNS)} FROM Fires"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query, params
+
+
+def derive_fips(state, county):
+    """
+    5-digit FIPS strings from the STATE abbreviations and the county FIPS_CODE, or None where it cannot be built.
+
+    The county code may come as text ('63', '063') or as a number (63, 63.0); a 5-digit code that already starts
+    with the state's code is kept as is.
+    """
+    state_code = pd.Series(state, copy=False).map(state_fips_map)
+    county = pd.Series(county, copy=False)
+    number = pd.to_numeric(county, errors='coerce')
+    whole = number.notna() & (number >= 0) & (number < 1000) & (number == np.floor(number))
+    fips = state_code + number.where(whole).astype('Int64').astype('string').str.zfill(3)
+
+    text = county.astype('string').str.strip()
+    full = text.str.fullmatch(r'\d{5}').fillna(False) & (text.str[:2] == state_code).fillna(False)
+    fips = fips.where(~full, text)
+    return fips.astype(object).where(fips.notna(), None)
+
+
+def extract_wildfires(db_path, output_file, start_year=None, end_year=None, states=None, chunksize=500_000,
+                      shapefile=SHAPEFILE):
+    """
+    Extract the fires matching the filters with their FIPS to output_file, one chunk of query rows at a time.
+
+    Returns:
+    --------
+    dict
+        Fires written, fires whose FIPS came from the spatial join, and seconds per phase
+    """
+    timer = PhaseTimer()
+    stats = {'rows': 0, 'spatial_join_rows': 0}
+    query, params = build_query(start_year, end_year, states)
+    logging.info(f"Query: {query} {params}")
+
+    with closing(sqlite3.connect(db_path)) as conn, TableWriter(output_file) as writer:
+        chunks = pd.read_sql_query(query, conn, params=params, chunksize=chunksize)
+        while True:
+            with timer('sql'):
+                df = next(chunks, None)
+            if df is None:
+                break
+
+            with timer('dates'):
+                # Convert date columns to datetime, using DISCOVERY_DATE as end_date if CONT_DATE is null
+                df['DISCOVERY_DATE'] = pd.to_datetime(df['DISCOVERY_DATE'], errors='coerce')
+                df['CONT_DATE'] = pd.to_datetime(df['CONT_DATE'], errors='coerce')
+                df['end_date'] = df['CONT_DATE'].fillna(df['DISCOVERY_DATE'])
+
+            with timer('derive fips'):
+                df['fips'] = derive_fips(df['STATE'], df['FIPS_CODE'])
+
+            missing = df['fips'].isna()
+            if missing.any():
+                with timer('spatial join'):
+                    counties = load_county_index(shapefile)
+                    df.loc[missing, 'fips'] = counties.points_to_geoid(
+                        df.loc[missing, 'LONGITUDE'], df.loc[missing, 'LATITUDE']
+                    )
+                stats['spatial_join_rows'] += int(missing.sum())
+
+            with timer('write'):
+                out = df[["DISCOVERY_DATE", "FIRE_SIZE", "fips", "LONGITUDE", "LATITUDE", "end_date"]].rename(columns={
+                    "DISCOVERY_DATE": "date",
+                    "LONGITUDE": "lon",
+                    "LATITUDE": "lat"
+                })
+                writer.write(out)
+            stats['rows'] += len(df)
+            logging.info(f"{stats['rows']} fires extracted, {stats['spatial_join_rows']} located by spatial join")
+
+    timer.report()
+    stats['seconds'] = dict(timer.seconds)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract FPA FOD wildfires with their county FIPS")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--output', default=OUTPUT_FILE, help="Output table (see storage.py)")
+    parser.add_argument('--start-year', type=int, default=None, help="First FIRE_YEAR to extract")
+    parser.add_argument('--end-year', type=int, default=None, help="Last FIRE_YEAR to extract")
+    parser.add_argument('--states', nargs='+', default=None, help="STATE abbreviations to extract, e.g. CA OR")
+    parser.add_argument('--chunksize', type=int, default=500_000, help="Rows read from the database at a time")
+    args = parser.parse_args()
+
+    extract_wildfires(args.db, args.output, args.start_year, args.end_year, args.states, args.chunksize)
+    print(f"County and FIPS Code added successfully with fallback for end_date to {table_path(args.output)}!")
@@ -1,9 +1,12 @@
+import os
+import sys
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import os
 import logging
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import storage
+
 ''' 
     This script is used for adding 0 to wildfire column if one FIPS is missing data at some date.
     For example, if FIPS 10011 is missing data at 1992-01-01, the wildfire size at FIPS 10011 and 1992-01-01 is 0
@@ -18,103 +21,86 @@ logging.basicConfig(
     ]
 )
 
-def fill_missing_dates(input_file, output_file, start_date='1992-01-01', end_date='2020-12-31'):
+def fill_missing_dates(input_file, output_file, start_date='1992-01-01', end_date='2020-12-31', chunk_fips=256):
     """
     Fill missing dates with zeros for each FIPS code in the wildfire dataset.
+
+    The fire sizes are scattered into a dense (fips x day) array of zeros in one pass, and the output is written
+    chunk_fips FIPS codes at a time.
     
     Parameters:
     -----------
     input_file : str
-        Path to the input CSV file containing wildfire data
+        Table (see storage.py) containing the wildfire data
     output_file : str
-        Path to save the output CSV file with filled missing dates
+        Table to save the data with filled missing dates to
     start_date : str
         Start date in 'YYYY-MM-DD' format
     end_date : str
         End date in 'YYYY-MM-DD' format
+    chunk_fips : int
+        Number of FIPS codes written to the output at once
+
+    Returns:
+    --------
+    dict with the number of total, zero and non-zero records, or None on error
     """
     try:
         # Load the data
         logging.info(f"Loading data from {input_file}")
-        df = pd.read_csv(input_file)
-        
-        # Convert date column to datetime
-        df['date'] = pd.to_datetime(df['date'])
+        # Dates as datetime, FIRE_SIZE as stored (float64)
+        df = storage.read_table(input_file, compact=False)
+
+        missing_fips = df['fips'].isna().sum()
+        if missing_fips > 0:
+            logging.warning(f"Dropping {missing_fips} rows without FIPS code")
+            df = df.dropna(subset=['fips'])
         
-        # Get unique FIPS codes
-        fips_codes = df['fips'].unique()
+        # Get unique FIPS codes, sorted like the output
+        fips_codes = np.sort(df['fips'].unique())
         logging.info(f"Found {len(fips_codes)} unique FIPS codes")
         
         # Create date range
         date_range = pd.date_range(start=start_date, end=end_date, freq='D')
         logging.info(f"Created date range from {start_date} to {end_date} with {len(date_range)} days")
         
-        # Create a dictionary to store FIPS coordinates
-        fips_coords = {}
-        for fips in fips_codes:
-            # Get the first occurrence of this FIPS code to extract coordinates
-            fips_data = df[df['fips'] == fips].iloc[0]
-            fips_coords[fips] = (fips_data['lon'], fips_data['lat'])
-        
-        # Create a new dataframe to store the filled data
-        filled_data = []
-        
-        # Process each FIPS code
-        for i, fips in enumerate(fips_codes):
-            logging.info(f"Processing FIPS code {fips} ({i+1}/{len(fips_codes)})")
-            
-            # Get data for this FIPS code
-            fips_data = df[df['fips'] == fips].copy()
-            
-            # Create a dictionary of existing dates and their fire sizes
-            existing_dates = {}
-            for _, row in fips_data.iterrows():
-                existing_dates[row['date']] = row['FIRE_SIZE']
-            
-            # Get coordinates for this FIPS code
-            lon, lat = fips_coords[fips]
-            
-            # Fill missing dates with zeros
-            for date in date_range:
-                if date in existing_dates:
-                    # Use existing data
-                    filled_data.append({
-                        'fips': fips,
-                        'date': date,
-                        'FIRE_SIZE': existing_dates[date],
-                        'lon': lon,
-                        'lat': lat
-                    })
-                else:
-                    # Fill with zero
-                    filled_data.append({
-                        'fips': fips,
-                        'date': date,
-                        'FIRE_SIZE': 0,
-                        'lon': lon,
-                        'lat': lat
-                    })
+        # Coordinates of each FIPS code
+        fips_coords = df.groupby('fips')[['lon', 'lat']].first().reindex(fips_codes)
         
-        # Convert to dataframe
-        filled_df = pd.DataFrame(filled_data)
+        # Dense (fips x day) fire sizes: zero everywhere, then one scatter of the observed rows
+        rows = np.searchsorted(fips_codes, df['fips'].values)
+        days = (df['date'].values - date_range[0].to_datetime64()) // np.timedelta64(1, 'D')
+        in_range = (days >= 0) & (days < len(date_range)) & (df['date'].dt.normalize() == df['date']).values
+        fire_size = np.zeros((len(fips_codes), len(date_range)), dtype=np.float64)
+        # For duplicated (fips, date) rows the last one wins
+        fire_size[rows[in_range], days[in_range]] = df['FIRE_SIZE'].values[in_range]
+        del df
         
-        # Sort by FIPS and date
-        filled_df = filled_df.sort_values(['fips', 'date'])
-        
-        # Save to CSV
-        filled_df.to_csv(output_file, index=False)
-        logging.info(f"Saved filled data to {output_file}")
+        # Save the table, chunk_fips FIPS codes at a time (already sorted by FIPS and date)
+        with storage.TableWriter(output_file) as writer:
+            for start in range(0, len(fips_codes), chunk_fips):
+                chunk_codes = fips_codes[start:start + chunk_fips]
+                chunk = pd.DataFrame({
+                    'fips': np.repeat(chunk_codes, len(date_range)),
+                    'date': np.tile(date_range.values, len(chunk_codes)),
+                    'FIRE_SIZE': fire_size[start:start + chunk_fips].ravel(),
+                    'lon': np.repeat(fips_coords['lon'].values[start:start + chunk_fips], len(date_range)),
+                    'lat': np.repeat(fips_coords['lat'].values[start:start + chunk_fips], len(date_range)),
+                })
+                writer.write(chunk)
+                logging.info(f"Saved FIPS codes {start + 1}-{start + len(chunk_codes)} of {len(fips_codes)}")
+        logging.info(f"Saved filled data to {writer.path}")
         
         # Print some statistics
-        total_records = len(filled_df)
-        zero_records = len(filled_df[filled_df['FIRE_SIZE'] == 0])
+        total_records = fire_size.size
+        zero_records = int((fire_size == 0).sum())
         non_zero_records = total_records - zero_records
         
         logging.info(f"Total records: {total_records}")
         logging.info(f"Zero records: {zero_records} ({zero_records/total_records*100:.2f}%)")
         logging.info(f"Non-zero records: {non_zero_records} ({non_zero_records/total_records*100:.2f}%)")
         
-        return filled_df
+        return {'total_records': total_records, 'zero_records': zero_records, 'non_zero_records': non_zero_records}
     
     except Exception as e:
         logging.error(f"Error filling missing dates: {str(e)}")
@@ -122,20 +108,17 @@ def fill_missing_dates(input_file, output_file, start_date='1992-01-01', end_dat
 
 if __name__ == "__main__":
     # Define input and output file paths
-    input_file = "aggregated_daily_fire_size.csv"
-    output_file = "aggregated_daily_fire_size_filled.csv"
+    input_file = "aggregated_daily_fire_size"
+    output_file = "aggregated_daily_fire_size_filled"
     
     # Fill missing dates
-    filled_df = fill_missing_dates(input_file, output_file)
+    stats = fill_missing_dates(input_file, output_file)
     
-    if filled_df is not None:
-        # Display a sample of the filled data
+    if stats is not None:
+        # Display a sample of the filled data (the first rows all belong to the first FIPS code)
+        sample_data = next(storage.iter_table(output_file, chunksize=10))
         print("\nSample of filled data:")
-        print(filled_df.head(10))
-        
-        # Check for a specific FIPS code
-        sample_fips = filled_df['fips'].iloc[0]
-        sample_data = filled_df[filled_df['fips'] == sample_fips].head(10)
-        print(f"\nSample data for FIPS code {sample_fips}:")
-        print(sample_data) 
+        print(sample_data)
+        print(f"\nSample data for FIPS code {sample_data['fips'].iloc[0]}:")
+        print(sample_data[sample_data['fips'] == sample_data['fips'].iloc[0]])
     
\ No newline at end of file
@@ -1,49 +1,107 @@
+import os
+import sys
 import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import schema
+import storage
 
 # This script is used for calculating average for rows with same FIPS and date.
+#
+# Every fire is spread evenly over the days it was active (discovery date to containment date). The expansion is
+# vectorized: fire attributes are repeated once per active day with np.repeat, and the (fips, date) sums are
+# computed on the lexsorted rows, with the same compensated summation and skip-NaN 'first' as pandas groupby.
+
+
+def expand_fire_days(df):
+    """One row per active day of every fire, with the fire size divided evenly over those days"""
+    start = df['date'].values
+    end = df['end_date'].values
+    one_day = np.timedelta64(1, 'D')
+
+    # Number of days in pd.date_range(start, end, freq='D'); fires without dates or ending before they start are dropped
+    valid = ~(np.isnat(start) | np.isnat(end))
+    duration = np.zeros(len(df), dtype=np.int64)
+    duration[valid] = (end[valid] - start[valid]) // one_day + 1
+    duration = np.maximum(duration, 0)
+
+    fire = np.repeat(np.arange(len(df)), duration)
+    first_row = np.cumsum(duration) - duration
+    day_offset = np.arange(len(fire)) - np.repeat(first_row, duration)
+
+    return pd.DataFrame({
+        'date': start[fire] + day_offset * one_day,
+        'FIRE_SIZE': df['FIRE_SIZE'].values[fire] / duration[fire],
+        'fips': df['fips'].values[fire],
+        'lon': df['lon'].values[fire],
+        'lat': df['lat'].values[fire],
+    })
+
+
+def _group_sum(values, starts, lengths):
+    """Per-group sum skipping NaN, using the Kahan summation of pandas groupby().sum(), one group element at a time"""
+    sums = np.zeros(len(starts))
+    compensation = np.zeros(len(starts))
+    # Groups by length, longest first: the groups still active at pass k are a prefix of order
+    order = np.argsort(-lengths, kind='stable')
+    descending = -lengths[order]
+    for k in range(lengths.max() if len(lengths) else 0):
+        groups = order[:np.searchsorted(descending, -k, side='left')]
+        val = values[starts[groups] + k]
+        observed = ~np.isnan(val)
+        groups, val = groups[observed], val[observed]
+        y = val - compensation[groups]
+        t = sums[groups] + y
+        compensation[groups] = t - sums[groups] - y
+        sums[groups] = t
+    return sums
+
+
+def _group_first(values, starts, n_rows):
+    """Per-group first non-NaN value, like pandas groupby().first()"""
+    position = np.where(np.isnan(values), n_rows, np.arange(n_rows))
+    first = np.minimum.reduceat(position, starts) if len(starts) else np.empty(0, dtype=np.int64)
+    return np.where(first < n_rows, values[np.minimum(first, n_rows - 1)], np.nan)
+
+
+def aggregate_by_fips_and_date(expanded_df):
+    """Sort-based group-by of the expanded rows on (fips, date): FIRE_SIZE summed, lon and lat of the first row"""
+    expanded_df = expanded_df[expanded_df['fips'].notna()]
+    fips = expanded_df['fips'].values
+    dates = expanded_df['date'].values
+
+    # Stable sort, so rows keep their original order within a group
+    order = np.lexsort((dates, fips))
+    fips, dates = fips[order], dates[order]
+    n_rows = len(order)
+    is_start = np.ones(n_rows, dtype=bool)
+    is_start[1:] = (fips[1:] != fips[:-1]) | (dates[1:] != dates[:-1])
+    starts = np.flatnonzero(is_start)
+    lengths = np.diff(np.append(starts, n_rows))
+
+    return pd.DataFrame({
+        'fips': fips[starts],
+        'date': dates[starts],
+        'FIRE_SIZE': _group_sum(expanded_df['FIRE_SIZE'].values[order].astype(np.float64), starts, lengths),
+        'lon': _group_first(expanded_df['lon'].values[order].astype(np.float64), starts, n_rows),
+        'lat': _group_first(expanded_df['lat'].values[order].astype(np.float64), starts, n_rows),
+    })
+
+
+if __name__ == "__main__":
+    # Read the wildfire table with its dates as datetime; FIRE_SIZE stays float64 for the sums
+    df = storage.read_table('./wildfire', compact=False)
+
+    # Fires without FIPS are left out of the aggregation, the others get int32 FIPS codes
+    df = df.dropna(subset=['fips'])
+    df['fips'] = schema.to_fips(df['fips'])
+
+    # Expand every fire to its active days, then sum all fire sizes per FIPS and date
+    expanded_df = expand_fire_days(df)
+    aggregated_df = aggregate_by_fips_and_date(expanded_df)
+
+    # Save the aggregated table
+    output_path = storage.write_table(aggregated_df, 'aggregated_daily_fire_size')
 
-# Read the CSV file
-df = pd.read_csv('./wildfire.csv')
-
-# Convert date columns to datetime
-df['date'] = pd.to_datetime(df['date'])
-df['end_date'] = pd.to_datetime(df['end_date'])
-
-# Store expanded fire records
-expanded_rows = []
-
-for _, row in df.iterrows():
-    start_date = row['date']
-    end_date = row['end_date']
-    fire_size = row['FIRE_SIZE']
-    fips = row['fips']
-    
-    # Create daily date range for this fire
-    active_dates = pd.date_range(start=start_date, end=end_date, freq='D')
-    
-    # Average fire size per day
-    daily_fire_size = fire_size / len(active_dates)
-
-    for date in active_dates:
-        expanded_rows.append({
-            'date': date,
-            'FIRE_SIZE': daily_fire_size,
-            'fips': fips,
-            'lon': row['lon'],
-            'lat': row['lat']
-        })
-
-# Create DataFrame from expanded records
-expanded_df = pd.DataFrame(expanded_rows)
-
-# Group by FIPS and date to sum all fire sizes
-aggregated_df = expanded_df.groupby(['fips', 'date'], as_index=False).agg({
-    'FIRE_SIZE': 'sum',
-    'lon': 'first',
-    'lat': 'first'
-})
-
-# Save to CSV
-aggregated_df.to_csv('aggregated_daily_fire_size.csv', index=False)
-
-print("Aggregation complete! Saved to 'aggregated_daily_fire_size.csv'.")
+    print(f"Aggregation complete! Saved to '{output_path}'.")
@@ -0,0 +1,132 @@
+import argparse
+import logging
+import os
+import sys
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy import sparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import schema
+import storage
+from wind_grid_mapping import MODES, LAT_MIN, LAT_MAX, LON_MIN, LON_MAX, cell_index, load_mapping
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+'''
+    This script is used for:
+    - Reading the daily u and v wind of every year from the NCEP reanalysis netCDF files.
+    - Calculating wind speed: sqrt(u^2 + v^2).
+    - Averaging the grid cells over each county and saving the (fips, date, wind_speed) table.
+
+    The files are opened lazily and read --time-chunk days at a time, cut to the US bounds, so only one chunk of the
+    grid is ever in memory. The grid cells are reduced to county means with a sparse county x cell weight matrix
+    built from the mapping of wind_grid_mapping.py (--mode centroid: plain mean of the cells whose centre falls in the
+    county, --mode area: area-weighted mean of the cells overlapping it). No grid-level table is written; the county
+    table is appended chunk by chunk through storage.py.
+
+    Example: python extract_county_wind.py --start-year 1992 --end-year 2020 --mode area
+'''
+
+U_FILE = 'uwnd.sig995.{year}.nc'
+V_FILE = 'vwnd.sig995.{year}.nc'
+
+
+def us_subset(da):
+    """The US bounds of a (time, lat, lon) NCEP DataArray; lat is descending and lon is in 0..360"""
+    return da.sel(lat=slice(LAT_MAX, LAT_MIN), lon=slice(LON_MIN % 360, LON_MAX % 360))
+
+
+def county_weights(mapping, lat, lon):
+    """
+    Sparse (county x cell) matrix averaging the cells of the (lat, lon) grid over each county.
+
+    Returns the matrix and the fips of its rows. Each row holds the mapping weights of the county, scaled to sum
+    to 1 over the cells of this grid.
+    """
+    grid_lat, grid_lon = np.meshgrid(lat, lon, indexing='ij')
+    position = pd.Series(np.arange(grid_lat.size), index=cell_index(grid_lat.ravel(), grid_lon.ravel()))
+    mapping = mapping[mapping['cell'].isin(position.index)]
+
+    fips, county = np.unique(mapping['fips'].values, return_inverse=True)
+    weights = sparse.csr_matrix(
+        (mapping['weight'].values, (county, position[mapping['cell'].values].values)),
+        shape=(len(fips), grid_lat.size)
+    )
+    totals = np.asarray(weights.sum(axis=1)).ravel()
+    weights = sparse.diags(1.0 / totals) @ weights
+    return weights.tocsr(), schema.to_fips(fips)
+
+
+def wind_speed(u, v):
+    """sqrt(u^2 + v^2), computed in place in u"""
+    np.multiply(u, u, out=u)
+    u += v * v
+    return np.sqrt(u, out=u)
+
+
+def county_means(speed, weights):
+    """(time, county) weighted means of a (time, cell) array, skipping missing cells"""
+    observed = ~np.isnan(speed)
+    sums = (weights @ np.where(observed, speed, 0).T).T
+    counts = (weights @ observed.T.astype(np.float64)).T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts).astype(schema.MEASUREMENT_DTYPE)
+
+
+def extract_year(u_file, v_file, mapping, time_chunk=92):
+    """Yield (fips, date, wind_speed) DataFrames of one year, one time chunk at a time"""
+    with xr.open_dataset(u_file, engine='h5netcdf') as u_data, xr.open_dataset(v_file, engine='h5netcdf') as v_data:
+        uwnd, vwnd = us_subset(u_data['uwnd']), us_subset(v_data['vwnd'])
+        weights, fips = county_weights(mapping, uwnd['lat'].values, uwnd['lon'].values)
+        dates = uwnd['time'].values.astype('datetime64[D]')
+
+        for start in range(0, len(dates), time_chunk):
+            chunk = slice(start, start + time_chunk)
+            u = uwnd.isel(time=chunk).values.astype(np.float32)
+            v = vwnd.isel(time=chunk).values.astype(np.float32)
+            speed = wind_speed(u, v).reshape(len(u), -1)
+            means = county_means(speed, weights)
+
+            df = pd.DataFrame({
+                'fips': np.tile(fips, len(means)),
+                'date': np.repeat(dates[chunk], len(fips)),
+                'wind_speed': means.ravel(),
+            })
+            yield df.dropna(subset=['wind_speed'])
+
+
+def extract_county_wind(years, input_dir, output_file, mode='centroid', time_chunk=92):
+    """Write the county-day wind speed of every year with u and v files in input_dir to the output_file table"""
+    mapping = load_mapping(mode)
+    with storage.TableWriter(output_file) as writer:
+        for year in years:
+            u_file = os.path.join(input_dir, U_FILE.format(year=year))
+            v_file = os.path.join(input_dir, V_FILE.format(year=year))
+            if not (os.path.exists(u_file) and os.path.exists(v_file)):
+                logging.warning(f"Missing {u_file} or {v_file}, skipping {year}")
+                continue
+
+            rows = writer.rows
+            for df in extract_year(u_file, v_file, mapping, time_chunk):
+                writer.write(df)
+            logging.info(f"{year}: {writer.rows - rows} county-day rows")
+    return writer.rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract county-day wind speed from the NCEP reanalysis files")
+    parser.add_argument('--start-year', type=int, default=1992)
+    parser.add_argument('--end-year', type=int, default=2020)
+    parser.add_argument('--input-dir', default='../../datasets/wind')
+    parser.add_argument('--output-file', default='fips_wind_no_na_averaged', help="Output table (see storage.py)")
+    parser.add_argument('--mode', choices=MODES, default='centroid', help="Grid cell -> county mapping to use")
+    parser.add_argument('--time-chunk', type=int, default=92, help="Days read at a time")
+    args = parser.parse_args()
+
+    total = extract_county_wind(
+        range(args.start_year, args.end_year + 1), args.input_dir, args.output_file,
+        mode=args.mode, time_chunk=args.time_chunk
+    )
+    print(f"{total} county-day wind speed rows saved to '{storage.table_path(args.output_file)}'.")
@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from county_index import SHAPEFILE, load_county_index
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+'''
+    This script is used for building the NCEP reanalysis grid cell -> county (FIPS) mapping used by the wind stage.
+
+    The NCEP surface grid is a fixed 2.5° lattice (lat 90 to -90, lon 0 to 357.5), the same every day and every year,
+    so the counties of its cells are computed once and saved as a small CSV (cell, lat, lon, fips, weight), next to
+    a .json sidecar holding a hash of the shapefile it was built from (the mapping is rebuilt when it changes):
+    - centroid: the county the cell centre falls within, weight 1 (what the per-row spatial join used to give)
+    - area: every county the cell overlaps, weight = share of the county's area covered by that cell, so the
+      weights of a county sum to 1 and its wind is the area-weighted mean of the cells over it
+
+    extract_county_wind.py turns the mapping into a sparse county x cell weight matrix, and assign_counties() tags
+    grid-level rows with their counties by a vectorized gather on the cell index.
+
+    Example: python wind_grid_mapping.py --mode area --rebuild
+'''
+
+GRID_STEP = 2.5
+N_LAT = 73   # 90 to -90
+N_LON = 144  # 0 to 357.5
+N_CELLS = N_LAT * N_LON
+
+# Bounds of the US subset of the grid (Hawaii to Northern Alaska, Aleutian Islands to Maine)
+LAT_MIN, LAT_MAX = 18.0, 72.0
+LON_MIN, LON_MAX = -180.0, -66.0
+
+MODES = ('centroid', 'area')
+# Equal-area projection used to measure the overlaps in area mode
+EQUAL_AREA_CRS = 'ESRI:102003'
+
+
+def mapping_file(mode):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), f'wind_grid_fips_{mode}.csv')
+
+
+def mapping_hash(mode, shapefile):
+    """Hash of the mode, the grid and the path, size and modification time of the shapefile and its .dbf"""
+    digest = hashlib.sha256(f'{mode}:{GRID_STEP}:{LAT_MIN}:{LAT_MAX}:{LON_MIN}:{LON_MAX}'.encode())
+    for path in (shapefile, os.path.splitext(shapefile)[0] + '.dbf'):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()
+
+
+def cell_index(lat, lon):
+    """Index of the NCEP grid cell of each (lat, lon); lon may be in -180..180 or 0..360"""
+    row = np.rint((90.0 - np.asarray(lat, dtype=np.float64)) / GRID_STEP).astype(np.int64)
+    col = np.rint((np.asarray(lon, dtype=np.float64) % 360.0) / GRID_STEP).astype(np.int64) % N_LON
+    return row * N_LON + col
+
+
+def us_grid_cells():
+    """Cell index, centre lat and centre lon (-180..180) of the grid cells inside the US bounds"""
+    lats = 90.0 - GRID_STEP * np.arange(N_LAT)
+    lons = GRID_STEP * np.arange(N_LON)
+    lat, lon = np.meshgrid(lats, lons, indexing='ij')
+    lat, lon = lat.ravel(), ((lon.ravel() + 180) % 360) - 180
+    inside = (lat >= LAT_MIN) & (lat <= LAT_MAX) & (lon >= LON_MIN) & (lon <= LON_MAX)
+    return pd.DataFrame({'cell': cell_index(lat[inside], lon[inside]), 'lat': lat[inside], 'lon': lon[inside]})
+
+
+def build_mapping(mode='centroid', shapefile=SHAPEFILE):
+    """
+    Map the US grid cells to counties.
+
+    Parameters:
+    -----------
+    mode : str
+        'centroid' (county of the cell centre) or 'area' (every overlapped county, area weighted)
+    shapefile : str
+        County boundaries with a GEOID column
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Columns cell, lat, lon, fips, weight, sorted by cell; cells over no county are left out
+    """
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+
+    cells = us_grid_cells()
+    counties = load_county_index(shapefile)
+
+    if mode == 'centroid':
+        mapping = cells.assign(GEOID=counties.points_to_geoid(cells['lon'], cells['lat']), weight=1.0)
+        mapping = mapping.dropna(subset=['GEOID'])
+    else:
+        half = GRID_STEP / 2
+        boxes = [
+            box(max(lon - half, -180.0), lat - half, min(lon + half, 180.0), lat + half)
+            for lat, lon in zip(cells['lat'], cells['lon'])
+        ]
+        cell_gdf = gpd.GeoDataFrame(cells, geometry=boxes, crs="EPSG:4326").to_crs(EQUAL_AREA_CRS)
+        county_gdf = counties.to_geodataframe()[['GEOID', 'geometry']].to_crs(EQUAL_AREA_CRS)
+        pieces = gpd.overlay(cell_gdf, county_gdf, how='intersection', keep_geom_type=True)
+        pieces['area'] = pieces.geometry.area
+        pieces = pieces[pieces['area'] > 0]
+        pieces['weight'] = pieces['area'] / pieces.groupby('GEOID')['area'].transform('sum')
+        mapping = pd.DataFrame(pieces[['cell', 'lat', 'lon', 'GEOID', 'weight']])
+
+    mapping = mapping.rename(columns={'GEOID': 'fips'})
+    return mapping.sort_values(['cell', 'fips'], kind='stable').reset_index(drop=True)
+
+
+def load_mapping(mode='centroid', shapefile=SHAPEFILE, rebuild=False):
+    """
+    The saved mapping of mode, built and saved first if it does not exist yet, was built from another shapefile
+    (or a changed one, see mapping_hash()), or rebuild is set
+    """
+    path = mapping_file(mode)
+    meta_file = path + '.json'
+    key = mapping_hash(mode, shapefile)
+    if os.path.exists(path) and os.path.exists(meta_file) and not rebuild:
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta.get('hash') == key:
+            return pd.read_csv(path, dtype={'fips': str})
+        logging.info(f"{path} was built from another or a changed shapefile")
+    logging.info(f"Building the {mode} grid cell -> county mapping...")
+    mapping = build_mapping(mode, shapefile)
+    mapping.to_csv(path, index=False)
+    with open(meta_file, 'w') as f:
+        json.dump({'hash': key, 'shapefile': os.path.abspath(shapefile), 'rows': len(mapping)}, f, indent=2)
+    logging.info(f"Saved {len(mapping)} cell-county pairs over {mapping['cell'].nunique()} cells to {path}")
+    return mapping
+
+
+def assign_counties(df, mapping, lat_col='latitude', lon_col='longitude'):
+    """
+    Tag grid-level rows with the counties of their cell by a gather on the cell index, without geometry.
+
+    A row is repeated once per county its cell maps to (once in centroid mode) and gets that county's fips and
+    weight; rows whose cell is over no county are dropped.
+    """
+    mapping = mapping.sort_values('cell', kind='stable')
+    counts = np.bincount(mapping['cell'].values, minlength=N_CELLS)
+    starts = np.cumsum(counts) - counts
+
+    cells = cell_index(df[lat_col].values, df[lon_col].values)
+    repeats = counts[cells]
+    rows = np.repeat(np.arange(len(df)), repeats)
+    offset = np.arange(len(rows)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    pairs = starts[cells[rows]] + offset
+
+    out = df.iloc[rows].reset_index(drop=True)
+    out['fips'] = mapping['fips'].values[pairs]
+    out['weight'] = mapping['weight'].values[pairs]
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the NCEP grid cell -> county mapping")
+    parser.add_argument('--mode', choices=MODES, default='centroid')
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild even if the mapping file exists")
+    args = parser.parse_args()
+
+    mapping = load_mapping(args.mode, rebuild=args.rebuild)
+    print(f"{len(mapping)} cell-county pairs, {mapping['fips'].nunique()} counties, saved to {mapping_file(args.mode)}")
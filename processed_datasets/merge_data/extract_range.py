@@ -0,0 +1,135 @@
+import argparse
+import os
+import sys
+import logging
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../preprocess'))
+import storage
+from post_merge import PARTITION_DIR, partition_years, training_file
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+'''
+    This script is used for extracting a range of years or dates, optionally for some FIPS codes only, from the
+    cleaned year partitions written by post_merge.py (or from one table, e.g. merged_data, with --input).
+
+    Only the partitions of the years in the range are opened, and the date and FIPS filters are pushed down to
+    Parquet, which skips the row groups (about a month each) outside the range. The cost follows the size of the
+    slice, not of the whole 1992-2020 archive.
+
+    Examples:
+        python extract_range.py --years 2018 2020
+        python extract_range.py --start 2020-06-01 --end 2020-09-30 --fips 6037 6059 --output summer_2020.csv
+        python extract_range.py --years 2018 2020 --input merged_data --output merged_data_2020.csv
+'''
+
+
+def date_range(years=None, start=None, end=None):
+    """
+    (first day, last day) of a range given as years (start year, end year) or as start / end dates.
+
+    A missing start or end date leaves that side of the range open (None).
+    """
+    if years is not None:
+        return pd.Timestamp(f'{years[0]}-01-01'), pd.Timestamp(f'{years[-1]}-12-31')
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    if start is not None and end is not None and start > end:
+        raise ValueError(f"The start date {start.date()} is after the end date {end.date()}")
+    return start, end
+
+
+def range_filters(start=None, end=None, fips=None):
+    """pyarrow filters (see storage.read_table()) of the rows between start and end, of the given FIPS codes"""
+    filters = []
+    if start is not None:
+        filters.append(('date', '>=', start))
+    if end is not None:
+        filters.append(('date', '<=', end))
+    if fips is not None:
+        filters.append(('fips', 'in', sorted({int(f) for f in fips})))
+    return filters or None
+
+
+def range_partitions(start=None, end=None, partition_dir=PARTITION_DIR):
+    """Files of the year partitions overlapping [start, end]"""
+    years = partition_years(partition_dir)
+    if not years:
+        raise FileNotFoundError(f"No year partitions in {partition_dir}, run post_merge.py first")
+    return [
+        path for year, path in sorted(years.items())
+        if (start is None or year >= start.year) and (end is None or year <= end.year)
+    ]
+
+
+def extract_range(start=None, end=None, fips=None, partition_dir=PARTITION_DIR, input_file=None, columns=None,
+                  dates='datetime'):
+    """
+    Rows between start and end (inclusive), of the given FIPS codes.
+
+    Parameters:
+    -----------
+    start, end : pandas.Timestamp or None
+        First and last day of the range; None leaves that side open
+    fips : iterable of int, optional
+        FIPS codes to keep; all when not given
+    partition_dir : str
+        Directory of the year partitions of post_merge.py
+    input_file : str, optional
+        Read this table (see storage.py) instead of the partitions
+    columns : list of str, optional
+        Columns to load
+    dates : str
+        'datetime' or 'offset', as in storage.read_table()
+
+    Returns:
+    --------
+    pandas.DataFrame
+        The rows of the range, in the order of the partitions (by date and FIPS)
+    """
+    filters = range_filters(start, end, fips)
+    paths = [input_file] if input_file is not None else range_partitions(start, end, partition_dir)
+    logging.info(f"Reading {len(paths)} table(s): {', '.join(os.path.basename(path) for path in paths)}")
+
+    frames = [storage.read_table(path, columns=columns, dates=dates, filters=filters) for path in paths]
+    if not any(len(df) for df in frames):
+        logging.warning("No rows in the range")
+        return frames[0] if frames else pd.DataFrame()
+    return pd.concat([df for df in frames if len(df)], ignore_index=True)
+
+
+def default_output(years=None, start=None, end=None):
+    """CSV name of the extracted range; the training file names of post_merge.py for years"""
+    if years is not None:
+        return training_file(years[0], years[-1])
+    first = start.strftime('%Y%m%d') if start is not None else 'start'
+    last = end.strftime('%Y%m%d') if end is not None else 'end'
+    return f'cleaned_merged_data_{first}_{last}.csv'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract a range of years or dates from the year partitions")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--years', type=int, nargs='+', metavar='YEAR',
+                       help="A year, or the first and last years of the range")
+    group.add_argument('--start', help="First date of the range (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Last date of the range (YYYY-MM-DD)")
+    parser.add_argument('--fips', type=int, nargs='+', help="Only keep these FIPS codes")
+    parser.add_argument('--partition-dir', default=PARTITION_DIR, help="Directory of the year partitions")
+    parser.add_argument('--input', help="Read this table instead of the partitions, e.g. merged_data")
+    parser.add_argument('--columns', nargs='+', help="Only keep these columns")
+    parser.add_argument('--output', help="Output file, or table name without extension (see storage.py)")
+    args = parser.parse_args()
+    if args.years is not None and (len(args.years) > 2 or args.end is not None):
+        parser.error("--years takes one or two years and cannot be used with --end")
+
+    start, end = date_range(args.years, args.start, args.end)
+    df = extract_range(start, end, args.fips, args.partition_dir, args.input, args.columns)
+    output_file = storage.write_table(df, args.output or default_output(args.years, start, end))
+
+    print(f"{len(df)} rows saved to {output_file}")
+    if len(df) and 'date' in df.columns:
+        print(f"Date range: {df['date'].min().date()} to {df['date'].max().date()}")
+    if len(df) and 'fips' in df.columns:
+        print(f"FIPS codes: {df['fips'].nunique()}")
@@ -0,0 +1,171 @@
+import argparse
+import os
+import sys
+import logging
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../preprocess'))
+import schema
+import storage
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+'''
+    This script is used for merging TP, Fuel, Wind, and Wildfire data by FIPS and Date in one pass.
+
+    Every source is read once with dates as int32 day offsets, and (fips, date) is encoded as one int64 key,
+    day * FIPS_RANGE + fips, so sorting by key sorts by date then FIPS. Each source is sorted by its key and rows
+    with the same key are averaged. The join is an inner sorted merge-join: the TP keys are looked up in each other
+    source with a binary search (np.searchsorted), and only the keys found in all four are kept. The merged table
+    is written once, as merged_data (see storage.py); post_merge.py then removes the outliers and splits it by year.
+
+    Example: python merge_all.py --output merged_data
+'''
+
+# FIPS codes are below 100000, so day * FIPS_RANGE + fips is unique and orders by date, then FIPS
+FIPS_RANGE = 100_000
+
+TP_FILE = '../../processed_datasets/tp/fips_tp_no_na_averaged'
+FUEL_FILE = '../../processed_datasets/fuel/filled_fips_fuel_data'
+WIND_FILE = '../../processed_datasets/wind/filled_fips_wind_data'
+FIRE_FILE = '../../processed_datasets/wildfire/aggregated_daily_fire_size_filled'
+
+OUTPUT_COLUMNS = ['date', 'fmc', 'fips', 'tmax', 'tmin', 'prcp', 'wind_speed', 'fire_size', 'lat', 'lon']
+
+
+def encode_keys(fips, days):
+    """int64 (date, fips) keys of fips codes and int day offsets"""
+    return np.asarray(days, dtype=np.int64) * FIPS_RANGE + np.asarray(fips, dtype=np.int64)
+
+
+def decode_keys(keys):
+    """(fips as int32, day offsets as int32) of the keys"""
+    days, fips = np.divmod(keys, FIPS_RANGE)
+    return fips.astype(schema.FIPS_DTYPE), days.astype(schema.DAY_DTYPE)
+
+
+def keyed_source(df, columns):
+    """
+    Sorted unique keys of df and the values of `columns` at those keys.
+
+    Rows with the same (fips, date) are averaged, skipping NaN like groupby().mean().
+
+    Returns:
+    --------
+    keys : numpy.ndarray
+        Sorted unique int64 keys
+    values : dict
+        Column -> array aligned with keys
+    """
+    df = df.dropna(subset=['fips'])
+    keys = encode_keys(df['fips'].values, df['date'].values)
+    order = None if np.all(keys[1:] > keys[:-1]) else np.argsort(keys, kind='stable')
+    if order is not None:
+        keys = keys[order]
+
+    values = {col: df[col].values if order is None else df[col].values[order] for col in columns}
+
+    is_start = np.ones(len(keys), dtype=bool)
+    is_start[1:] = keys[1:] != keys[:-1]
+    if is_start.all():
+        return keys, values
+
+    # Average the rows of duplicated keys
+    starts = np.flatnonzero(is_start)
+    logging.info(f"Averaging {len(keys) - len(starts)} rows with duplicated (fips, date)")
+    for col, data in values.items():
+        observed = ~np.isnan(data)
+        sums = np.add.reduceat(np.where(observed, data, 0).astype(np.float64), starts)
+        counts = np.add.reduceat(observed.astype(np.int64), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values[col] = (sums / counts).astype(data.dtype)
+    return keys[starts], values
+
+
+def merge_join(sources):
+    """
+    Inner join of keyed sources (keys, values) on their keys.
+
+    The keys of the first source are looked up in every other source; returns the keys found in all of them and
+    the values of every source at those keys.
+    """
+    keys, values = sources[0]
+    found = np.ones(len(keys), dtype=bool)
+    positions = []
+    for other_keys, _ in sources[1:]:
+        if len(other_keys) == 0:
+            found[:] = False
+            positions.append(np.zeros(len(keys), dtype=np.int64))
+            continue
+        pos = np.searchsorted(other_keys, keys)
+        pos[pos == len(other_keys)] = 0
+        found &= other_keys[pos] == keys
+        positions.append(pos)
+
+    merged = {col: data[found] for col, data in values.items()}
+    for (_, other_values), pos in zip(sources[1:], positions):
+        pos = pos[found]
+        for col, data in other_values.items():
+            merged[col] = data[pos]
+    return keys[found], merged
+
+
+def merge_all(tp_file=TP_FILE, fuel_file=FUEL_FILE, wind_file=WIND_FILE, fire_file=FIRE_FILE,
+              output_file='merged_data', csv_export=None):
+    """
+    Merge the four sources on (fips, date) and write the merged table.
+
+    Parameters:
+    -----------
+    tp_file, fuel_file, wind_file, fire_file : str
+        Tables (see storage.py) of TP (tmin, prcp, tmax), fuel (fmc), wind (wind_speed) and wildfire (FIRE_SIZE,
+        lat, lon) data with fips and date
+    output_file : str
+        Table to write the merged data to
+    csv_export : bool, optional
+        Also write output_file as CSV; PIPELINE_CSV_EXPORT when not given
+
+    Returns:
+    --------
+    pandas.DataFrame
+        The merged data, sorted by date and FIPS, with dates as int32 day offsets
+    """
+    sources = []
+    for path, columns in [
+        (tp_file, ['tmax', 'tmin', 'prcp']),
+        (fuel_file, ['fmc']),
+        (wind_file, ['wind_speed']),
+        (fire_file, ['FIRE_SIZE', 'lat', 'lon']),
+    ]:
+        logging.info(f"Loading {path}...")
+        df = storage.read_table(path, columns=['fips', 'date'] + columns, dates='offset')
+        schema.report_memory(df, f"merge_all: {os.path.basename(path)}")
+        sources.append(keyed_source(df, columns))
+        del df
+
+    keys, values = merge_join(sources)
+    fips, days = decode_keys(keys)
+    logging.info(f"{len(keys)} (fips, date) rows in all four sources out of {len(sources[0][0])} TP rows")
+
+    merged_df = pd.DataFrame({'date': days, 'fips': fips, **values}).rename(columns={'FIRE_SIZE': 'fire_size'})
+    merged_df = merged_df[OUTPUT_COLUMNS]
+    schema.report_memory(merged_df, "merge_all: merged")
+
+    output_path = storage.write_table(merged_df, output_file, csv_export=csv_export)
+    logging.info(f"Merged data saved to '{output_path}'")
+    return merged_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge TP, fuel, wind and wildfire data by FIPS and date")
+    parser.add_argument('--tp', default=TP_FILE)
+    parser.add_argument('--fuel', default=FUEL_FILE)
+    parser.add_argument('--wind', default=WIND_FILE)
+    parser.add_argument('--fire', default=FIRE_FILE)
+    parser.add_argument('--output', default='merged_data', help="Output table (see storage.py)")
+    parser.add_argument('--csv', action='store_true', help="Also write merged_data.csv")
+    args = parser.parse_args()
+
+    merged_df = merge_all(args.tp, args.fuel, args.wind, args.fire, args.output, csv_export=True if args.csv else None)
+    print(merged_df.head())
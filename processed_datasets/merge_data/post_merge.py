@@ -0,0 +1,203 @@
+import argparse
+import glob
+import os
+import re
+import sys
+import logging
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../preprocess'))
+import schema
+import storage
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+'''
+    This script is used for the steps after the merge, in one streaming pass over merged_data:
+    - Remove the outliers: rows with fire_size above --max-fire-size (1000 by default) or without fire_size.
+    - Save the remaining rows partitioned by year, one table per year in cleaned_by_year/ (see storage.py), which
+      extract_range.py and the training scripts read.
+    - Save every merged row, outliers included, to one CSV per year in static/output_by_year/ for the backend.
+    - Optionally save the cleaned rows of a range of years as one CSV for training (--train-years), and all
+      cleaned rows as cleaned_merged_data.csv (--cleaned-csv).
+
+    merged_data is read --chunksize rows at a time and every chunk is routed to the outputs of its years, so each
+    row is read once and the whole table is never in memory.
+
+    Example: python post_merge.py --max-fire-size 1000 --train-years 2018 2020
+'''
+
+INPUT_FILE = 'merged_data'
+PARTITION_DIR = 'cleaned_by_year'
+PARTITION_NAME = 'cleaned_merged_data_{year}'
+STATIC_DIR = '../../static/output_by_year'
+STATIC_NAME = 'merged_data_{year}.csv'
+CLEANED_CSV = 'cleaned_merged_data.csv'
+# Rows are sorted by date, so a Parquet row group of the partitions holds about a month of every county and
+# extract_range.py only reads the months it needs
+PARTITION_ROW_GROUP = 100_000
+
+
+def training_file(start_year, end_year):
+    """CSV name of the training subset, as read by the training scripts"""
+    if start_year == end_year:
+        return f'cleaned_merged_data_{start_year}.csv'
+    return f'cleaned_merged_data_{start_year}_{end_year}.csv'
+
+
+def partition_files(partition_dir=PARTITION_DIR):
+    """(year, file) of every year partition file in partition_dir, in any storage format"""
+    pattern = re.compile(re.escape(PARTITION_NAME).replace(r'\{year\}', r'(\d{4})') + r'\.\w+')
+    files = []
+    for path in sorted(glob.glob(os.path.join(partition_dir, '*'))):
+        match = pattern.fullmatch(os.path.basename(path))
+        if match and os.path.splitext(path)[1] in storage.FORMATS.values():
+            files.append((int(match.group(1)), path))
+    return files
+
+
+def partition_years(partition_dir=PARTITION_DIR):
+    """{year: table file} of the year partitions in partition_dir, in the default format when there are several"""
+    years = {}
+    preferred = storage.FORMATS[storage.default_format()]
+    for year, path in partition_files(partition_dir):
+        if year not in years or path.endswith(preferred):
+            years[year] = path
+    return years
+
+
+def keep_rows(df, max_fire_size):
+    """Mask of the rows that are not outliers: fire_size at most max_fire_size (None keeps every fire_size)"""
+    if max_fire_size is None:
+        return np.ones(len(df), dtype=bool)
+    return (df['fire_size'] <= max_fire_size).values
+
+
+class YearRouter:
+    """One TableWriter per year, opened when the first row of that year arrives"""
+
+    def __init__(self, path_pattern, fmt=None, row_group_size=None):
+        self.path_pattern = path_pattern
+        self.fmt = fmt
+        self.row_group_size = row_group_size
+        self.writers = {}
+
+    def write(self, df, years):
+        for year in np.unique(years):
+            if year not in self.writers:
+                self.writers[year] = storage.TableWriter(
+                    self.path_pattern.format(year=year), self.fmt, row_group_size=self.row_group_size
+                )
+            self.writers[year].write(df[years == year])
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def abort(self):
+        for writer in self.writers.values():
+            writer.abort()
+
+
+def post_merge(input_file=INPUT_FILE, max_fire_size=1000, partition_dir=PARTITION_DIR, static_dir=STATIC_DIR,
+               train_years=None, cleaned_csv=None, chunksize=1_000_000):
+    """
+    Stream input_file once and write the cleaned year partitions, the static year CSVs and the optional subsets.
+
+    Parameters:
+    -----------
+    input_file : str
+        Merged table (see storage.py)
+    max_fire_size : float or None
+        Rows with a larger fire_size are outliers; None keeps every row with a fire_size
+    partition_dir : str
+        Directory of the cleaned year partitions
+    static_dir : str or None
+        Directory of the per-year CSVs of the backend (every merged row); None skips them
+    train_years : tuple of int, optional
+        (start, end) years of the cleaned rows saved as one training CSV, see training_file()
+    cleaned_csv : str, optional
+        Path to also save every cleaned row as one CSV
+    chunksize : int
+        Rows read at a time
+
+    Returns:
+    --------
+    dict
+        Rows read, outliers removed and cleaned rows per year
+    """
+    os.makedirs(partition_dir, exist_ok=True)
+    routers = [YearRouter(os.path.join(partition_dir, PARTITION_NAME), row_group_size=PARTITION_ROW_GROUP)]
+    if static_dir is not None:
+        os.makedirs(static_dir, exist_ok=True)
+        static_router = YearRouter(os.path.join(static_dir, STATIC_NAME))
+        routers.append(static_router)
+    writers = []
+    if train_years is not None:
+        train_writer = storage.TableWriter(training_file(*train_years))
+        writers.append(train_writer)
+    if cleaned_csv is not None:
+        cleaned_writer = storage.TableWriter(cleaned_csv)
+        writers.append(cleaned_writer)
+
+    stats = {'rows': 0, 'outliers': 0, 'years': {}}
+    try:
+        for chunk in storage.iter_table(input_file, chunksize=chunksize, dates='offset'):
+            years = schema.from_day_offset(chunk['date'].values).astype('datetime64[Y]').astype(int) + 1970
+            if static_dir is not None:
+                static_router.write(chunk, years)
+
+            keep = keep_rows(chunk, max_fire_size)
+            cleaned, years = chunk[keep], years[keep]
+            routers[0].write(cleaned, years)
+            if train_years is not None:
+                in_range = (years >= train_years[0]) & (years <= train_years[1])
+                train_writer.write(cleaned[in_range])
+            if cleaned_csv is not None:
+                cleaned_writer.write(cleaned)
+
+            stats['rows'] += len(chunk)
+            stats['outliers'] += int((~keep).sum())
+            for year, count in zip(*np.unique(years, return_counts=True)):
+                stats['years'][int(year)] = stats['years'].get(int(year), 0) + int(count)
+            logging.info(f"{stats['rows']} rows read, {stats['outliers']} outliers removed")
+    except BaseException:
+        for output in routers + writers:
+            output.abort()
+        raise
+    for output in routers + writers:
+        output.close()
+
+    # Drop the partitions of years that are no longer in the merged data, or of another format
+    written = {os.path.abspath(writer.path) for writer in routers[0].writers.values()}
+    for _, path in partition_files(partition_dir):
+        if os.path.abspath(path) not in written:
+            logging.info(f"Removing the stale partition {path}")
+            os.remove(path)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove outliers from merged_data and split it by year")
+    parser.add_argument('--input', default=INPUT_FILE, help="Merged table (see storage.py)")
+    parser.add_argument('--max-fire-size', type=float, default=1000, help="Rows with a larger fire_size are removed")
+    parser.add_argument('--keep-outliers', action='store_true', help="Do not remove any row by fire_size")
+    parser.add_argument('--partition-dir', default=PARTITION_DIR, help="Directory of the cleaned year partitions")
+    parser.add_argument('--static-dir', default=STATIC_DIR, help="Directory of the per-year CSVs of the backend")
+    parser.add_argument('--no-static', action='store_true', help="Do not write the per-year CSVs of the backend")
+    parser.add_argument('--train-years', type=int, nargs=2, metavar=('START', 'END'),
+                        help="Also save the cleaned rows of these years as one training CSV")
+    parser.add_argument('--cleaned-csv', nargs='?', const=CLEANED_CSV, default=None,
+                        help=f"Also save every cleaned row as one CSV (default name {CLEANED_CSV})")
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help="Rows read at a time")
+    args = parser.parse_args()
+
+    stats = post_merge(
+        args.input, None if args.keep_outliers else args.max_fire_size, args.partition_dir,
+        None if args.no_static else args.static_dir, args.train_years, args.cleaned_csv, args.chunksize
+    )
+    kept = stats['rows'] - stats['outliers']
+    print(f"{stats['rows']} merged rows, {stats['outliers']} outliers removed, {kept} cleaned rows in "
+          f"{len(stats['years'])} year partitions")
+    if args.train_years is not None:
+        print(f"Training subset saved to {training_file(*args.train_years)}")
@@ -0,0 +1,385 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preprocess'))
+from storage import csv_export_enabled, default_format, table_path
+
+'''
+    This script is used for running the data pipeline of the README (preprocess -> merge) as one command.
+
+    - Every stage declares the files it reads and writes (paths relative to the repository root), and the stages it
+      depends on are the ones writing its inputs.
+    - A stage is skipped when the content hashes of its script, arguments and inputs are the same as in its last
+      successful run and its outputs are unchanged. The hashes are kept in .pipeline_cache.json, and a file is only
+      re-hashed when its size or modification time changed.
+    - A stage whose inputs are missing but whose outputs exist keeps them (the raw downloads are large and often
+      deleted once processed).
+    - Stages whose dependencies are done run in parallel (--jobs), each as a subprocess in the directory its
+      relative paths assume, so the TP, wind, fuel and wildfire branches run side by side before the merge stages.
+    - The output of every stage goes to pipeline_logs/<stage>.log, and a timing and cache-hit summary is printed at
+      the end.
+    - The tables handed between stages are Parquet files (preprocess/storage.py). PIPELINE_TABLE_FORMAT=feather or
+      csv switches the format and PIPELINE_CSV_EXPORT=1 writes a CSV copy of every table; the stages inherit both.
+
+    Example: python run_pipeline.py --jobs 4
+             python run_pipeline.py --dry-run
+             python run_pipeline.py --force fuel_fill
+             PIPELINE_TABLE_FORMAT=feather python run_pipeline.py
+'''
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.path.join(ROOT, '.pipeline_cache.json')
+LOG_DIR = os.path.join(ROOT, 'pipeline_logs')
+
+SHAPEFILE = 'preprocess/tp/cb_2022_us_county_500k/cb_2022_us_county_500k.shp'
+ALL_FIPS = 'preprocess/all_fips_code.csv'
+SCHEMA = 'preprocess/schema.py'
+GAP_FILL = 'preprocess/gap_fill.py'
+COUNTY_INDEX = 'preprocess/county_index.py'
+STORAGE = 'preprocess/storage.py'
+
+
+def table(path):
+    """File of the pipeline table `path` (no extension) in the configured format, see preprocess/storage.py"""
+    return table_path(path)
+
+
+class Stage:
+    """One step of the pipeline: a script run in cwd, or a copy of a file to where the next step reads it"""
+
+    def __init__(self, name, script=None, cwd=None, args=(), inputs=(), outputs=(), copy=None):
+        self.name = name
+        self.script = script
+        self.cwd = cwd
+        self.args = list(args)
+        self.copy = copy
+        self.inputs = list(inputs) + ([copy[0]] if copy else [])
+        self.outputs = list(outputs) + ([copy[1]] if copy else [])
+        self.code = [os.path.join(cwd, script)] if script else []
+
+    def run(self, log_file):
+        if self.copy:
+            src, dst = (os.path.join(ROOT, path) for path in self.copy)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(src, dst + '.tmp')
+            os.replace(dst + '.tmp', dst)
+            return 0
+        with open(log_file, 'w') as log:
+            return subprocess.run(
+                [sys.executable, self.script] + self.args, cwd=os.path.join(ROOT, self.cwd),
+                stdout=log, stderr=subprocess.STDOUT
+            ).returncode
+
+
+STAGES = [
+    Stage('fips_codes', 'extract_fips.py', 'preprocess',
+          inputs=['datasets/2024_Gaz_counties_national.txt'], outputs=[ALL_FIPS]),
+
+    # TP branch
+    Stage('tp_stations', 'filter_us_station.py', 'datasets/tp',
+          inputs=['datasets/tp/ghcnd-stations.csv'], outputs=['datasets/tp/filtered_us_stations.csv']),
+    Stage('tp_filter', 'filter_us_tp.py', 'preprocess/tp', args=['--overwrite'],
+          inputs=['datasets/tp/[0-9][0-9][0-9][0-9].csv*'], outputs=['preprocess/tp/filtered_us_tp']),
+    Stage('tp_lat_long', 'add_lat_long_to_tp.py', 'preprocess/tp',
+          inputs=['datasets/tp/filtered_us_stations.csv', 'preprocess/tp/filtered_us_tp',
+                  'preprocess/tp/filter_us_tp.py', STORAGE, SCHEMA],
+          outputs=[table('preprocess/tp/lat_long_tp_data')]),
+    Stage('tp_fips', 'add_fips_to_tp.py', 'preprocess/tp',
+          inputs=['datasets/tp/filtered_us_stations.csv', table('preprocess/tp/lat_long_tp_data'), SHAPEFILE,
+                  'preprocess/fips_lookup.py', COUNTY_INDEX, STORAGE, SCHEMA],
+          outputs=[table('preprocess/tp/fips_tp_data')]),
+    Stage('tp_no_na', 'filter_without_na.py', 'preprocess/tp',
+          inputs=[table('preprocess/tp/fips_tp_data'), STORAGE, SCHEMA],
+          outputs=[table('preprocess/tp/fips_tp_no_na_averaged')]),
+    Stage('tp_fill', 'fill_missing_value.py', 'preprocess/tp',
+          inputs=[table('preprocess/tp/fips_tp_no_na_averaged'), ALL_FIPS, GAP_FILL, STORAGE, SCHEMA],
+          outputs=[table('preprocess/tp/filled_fips_tp_data')]),
+    Stage('tp_publish', copy=(table('preprocess/tp/fips_tp_no_na_averaged'),
+                              table('processed_datasets/tp/fips_tp_no_na_averaged'))),
+
+    # Wind branch
+    Stage('wind_extract', 'extract_county_wind.py', 'preprocess/wind',
+          inputs=['datasets/wind/*.nc', SHAPEFILE, 'preprocess/wind/wind_grid_mapping.py', COUNTY_INDEX,
+                  STORAGE, SCHEMA],
+          outputs=[table('preprocess/wind/fips_wind_no_na_averaged')]),
+    Stage('wind_fill', 'assign_missing_wind.py', 'preprocess/wind',
+          inputs=[table('preprocess/wind/fips_wind_no_na_averaged'), ALL_FIPS, GAP_FILL, STORAGE, SCHEMA],
+          outputs=[table('preprocess/wind/filled_fips_wind_data')]),
+    Stage('wind_publish', copy=(table('preprocess/wind/filled_fips_wind_data'),
+                                table('processed_datasets/wind/filled_fips_wind_data'))),
+
+    # Fuel branch
+    Stage('fuel_filter', 'filter_fuel.py', 'preprocess/fuel',
+          inputs=['datasets/fuel/field_sample.csv'],
+          outputs=['preprocess/fuel/filtered_data_with_date_and_average.csv']),
+    Stage('fuel_lat_long', 'add_lat_long_fuel.py', 'preprocess/fuel',
+          inputs=['preprocess/fuel/filtered_data_with_date_and_average.csv', 'datasets/fuel/site_metadata.csv'],
+          outputs=['preprocess/fuel/fuel_data_with_lat_long.csv']),
+    Stage('fuel_fips', 'add_fips_fuel.py', 'preprocess/fuel',
+          inputs=['preprocess/fuel/fuel_data_with_lat_long.csv', SHAPEFILE, 'preprocess/fips_lookup.py', COUNTY_INDEX,
+                  STORAGE, SCHEMA],
+          outputs=[table('preprocess/fuel/fips_fuel_data')]),
+    # The filled fuel data is also exported as CSV for the real-time merge and the forecast scheduler
+    Stage('fuel_fill', 'fill_missing_value.py', 'preprocess/fuel',
+          inputs=[table('preprocess/fuel/fips_fuel_data'), ALL_FIPS, GAP_FILL, STORAGE, SCHEMA],
+          outputs=[table('preprocess/fuel/filled_fips_fuel_data'),
+                   'preprocess/fuel/filled_fips_fuel_data.csv']),
+    Stage('fuel_publish', copy=(table('preprocess/fuel/filled_fips_fuel_data'),
+                                table('processed_datasets/fuel/filled_fips_fuel_data'))),
+
+    # Wildfire branch
+    Stage('wildfire_extract', 'extract_wild_fire_data.py', 'preprocess/wildfire',
+          inputs=['datasets/wildfire/FPA_FOD_20221014.sqlite', SHAPEFILE, COUNTY_INDEX, STORAGE, SCHEMA],
+          outputs=[table('preprocess/wildfire/wildfire')]),
+    Stage('wildfire_avg', 'find_avg_wildfire.py', 'preprocess/wildfire',
+          inputs=[table('preprocess/wildfire/wildfire'), STORAGE, SCHEMA],
+          outputs=[table('preprocess/wildfire/aggregated_daily_fire_size')]),
+    Stage('wildfire_fill', 'fill_missing_value.py', 'preprocess/wildfire',
+          inputs=[table('preprocess/wildfire/aggregated_daily_fire_size'), STORAGE, SCHEMA],
+          outputs=[table('preprocess/wildfire/aggregated_daily_fire_size_filled')]),
+    Stage('wildfire_publish', copy=(table('preprocess/wildfire/aggregated_daily_fire_size_filled'),
+                                    table('processed_datasets/wildfire/aggregated_daily_fire_size_filled'))),
+
+    # Merge stage, then one pass over merged_data for the cleaned year partitions, the backend's year CSVs and the
+    # cleaned CSV read by training/correlation.py
+    Stage('merge_all', 'merge_all.py', 'processed_datasets/merge_data',
+          inputs=[table('processed_datasets/tp/fips_tp_no_na_averaged'),
+                  table('processed_datasets/fuel/filled_fips_fuel_data'),
+                  table('processed_datasets/wind/filled_fips_wind_data'),
+                  table('processed_datasets/wildfire/aggregated_daily_fire_size_filled'), STORAGE, SCHEMA],
+          outputs=[table('processed_datasets/merge_data/merged_data')]),
+    Stage('post_merge', 'post_merge.py', 'processed_datasets/merge_data', args=['--cleaned-csv'],
+          inputs=[table('processed_datasets/merge_data/merged_data'), STORAGE, SCHEMA],
+          outputs=['processed_datasets/merge_data/cleaned_by_year', 'static/output_by_year',
+                   'processed_datasets/merge_data/cleaned_merged_data.csv']),
+]
+
+
+class FileHasher:
+    """sha256 of files, reusing the recorded hash while a file's size and modification time are unchanged"""
+
+    def __init__(self, records):
+        self.records = records
+        self.lock = threading.Lock()
+
+    def file(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            record = self.records.get(path)
+        if record and record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns:
+            return record['sha256']
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        with self.lock:
+            self.records[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha.hexdigest()}
+        return sha.hexdigest()
+
+    def path(self, pattern):
+        """Hash of a file, of every file under a directory, or of every file matching a glob pattern; None if missing"""
+        full = os.path.join(ROOT, pattern)
+        if os.path.isdir(full):
+            files = sorted(
+                os.path.join(directory, name) for directory, _, names in os.walk(full) for name in names
+                if not name.endswith('.tmp')
+            )
+        elif glob.has_magic(pattern):
+            files = sorted(glob.glob(full))
+        else:
+            files = [full] if os.path.exists(full) else []
+        if not files:
+            return None
+        sha = hashlib.sha256()
+        for path in files:
+            sha.update(os.path.relpath(path, ROOT).encode())
+            sha.update(self.file(path).encode())
+        return sha.hexdigest()
+
+
+def dependencies(stages):
+    """Names of the stages writing the inputs of each stage"""
+    writers = {output: stage.name for stage in stages for output in stage.outputs}
+    return {stage.name: {writers[path] for path in stage.inputs if path in writers} for stage in stages}
+
+
+def stage_key(stage, hasher):
+    """Hash of the stage's script, arguments and inputs, or raise FileNotFoundError naming a missing input"""
+    # The table format and CSV export setting change what a stage writes
+    settings = [stage.script, stage.cwd, stage.args, default_format(), csv_export_enabled()]
+    sha = hashlib.sha256(json.dumps(settings).encode())
+    for path in stage.code + stage.inputs:
+        digest = hasher.path(path)
+        if digest is None:
+            raise FileNotFoundError(f"missing input {path}")
+        sha.update(f'{path}:{digest}'.encode())
+    return sha.hexdigest()
+
+
+def run_stage(stage, record, hasher, force=False, dry_run=False, upstream_changed=False):
+    """
+    Run one stage unless it is cached.
+
+    record is the stage's entry of the cache from its last successful run (None if it never ran). Returns
+    (status, seconds, detail, new record); the new record is None unless the stage ran, and the caller stores it,
+    so the worker threads never write to the cache.
+    """
+    start = time.perf_counter()
+    outputs = {path: hasher.path(path) for path in stage.outputs}
+    try:
+        key = stage_key(stage, hasher)
+    except FileNotFoundError as e:
+        # Raw inputs are often deleted once processed (they are large), the outputs can still be used
+        if all(digest is not None for digest in outputs.values()):
+            return 'kept', time.perf_counter() - start, f"{e}, using the existing outputs", None
+        return 'failed', 0.0, str(e), None
+
+    if dry_run and (force or upstream_changed):
+        return 'would run', 0.0, '', None
+    if not force and record and record['key'] == key and record['outputs'] == outputs:
+        return 'cached', time.perf_counter() - start, '', None
+    if dry_run:
+        return 'would run', 0.0, '', None
+
+    log_file = os.path.join(LOG_DIR, f'{stage.name}.log')
+    returncode = stage.run(log_file)
+    if returncode != 0:
+        return ('failed', time.perf_counter() - start,
+                f"exit code {returncode}, see {os.path.relpath(log_file, ROOT)}", None)
+
+    outputs = {path: hasher.path(path) for path in stage.outputs}
+    missing = [path for path, digest in outputs.items() if digest is None]
+    if missing:
+        return 'failed', time.perf_counter() - start, f"did not write {', '.join(missing)}", None
+    return 'ran', time.perf_counter() - start, '', {'key': key, 'outputs': outputs}
+
+
+def load_cache():
+    if os.path.exists(CACHE_FILE):
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    return {'files': {}, 'stages': {}}
+
+
+def save_cache(cache, lock):
+    """
+    Save a copy of the cache taken under lock (the FileHasher's), as running stages keep adding file hashes.
+    The records themselves are replaced, never modified, so copying the two dicts is enough.
+    """
+    with lock:
+        snapshot = {'files': dict(cache['files']), 'stages': dict(cache['stages'])}
+    with open(CACHE_FILE + '.tmp', 'w') as f:
+        json.dump(snapshot, f, indent=1, sort_keys=True)
+    os.replace(CACHE_FILE + '.tmp', CACHE_FILE)
+
+
+def run_pipeline(stages=STAGES, jobs=4, force=(), dry_run=False):
+    """
+    Run the stages in dependency order, independent ones in parallel.
+
+    Parameters:
+    -----------
+    stages : list of Stage
+    jobs : int
+        Maximum number of stages running at the same time
+    force : iterable of str
+        Names of stages to run even if they are cached (the stages after them rerun if their outputs change)
+    dry_run : bool
+        Only report which stages are cached and which would run
+
+    Returns:
+    --------
+    list of dict
+        stage, status (ran, cached, kept, would run, failed, skipped), seconds and detail, in completion order
+    """
+    os.makedirs(LOG_DIR, exist_ok=True)
+    cache = load_cache()
+    hasher = FileHasher(cache['files'])
+    deps = dependencies(stages)
+    by_name = {stage.name: stage for stage in stages}
+    force = set(force)
+
+    done, failed, changed, results = set(), set(), set(), []
+    pending = [stage.name for stage in stages]
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for name in list(pending):
+                if deps[name] & failed:
+                    pending.remove(name)
+                    failed.add(name)
+                    results.append({'stage': name, 'status': 'skipped', 'seconds': 0.0,
+                                    'detail': f"after failed {', '.join(sorted(deps[name] & failed))}"})
+                elif deps[name] <= done:
+                    pending.remove(name)
+                    running[executor.submit(
+                        run_stage, by_name[name], cache['stages'].get(name), hasher, name in force, dry_run,
+                        bool(deps[name] & changed)
+                    )] = name
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                status, seconds, detail, record = future.result()
+                if record is not None:
+                    with hasher.lock:
+                        cache['stages'][name] = record
+                (failed if status == 'failed' else done).add(name)
+                if status in ('ran', 'would run'):
+                    changed.add(name)
+                results.append({'stage': name, 'status': status, 'seconds': seconds, 'detail': detail})
+                logging.info(f"{name}: {status} in {seconds:.1f}s {detail}".rstrip())
+            if not dry_run:
+                save_cache(cache, hasher.lock)
+    return results
+
+
+def print_summary(results, wall_seconds):
+    print(f"\n{'stage':<26}{'status':<12}{'seconds':>9}  detail")
+    for result in results:
+        print(f"{result['stage']:<26}{result['status']:<12}{result['seconds']:>9.1f}  {result['detail']}")
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    cached = counts.get('cached', 0)
+    print(f"\n{len(results)} stages: " + ', '.join(f"{n} {status}" for status, n in sorted(counts.items())) +
+          f" (cache hit rate {cached / len(results):.0%}), {wall_seconds:.1f}s wall clock")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the preprocessing and merge pipeline, skipping unchanged stages")
+    parser.add_argument('--jobs', type=int, default=4, help="Stages to run at the same time")
+    parser.add_argument('--force', nargs='+', default=[], metavar='STAGE', help="Run these stages even if cached")
+    parser.add_argument('--dry-run', action='store_true', help="Only show which stages are cached or would run")
+    parser.add_argument('--list', action='store_true', help="List the stages with their dependencies")
+    args = parser.parse_args()
+
+    if args.list:
+        deps = dependencies(STAGES)
+        for stage in STAGES:
+            print(f"{stage.name:<26}after: {', '.join(sorted(deps[stage.name])) or '-'}")
+        sys.exit(0)
+
+    unknown = set(args.force) - {stage.name for stage in STAGES}
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    start = time.perf_counter()
+    results = run_pipeline(jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    print_summary(results, time.perf_counter() - start)
+    sys.exit(1 if any(result['status'] == 'failed' for result in results) else 0)
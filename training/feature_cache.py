@@ -0,0 +1,302 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../preprocess'))
+import storage
+
+'''
+    Cache of the feature matrices of the training scripts.
+
+    Building the matrix (parsing the CSV and its dates, the calendar features, dropna / drop_duplicates, the
+    train/test split and the scaling) is done once per (source file content, feature spec). The result is saved
+    under CACHE_DIR/<key>/ as .npy files:
+    - X.npy: float32 features, train rows first then test rows, so X_train and X_test are slices of one memmap
+    - y.npy: float32 target, in the same order
+    - days.npy: int32 date of each row (days since 1970-01-01), in the same order, for temporal_cv.py
+    - train_idx.npy / test_idx.npy: rows of the cleaned source frame of each split, as train_test_split() gives them
+    - scaler.pkl: the StandardScaler fitted on the train rows (when scale=True), for the saved model artifacts
+
+    split='time' holds out the last test_size of the days instead of random rows, leaving gap_days out between
+    the train and test days; the rows of each split are then in date order.
+
+    Later runs memory-map the .npy files, so loading takes milliseconds and processes training on the same
+    matrix share its pages. Each entry is built under an exclusive lock (CACHE_DIR/<key>.lock) in a temporary
+    directory of its own, so processes starting together on a cold cache build it once: the others wait and load
+    the finished entry. The source content hash is remembered by file size and modification time, so an
+    unchanged source is not read again either.
+
+    Example:
+        data = load_features("../processed_datasets/merge_data/cleaned_merged_data_2020.csv")
+        model.fit(data.X_train, data.y_train)
+'''
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feature_cache')
+HASHES_FILE = 'source_hashes.json'
+HASHES_LOCK = 'source_hashes.lock'
+# Bump when the way the matrix is built changes, so older cache entries are not used
+CACHE_VERSION = 2
+
+DATE_FEATURES = ['year', 'month', 'day', 'dayofyear']
+FEATURES = ["fmc", "fips", "tmax", "tmin", "prcp", "wind_speed", "lat", "lon", "year", "month", "day", "dayofyear"]
+TARGET = 'fire_size'
+
+
+class FeatureMatrix:
+    """Cached X / y of a source, split in train and test rows; the arrays are read-only memmaps"""
+
+    def __init__(self, path, X, y, days, train_idx, test_idx, scaler, meta):
+        self.path = path
+        self.X = X
+        self.y = y
+        self.days = days
+        self.train_idx = train_idx
+        self.test_idx = test_idx
+        self.scaler = scaler
+        self.meta = meta
+        self.feature_names = meta['features']
+        n_train = len(train_idx)
+        self.X_train, self.X_test = X[:n_train], X[n_train:]
+        self.y_train, self.y_test = y[:n_train], y[n_train:]
+        self.days_train, self.days_test = days[:n_train], days[n_train:]
+
+    def frame(self):
+        """X and y as one DataFrame (scaled features when the spec scales), e.g. for df.corr()"""
+        df = pd.DataFrame(np.asarray(self.X), columns=self.feature_names)
+        df[self.meta['target']] = np.asarray(self.y)
+        return df
+
+    def summary(self):
+        meta = self.meta
+        split = f"{len(self.train_idx)} train / {len(self.test_idx)} test"
+        if meta['split'] == 'time':
+            split += (f" (test from {np.datetime64(int(self.days_test.min()), 'D')}, "
+                      f"{meta['dropped_gap']} rows of the {meta['gap_days']} gap days left out)")
+        return (f"{meta['rows']} rows ({meta['rows_source']} in {os.path.basename(meta['source'])}, "
+                f"{meta['dropped_na']} with NaN and {meta['dropped_duplicates']} duplicates dropped), {split}")
+
+
+@contextmanager
+def cache_lock(lock_path):
+    """Exclusive lock on lock_path, waiting for the process holding it (like forecast_scheduler.RunLock, blocking)"""
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _source_file(source):
+    """File of a source given as a CSV path or a table name (see storage.py)"""
+    return source if os.path.exists(source) else storage.find_table(source)[0]
+
+
+def _read_hashes(hashes_path):
+    if not os.path.exists(hashes_path):
+        return {}
+    with open(hashes_path) as f:
+        return json.load(f)
+
+
+def source_hash(path, cache_dir=CACHE_DIR):
+    """sha256 of a file, reused while its size and modification time are unchanged"""
+    hashes_path = os.path.join(cache_dir, HASHES_FILE)
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    record = _read_hashes(hashes_path).get(key)
+    if record and record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns:
+        return record['sha256']
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    # Read-modify-write under the lock, so concurrent processes do not drop each other's records
+    with cache_lock(os.path.join(cache_dir, HASHES_LOCK)):
+        hashes = _read_hashes(hashes_path)
+        hashes[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha.hexdigest()}
+        with tempfile.NamedTemporaryFile('w', dir=cache_dir, suffix='.tmp', delete=False) as f:
+            json.dump(hashes, f, indent=2)
+        os.replace(f.name, hashes_path)
+    return sha.hexdigest()
+
+
+def feature_spec(features=FEATURES, target=TARGET, test_size=0.2, random_state=42, scale=True,
+                 drop_duplicates=True, split='random', gap_days=0):
+    """The options the matrix depends on, as a JSON-serializable dict"""
+    if split not in ('random', 'time'):
+        raise ValueError(f"Unknown split {split!r}, expected 'random' or 'time'")
+    return {'version': CACHE_VERSION, 'features': list(features), 'target': target, 'test_size': test_size,
+            'random_state': random_state, 'scale': scale, 'drop_duplicates': drop_duplicates, 'split': split,
+            'gap_days': gap_days if split == 'time' else 0}
+
+
+def cache_key(source_sha, spec):
+    return hashlib.sha256(json.dumps([source_sha, spec], sort_keys=True).encode()).hexdigest()[:24]
+
+
+def build_frame(source, features, target, drop_duplicates=True):
+    """
+    The cleaned frame of the training scripts: dropna() (and drop_duplicates()) of the source, then the calendar
+    features of the date.
+
+    Returns:
+    --------
+    df : pandas.DataFrame
+        Features and target columns
+    days : numpy.ndarray
+        int32 date of each row, in days since 1970-01-01
+    meta : dict
+        Source rows, rows dropped and NaN counts per column
+    """
+    df = storage.read_table(source, dates=None, compact=False)
+    rows_source = len(df)
+    nan_counts = {col: int(n) for col, n in df.isnull().sum().items()}
+    df = df.dropna()
+    dropped_na = rows_source - len(df)
+    if drop_duplicates:
+        df = df.drop_duplicates()
+    dropped_duplicates = rows_source - dropped_na - len(df)
+
+    dates = pd.to_datetime(df['date'])
+    days = dates.to_numpy(dtype='datetime64[D]').astype(np.int32)
+    if any(col in DATE_FEATURES for col in features):
+        df = df.assign(year=dates.dt.year, month=dates.dt.month, day=dates.dt.day, dayofyear=dates.dt.dayofyear)
+    meta = {'rows_source': rows_source, 'dropped_na': dropped_na, 'dropped_duplicates': dropped_duplicates,
+            'nan_counts': nan_counts}
+    return df[list(features) + [target]], days, meta
+
+
+def time_split(days, test_size=0.2, gap_days=0):
+    """
+    Rows of a temporal holdout: the test rows are the last test_size of the days, the train rows the days before
+    them except the gap_days just before the first test day. The rows of each split are in date order.
+
+    Returns:
+    --------
+    train_idx, test_idx : numpy.ndarray
+    """
+    unique_days = np.unique(days)
+    n_test_days = min(len(unique_days) - 1, max(1, int(round(test_size * len(unique_days)))))
+    if n_test_days < 1:
+        raise ValueError("A temporal split needs at least two days")
+    test_start = unique_days[-n_test_days]
+    order = np.argsort(days, kind='stable')
+    sorted_days = days[order]
+    train_idx = order[sorted_days < test_start - gap_days]
+    if len(train_idx) == 0:
+        raise ValueError(f"No train days left before the {gap_days} gap days")
+    return train_idx, order[sorted_days >= test_start]
+
+
+def build_matrix(source, entry_dir, spec):
+    """Build the matrix of spec from source and save it to entry_dir"""
+    df, days, meta = build_frame(source, spec['features'], spec['target'], spec['drop_duplicates'])
+    X = df[spec['features']].to_numpy(dtype=np.float64)
+    y = df[spec['target']].to_numpy(dtype=np.float32)
+    del df
+
+    if spec['split'] == 'time':
+        train_idx, test_idx = time_split(days, spec['test_size'], spec['gap_days'])
+    else:
+        # The same rows as train_test_split(X, y, ...) in the training scripts
+        train_idx, test_idx = train_test_split(np.arange(len(X)), test_size=spec['test_size'],
+                                               random_state=spec['random_state'])
+    order = np.concatenate([train_idx, test_idx])
+    scaler = None
+    if spec['scale']:
+        scaler = StandardScaler()
+        scaler.fit(pd.DataFrame(X[train_idx], columns=spec['features']))
+        X_out = ((X[order] - scaler.mean_) / scaler.scale_).astype(np.float32)
+    else:
+        X_out = X[order].astype(np.float32)
+
+    # A temporary directory of this writer only, renamed into place once complete
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix=os.path.basename(entry_dir) + '.',
+                               suffix='.tmp')
+    try:
+        np.save(os.path.join(tmp_dir, 'X.npy'), X_out)
+        np.save(os.path.join(tmp_dir, 'y.npy'), y[order])
+        np.save(os.path.join(tmp_dir, 'days.npy'), days[order])
+        np.save(os.path.join(tmp_dir, 'train_idx.npy'), train_idx)
+        np.save(os.path.join(tmp_dir, 'test_idx.npy'), test_idx)
+        if scaler is not None:
+            joblib.dump(scaler, os.path.join(tmp_dir, 'scaler.pkl'))
+        meta.update(spec, source=source, rows=len(order), dropped_gap=len(X) - len(order))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load_features(source, features=FEATURES, target=TARGET, test_size=0.2, random_state=42, scale=True,
+                  drop_duplicates=True, split='random', gap_days=0, cache_dir=CACHE_DIR, rebuild=False):
+    """
+    Feature matrix of source for the spec, built and cached on the first call.
+
+    Parameters:
+    -----------
+    source : str
+        CSV file, or table name (see storage.py), with a date column, the feature columns and the target
+    features : list of str
+        Feature columns, in order; year, month, day and dayofyear are computed from the date
+    target : str
+        Target column
+    test_size, random_state :
+        Passed to train_test_split()
+    scale : bool
+        Standardize the features with a StandardScaler fitted on the train rows
+    drop_duplicates : bool
+        Drop duplicated rows after dropna()
+    split : str
+        'random' for train_test_split(), 'time' to hold out the last test_size of the days (see time_split())
+    gap_days : int
+        With split='time', days left out between the train and the test days
+    cache_dir : str
+        Directory of the cache entries
+    rebuild : bool
+        Build the matrix again even if it is cached
+
+    Returns:
+    --------
+    FeatureMatrix
+    """
+    spec = feature_spec(features, target, test_size, random_state, scale, drop_duplicates, split, gap_days)
+    entry_dir = os.path.join(cache_dir, cache_key(source_hash(_source_file(source), cache_dir), spec))
+    # Another process building the same entry holds the lock; waiting for it then finds the entry built
+    with cache_lock(entry_dir + '.lock'):
+        if rebuild or not os.path.exists(os.path.join(entry_dir, 'meta.json')):
+            logging.info(f"Building the feature matrix of {source} in {entry_dir}...")
+            build_matrix(source, entry_dir, spec)
+        else:
+            logging.info(f"Loading the cached feature matrix {entry_dir}")
+
+    with open(os.path.join(entry_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    scaler_path = os.path.join(entry_dir, 'scaler.pkl')
+    return FeatureMatrix(
+        entry_dir,
+        np.load(os.path.join(entry_dir, 'X.npy'), mmap_mode='r'),
+        np.load(os.path.join(entry_dir, 'y.npy'), mmap_mode='r'),
+        np.load(os.path.join(entry_dir, 'days.npy'), mmap_mode='r'),
+        np.load(os.path.join(entry_dir, 'train_idx.npy')),
+        np.load(os.path.join(entry_dir, 'test_idx.npy')),
+        joblib.load(scaler_path) if os.path.exists(scaler_path) else None,
+        meta,
+    )
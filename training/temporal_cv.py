@@ -0,0 +1,157 @@
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+from feature_cache import cache_lock, load_features
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+'''
+    Blocked time-series cross-validation over the (fips, date) grid of the feature matrices (see feature_cache.py).
+
+    The days of the training rows are cut in n_splits + 1 consecutive blocks. Fold k validates on block k + 1 and
+    trains on the days before it, except the gap_days just before the block, so a model is never validated on days
+    next to (or before) the ones it was trained on. All the counties of a day are on the same side of a fold,
+    unlike with a random KFold over the daily county rows.
+
+    The fold rows are computed once per feature matrix and saved as .npy index arrays in its cache entry. Like the
+    matrix they are memory-mapped: joblib worker processes (e.g. RandomizedSearchCV with n_jobs) receive the
+    memmaps as file references and worker threads share them, so memory grows with one copy of the data, not with
+    folds x workers. When the rows are in date order (load_features(split='time')), the fold rows are contiguous
+    and fold_rows() returns views of the memmap instead of copies.
+
+    Example:
+        data = load_features(DATA_FILE, split='time', gap_days=7)
+        cv = TemporalCV.for_matrix(data, n_splits=5, gap_days=7)
+        RandomizedSearchCV(model, param_dist, cv=cv, n_jobs=-1).fit(data.X_train, data.y_train)
+
+    Example: python temporal_cv.py --n-splits 5 --gap-days 7
+'''
+
+DATA_FILE = "../processed_datasets/merge_data/cleaned_merged_data_2020.csv"
+
+
+def blocked_folds(days, n_splits=5, gap_days=0):
+    """
+    Expanding-window folds over the days of the rows.
+
+    Parameters:
+    -----------
+    days : numpy.ndarray
+        Date of each row, as integer days
+    n_splits : int
+        Number of folds; the days are cut in n_splits + 1 blocks and the first one is only trained on
+    gap_days : int
+        Days left out between the training days and the validation block of each fold
+
+    Returns:
+    --------
+    list of (train_rows, valid_rows) numpy.ndarray, in ascending row order
+    """
+    unique_days = np.unique(days)
+    if len(unique_days) < n_splits + 1:
+        raise ValueError(f"{len(unique_days)} days cannot be cut in {n_splits + 1} blocks")
+
+    blocks = np.array_split(unique_days, n_splits + 1)
+    folds = []
+    for k, block in enumerate(blocks[1:]):
+        train_rows = np.flatnonzero(days < block[0] - gap_days)
+        valid_rows = np.flatnonzero((days >= block[0]) & (days <= block[-1]))
+        if len(train_rows) == 0:
+            raise ValueError(f"Fold {k} has no training days before its {gap_days} gap days")
+        folds.append((train_rows, valid_rows))
+    return folds
+
+
+def fold_rows(X, rows):
+    """Rows of X: a view when they are contiguous (date-ordered matrix), a copy otherwise"""
+    if len(rows) and rows[-1] - rows[0] == len(rows) - 1:
+        return X[rows[0]:rows[-1] + 1]
+    return X[rows]
+
+
+def load_folds(data, n_splits=5, gap_days=0, rebuild=False):
+    """
+    Folds of the training rows of a FeatureMatrix, saved in its cache entry on the first call and memory-mapped.
+
+    Parameters:
+    -----------
+    data : feature_cache.FeatureMatrix
+        Feature matrix; the folds are rows of data.X_train
+    n_splits, gap_days : int
+        See blocked_folds()
+    rebuild : bool
+        Compute the folds again even if they are saved
+
+    Returns:
+    --------
+    list of (train_rows, valid_rows) read-only numpy.memmap
+    """
+    folds_dir = os.path.join(data.path, f'folds_{n_splits}_gap{gap_days}')
+    # Same as the cache entries: built once under a lock, in a temporary directory of this writer
+    with cache_lock(folds_dir + '.lock'):
+        if rebuild or not os.path.exists(os.path.join(folds_dir, f'valid_{n_splits - 1}.npy')):
+            logging.info(f"Computing {n_splits} temporal folds (gap {gap_days} days) in {folds_dir}...")
+            tmp_dir = tempfile.mkdtemp(dir=data.path, prefix=os.path.basename(folds_dir) + '.', suffix='.tmp')
+            try:
+                for k, (train_rows, valid_rows) in enumerate(blocked_folds(np.asarray(data.days_train), n_splits,
+                                                                            gap_days)):
+                    np.save(os.path.join(tmp_dir, f'train_{k}.npy'), train_rows)
+                    np.save(os.path.join(tmp_dir, f'valid_{k}.npy'), valid_rows)
+                shutil.rmtree(folds_dir, ignore_errors=True)
+                os.replace(tmp_dir, folds_dir)
+            except BaseException:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+
+    return [(np.load(os.path.join(folds_dir, f'train_{k}.npy'), mmap_mode='r'),
+             np.load(os.path.join(folds_dir, f'valid_{k}.npy'), mmap_mode='r'))
+            for k in range(n_splits)]
+
+
+class TemporalCV:
+    """scikit-learn CV splitter yielding precomputed fold rows, e.g. for cross_val_score or RandomizedSearchCV"""
+
+    def __init__(self, folds):
+        self.folds = folds
+
+    @classmethod
+    def for_matrix(cls, data, n_splits=5, gap_days=0):
+        """Splitter of the training rows of a FeatureMatrix (see load_folds())"""
+        return cls(load_folds(data, n_splits, gap_days))
+
+    def split(self, X=None, y=None, groups=None):
+        for train_rows, valid_rows in self.folds:
+            yield train_rows, valid_rows
+
+    def get_n_splits(self, X=None, y=None, groups=None):
+        return len(self.folds)
+
+
+def describe_folds(data, folds):
+    """Date range and rows of the training and validation days of each fold, one line per fold"""
+    days = data.days_train
+    lines = []
+    for k, (train_rows, valid_rows) in enumerate(folds):
+        train_days = np.datetime64(int(days[train_rows].min()), 'D'), np.datetime64(int(days[train_rows].max()), 'D')
+        valid_days = np.datetime64(int(days[valid_rows].min()), 'D'), np.datetime64(int(days[valid_rows].max()), 'D')
+        lines.append(f"Fold {k}: train {train_days[0]} to {train_days[1]} ({len(train_rows)} rows), "
+                     f"validation {valid_days[0]} to {valid_days[1]} ({len(valid_rows)} rows)")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute and show the blocked temporal CV folds of a data set")
+    parser.add_argument('--data', default=DATA_FILE)
+    parser.add_argument('--n-splits', type=int, default=5)
+    parser.add_argument('--gap-days', type=int, default=7, help="Days left out before each validation block")
+    parser.add_argument('--split', choices=['time', 'random'], default='time', help="Train/test split of the data")
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args()
+
+    data = load_features(args.data, split=args.split, gap_days=args.gap_days)
+    print(data.summary())
+    for line in describe_folds(data, load_folds(data, args.n_splits, args.gap_days, args.rebuild)):
+        print(line)
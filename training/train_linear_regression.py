@@ -1,36 +1,24 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error, r2_score
 import matplotlib.pyplot as plt
 import seaborn as sns
 import time
+from feature_cache import load_features
 
 # 1. Load and prepare data
 print("Loading data...")
-df = pd.read_csv('../processed_datasets/merge_data/cleaned_merged_data_2018_2020.csv').dropna()
-
-# Convert date string to datetime and extract features
-if 'date' in df.columns:
-    df['date'] = pd.to_datetime(df['date'])
-    df['day'] = df['date'].dt.day
-    df['month'] = df['date'].dt.month
-    df['year'] = df['date'].dt.year
-    print("Extracted day, month, year from date column")
-else:
-    print("Warning: 'date' column not found. Make sure temporal features exist.")
-    
 features = ['day', 'month', 'year', 'fmc', 'tmax', 'tmin', 'prcp', 'wind_speed', 'lat', 'lon']
-X = df[features]
-y = df['fire_size']
 
-# 2. Train-test split and scaling
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
+# 2. Train-test split and scaling: dropna, day / month / year of the date, split and scaling are cached
+# (see feature_cache.py)
+data = load_features('../processed_datasets/merge_data/cleaned_merged_data_2018_2020.csv', features=features,
+                     drop_duplicates=False)
+print(data.summary())
+X_train_scaled, X_test_scaled = data.X_train, data.X_test
+y_train, y_test = data.y_train, data.y_test
+scaler = data.scaler
 
 # 3. Train and evaluate Linear Regression model
 print("\nTraining Linear Regression model...")
@@ -1,54 +1,33 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.preprocessing import StandardScaler
 import xgboost as xgb  # Install with: pip install xgboost
 import joblib
 import json
+from feature_cache import load_features
 
-# Load CSV
-df = pd.read_csv("../processed_datasets/merge_data/cleaned_merged_data_2020.csv")  # Replace with your CSV path
+# Load the cached feature matrix: dropna, drop_duplicates, date features, 80/20 split and scaling are built once
+# per CSV content (see feature_cache.py)
+data = load_features("../processed_datasets/merge_data/cleaned_merged_data_2020.csv")  # Replace with your CSV path
 
 # Step 1: Quick data check
-print("First few rows:\n", df.head())
-print("\nData Summary:\n", df.describe())
-print("\nMissing values:\n", df.isnull().sum())
-
-# Drop rows with missing values (or impute if preferred)
-df = df.dropna()
-df = df.drop_duplicates()
+print(data.summary())
+print("\nMissing values:\n", pd.Series(data.meta['nan_counts']))
 
 # Check if fire_size has variation
-if df["fire_size"].nunique() <= 1:
+if np.unique(data.y).size <= 1:
     print("fire_size has no variation. Cannot train a model.")
     exit()
 
-# Feature engineering: Extract date components
-df["date"] = pd.to_datetime(df["date"])
-df["year"] = df["date"].dt.year
-df["month"] = df["date"].dt.month
-df["day"] = df["date"].dt.day
-df["dayofyear"] = df["date"].dt.dayofyear
-df = df.drop(columns=["date"])
-
-# Step 2: Feature selection
-X = df.drop(columns=["fire_size"])
-y = df["fire_size"]
-
+# Step 2: Features and target
 # Check correlation (optional)
-print("\nCorrelation with fire_size:\n", df.corr()["fire_size"].sort_values(ascending=False))
-
-# Step 3: Train/Test Split
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
+print("\nCorrelation with fire_size:\n", data.frame().corr()["fire_size"].sort_values(ascending=False))
 
-# Standardize features (important for gradient boosting)
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
+# Step 3: Train/Test Split, with the features standardized (scaler fitted on the train rows)
+X_train_scaled, X_test_scaled = data.X_train, data.X_test
+y_train, y_test = data.y_train, data.y_test
+scaler = data.scaler
 
 # Step 4: Train XGBoost model
 model = xgb.XGBRegressor(
@@ -83,7 +62,7 @@ print(f"✅ R² Score: {r2:.4f}")
 joblib.dump(model, 'wildfire_prediction_xgboost.pkl')
 joblib.dump(scaler, 'feature_scaler.pkl')
 with open('feature_names.json', 'w') as f:
-    json.dump(list(X.columns), f)
+    json.dump(data.feature_names, f)
 
 print("✅ Saved artifacts:")
 print("- wildfire_prediction_xgboost.pkl (XGBoost model)")
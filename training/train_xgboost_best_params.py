@@ -2,51 +2,34 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
-from sklearn.preprocessing import StandardScaler
 import xgboost as xgb
 import joblib
 import json
+from feature_cache import load_features
 
 # =============================================
 # 1. Data Loading and Preparation
 # =============================================
 print("Loading and preparing data...")
-df = pd.read_csv("../processed_datasets/merge_data/cleaned_merged_data_2020.csv")
+# Cleaning, feature engineering, split and scaling are cached (see feature_cache.py)
+data = load_features("../processed_datasets/merge_data/cleaned_merged_data_2020.csv")
 
 # Basic data checks
 print("\nData Summary:")
-print(f"- Shape: {df.shape}")
-print(f"- Columns: {df.columns.tolist()}")
-print(f"- Missing Values:\n{df.isnull().sum()}")
+print(f"- {data.summary()}")
+print(f"- Features: {data.feature_names}")
+print(f"- Missing Values:\n{pd.Series(data.meta['nan_counts'])}")
 
-# Data cleaning
-df = df.dropna().drop_duplicates()
-if df["fire_size"].nunique() <= 1:
+if np.unique(data.y).size <= 1:
     raise ValueError("Target variable 'fire_size' has no variation!")
 
-# Feature engineering
-df["date"] = pd.to_datetime(df["date"])
-df["year"] = df["date"].dt.year
-df["month"] = df["date"].dt.month
-df["day"] = df["date"].dt.day
-df["dayofyear"] = df["date"].dt.dayofyear
-df = df.drop(columns=["date"])
-
 # =============================================
 # 2. Train-Test Split & Scaling
 # =============================================
-X = df.drop(columns=["fire_size"])
-y = df["fire_size"]
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, shuffle=True
-)
-
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
+X_train_scaled, X_test_scaled = data.X_train, data.X_test
+y_train, y_test = data.y_train, data.y_test
+scaler = data.scaler
 
 # =============================================
 # 3. Train Model with Pre-Tuned Parameters
@@ -113,6 +96,6 @@ artifacts = {
 joblib.dump(final_model, artifacts['model'])
 joblib.dump(scaler, artifacts['scaler'])
 with open(artifacts['features'], 'w') as f:
-    json.dump(X.columns.tolist(), f)
+    json.dump(data.feature_names, f)
 with open(artifacts['params'], 'w') as f:
     json.dump(best_params, f)
@@ -0,0 +1,238 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import joblib
+import numpy as np
+import xgboost as xgb
+from sklearn.preprocessing import StandardScaler
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../preprocess'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../processed_datasets/merge_data'))
+import storage
+from post_merge import partition_years
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+'''
+    This script is used for training the XGBoost model on the whole cleaned 1992-2020 history without loading it
+    in memory. The year partitions of post_merge.py are streamed --chunksize rows at a time:
+    - Pass 1: the StandardScaler statistics are computed incrementally with partial_fit()
+    - Then XGBoost reads the scaled chunks through a DataIter into an external-memory ExtMemQuantileDMatrix with
+      `hist` quantization, so only the quantized pages (about one byte per value) are cached, on disk
+    - The validation rows are picked by a hash of (fips, date), so every pass sees the same split, and the
+      metrics are accumulated chunk by chunk
+
+    The model is saved as an XGBRegressor with the scaler and the feature names, like train_xgboost.py, so
+    predict.py uses it as is.
+
+    Example: python train_xgboost_external.py --years 1992 2020 --chunksize 1000000
+'''
+
+PARTITION_DIR = '../processed_datasets/merge_data/cleaned_by_year'
+FEATURES = ["fmc", "fips", "tmax", "tmin", "prcp", "wind_speed", "lat", "lon", "year", "month", "day", "dayofyear"]
+TARGET = 'fire_size'
+READ_COLUMNS = ['date', 'fmc', 'fips', 'tmax', 'tmin', 'prcp', 'wind_speed', 'fire_size', 'lat', 'lon']
+
+
+def add_date_features(df):
+    """year, month, day and dayofyear columns of the date column, as in train_xgboost.py"""
+    df['year'] = df['date'].dt.year
+    df['month'] = df['date'].dt.month
+    df['day'] = df['date'].dt.day
+    df['dayofyear'] = df['date'].dt.dayofyear
+    return df
+
+
+def is_validation(df, valid_fraction, seed=42):
+    """Mask of the validation rows: a hash of (fips, date), the same on every pass over the data"""
+    keys = df['fips'].to_numpy(dtype=np.uint64) * np.uint64(1_000_003) + df['date'].to_numpy(
+        dtype='datetime64[D]').astype(np.int64).astype(np.uint64)
+    hashed = (keys + np.uint64(seed)) * np.uint64(0x9E3779B97F4A7C15)
+    return (hashed >> np.uint64(40)).astype(np.float64) / float(1 << 24) < valid_fraction
+
+
+def iter_chunks(files, chunksize):
+    """Complete rows of the partitions with the date features, chunksize rows at a time"""
+    for path in files:
+        for chunk in storage.iter_table(path, chunksize=chunksize, columns=READ_COLUMNS):
+            # fips, date is unique in merged_data, so dropna() is all train_xgboost.py's dropna().drop_duplicates()
+            # does to it
+            chunk = chunk.dropna()
+            if len(chunk):
+                yield add_date_features(chunk)
+
+
+def fit_scaler(files, chunksize):
+    """StandardScaler of the features, fitted incrementally over all the partitions"""
+    scaler = StandardScaler()
+    rows = 0
+    for chunk in iter_chunks(files, chunksize):
+        scaler.partial_fit(chunk[FEATURES])
+        rows += len(chunk)
+    logging.info(f"Scaler fitted on {rows} rows")
+    return scaler, rows
+
+
+class PartitionIter(xgb.DataIter):
+    """Scaled chunks of the training or the validation rows of the partitions, for XGBoost's external memory"""
+
+    def __init__(self, files, scaler, validation, valid_fraction, chunksize, cache_prefix):
+        self.files = files
+        self.scaler = scaler
+        self.validation = validation
+        self.valid_fraction = valid_fraction
+        self.chunksize = chunksize
+        self._chunks = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def chunks(self):
+        for chunk in iter_chunks(self.files, self.chunksize):
+            mask = is_validation(chunk, self.valid_fraction)
+            chunk = chunk[mask if self.validation else ~mask]
+            if len(chunk):
+                X = self.scaler.transform(chunk[FEATURES]).astype(np.float32)
+                yield X, chunk[TARGET].to_numpy(dtype=np.float32)
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self._chunks = self.chunks()
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        input_data(data=chunk[0], label=chunk[1])
+        return True
+
+    def reset(self):
+        self._chunks = None
+
+
+def evaluate(booster, data_iter):
+    """MSE and R² of booster (up to its best iteration) over the chunks of data_iter, accumulated chunk by chunk"""
+    iteration_range = (0, booster.best_iteration + 1) if 'best_iteration' in booster.attributes() else (0, 0)
+    n = 0
+    sse = total = total_sq = 0.0
+    for X, y in data_iter.chunks():
+        pred = booster.inplace_predict(X, iteration_range=iteration_range)
+        y = y.astype(np.float64)
+        sse += float(((y - pred) ** 2).sum())
+        total += float(y.sum())
+        total_sq += float((y ** 2).sum())
+        n += len(y)
+    if n == 0:
+        return float('nan'), float('nan')
+    sst = total_sq - total ** 2 / n
+    return sse / n, 1 - sse / sst if sst > 0 else float('nan')
+
+
+def train_external(files, params, num_boost_round=2000, early_stopping_rounds=10, valid_fraction=0.2,
+                   chunksize=1_000_000, max_bin=256, cache_dir=None):
+    """
+    Fit the scaler and train XGBoost on the partition files in external memory.
+
+    Parameters:
+    -----------
+    files : list of str
+        Year partition tables (see storage.py)
+    params : dict
+        XGBoost parameters; tree_method is always 'hist'
+    num_boost_round, early_stopping_rounds : int
+        Boosting rounds, and rounds without improvement of the validation RMSE before stopping
+    valid_fraction : float
+        Fraction of the rows held out for validation
+    chunksize : int
+        Rows per chunk handed to XGBoost
+    max_bin : int
+        Histogram bins per feature
+    cache_dir : str, optional
+        Directory of XGBoost's external-memory cache; a temporary directory when not given
+
+    Returns:
+    --------
+    booster : xgboost.Booster
+    scaler : sklearn.preprocessing.StandardScaler
+    metrics : dict
+        Training rows, validation MSE and R²
+    """
+    scaler, rows = fit_scaler(files, chunksize)
+    params = {**params, 'tree_method': 'hist', 'max_bin': max_bin}
+
+    with tempfile.TemporaryDirectory(dir=cache_dir) as tmp:
+        train_iter = PartitionIter(files, scaler, False, valid_fraction, chunksize, os.path.join(tmp, 'train'))
+        valid_iter = PartitionIter(files, scaler, True, valid_fraction, chunksize, os.path.join(tmp, 'valid'))
+        logging.info("Building the external-memory training matrix...")
+        dtrain = xgb.ExtMemQuantileDMatrix(train_iter, max_bin=max_bin)
+        dvalid = xgb.ExtMemQuantileDMatrix(valid_iter, max_bin=max_bin, ref=dtrain)
+        logging.info(f"{dtrain.num_row()} training rows, {dvalid.num_row()} validation rows")
+
+        booster = xgb.train(
+            params, dtrain, num_boost_round=num_boost_round, evals=[(dvalid, 'validation')],
+            early_stopping_rounds=early_stopping_rounds, verbose_eval=50
+        )
+        mse, r2 = evaluate(booster, valid_iter)
+        metrics = {'rows': rows, 'train_rows': dtrain.num_row(), 'validation_rows': dvalid.num_row(),
+                   'best_iteration': booster.best_iteration, 'mse': mse, 'r2': r2}
+        del dtrain, dvalid
+    return booster, scaler, metrics
+
+
+def to_regressor(booster):
+    """XGBRegressor wrapping booster, the model type predict.py loads"""
+    model = xgb.XGBRegressor()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.json')
+        booster.save_model(path)
+        model.load_model(path)
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train XGBoost on all the year partitions in external memory")
+    parser.add_argument('--partition-dir', default=PARTITION_DIR, help="Year partitions of post_merge.py")
+    parser.add_argument('--years', type=int, nargs=2, metavar=('START', 'END'), help="Only train on these years")
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help="Rows per chunk")
+    parser.add_argument('--valid-fraction', type=float, default=0.2)
+    parser.add_argument('--n-estimators', type=int, default=2000)
+    parser.add_argument('--learning-rate', type=float, default=0.1)
+    parser.add_argument('--max-depth', type=int, default=5)
+    parser.add_argument('--max-bin', type=int, default=256)
+    parser.add_argument('--early-stopping-rounds', type=int, default=10)
+    parser.add_argument('--nthread', type=int, default=None)
+    parser.add_argument('--cache-dir', help="Directory of the external-memory cache (a temporary one by default)")
+    parser.add_argument('--model', default='wildfire_prediction_xgboost.pkl')
+    parser.add_argument('--scaler', default='feature_scaler.pkl')
+    parser.add_argument('--features', default='feature_names.json')
+    args = parser.parse_args()
+
+    years = partition_years(args.partition_dir)
+    if args.years is not None:
+        years = {year: path for year, path in years.items() if args.years[0] <= year <= args.years[1]}
+    if not years:
+        raise SystemExit(f"No year partitions in {args.partition_dir}, run post_merge.py first")
+    logging.info(f"Training on {len(years)} years: {min(years)}-{max(years)}")
+
+    params = {'objective': 'reg:squarederror', 'eval_metric': 'rmse', 'learning_rate': args.learning_rate,
+              'max_depth': args.max_depth, 'seed': 42, 'verbosity': 1}
+    if args.nthread is not None:
+        params['nthread'] = args.nthread
+    booster, scaler, metrics = train_external(
+        [years[year] for year in sorted(years)], params, args.n_estimators, args.early_stopping_rounds,
+        args.valid_fraction, args.chunksize, args.max_bin, args.cache_dir
+    )
+
+    print(f"\nModel Performance ({metrics['train_rows']} training rows, {metrics['validation_rows']} validation):")
+    print(f"✅ MSE: {metrics['mse']:.4f}")
+    print(f"✅ R² Score: {metrics['r2']:.4f}")
+
+    # Save artifacts
+    joblib.dump(to_regressor(booster), args.model)
+    joblib.dump(scaler, args.scaler)
+    with open(args.features, 'w') as f:
+        json.dump(FEATURES, f)
+
+    print("✅ Saved artifacts:")
+    print(f"- {args.model} (XGBoost model)")
+    print(f"- {args.scaler}")
+    print(f"- {args.features}")
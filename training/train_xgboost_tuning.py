@@ -1,73 +1,51 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.model_selection import train_test_split, RandomizedSearchCV
+from sklearn.model_selection import ParameterSampler, RandomizedSearchCV
 from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
-from sklearn.preprocessing import StandardScaler
 from scipy.stats import randint, uniform
 import xgboost as xgb
 import joblib
-import json
-from sklearn.inspection import permutation_importance
+from feature_cache import load_features
+from temporal_cv import TemporalCV, fold_rows, load_folds
 
-# =============================================
-# 1. Data Loading and Preparation
-# =============================================
-print("🔍 Loading and preparing data...")
-df = pd.read_csv("../processed_datasets/merge_data/cleaned_merged_data_2020.csv")
-
-# Basic data checks
-print("\n📊 Data Summary:")
-print(f"- Shape: {df.shape}")
-print(f"- Columns: {df.columns.tolist()}")
-print(f"- Missing Values:\n{df.isnull().sum()}")
-
-# Data cleaning
-df = df.dropna().drop_duplicates()
-if df["fire_size"].nunique() <= 1:
-    raise ValueError("Target variable 'fire_size' has no variation!")
-
-# Feature engineering - CORRECTED datetime features
-df["date"] = pd.to_datetime(df["date"])
-df["year"] = df["date"].dt.year
-df["month"] = df["date"].dt.month
-df["day"] = df["date"].dt.day
-df["dayofyear"] = df["date"].dt.dayofyear
-# Removed weekofyear as it's not a direct attribute
-df = df.drop(columns=["date"])
+'''
+    This script is used for tuning the XGBoost model with successive halving over boosting rounds.
 
-# =============================================
-# 2. Feature Analysis
-# =============================================
-print("\n🔎 Feature Analysis:")
-X = df.drop(columns=["fire_size"])
-y = df["fire_size"]
+    --n-configs parameter sets are sampled from PARAM_DIST. Every set is trained for --min-rounds rounds on each of
+    the --cv folds of the training rows, scored on its own validation fold, and the best 1/--eta are promoted to
+    eta times more rounds, continuing from their boosters, until --max-rounds. Most sets only cost a few dozen
+    rounds, instead of up to 2000 rounds each with RandomizedSearchCV.
 
-# Correlation analysis
-corr_matrix = df.corr()
-plt.figure(figsize=(12, 8))
-sns.heatmap(corr_matrix, annot=True, fmt=".2f", cmap="coolwarm")
-plt.title("Feature Correlation Matrix")
-plt.show()
+    The folds are blocked in time (see temporal_cv.py): each one validates on a block of days and trains on the
+    days before it, --gap-days apart, and by default the test rows are the last days of the data (--split time),
+    so neighbouring days of a county are never on both sides. The fold matrices are built once, from views of
+    the memory-mapped feature matrix, and shared by all the trials.
 
-# =============================================
-# 3. Train-Test Split & Scaling
-# =============================================
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, shuffle=True
-)
+    Threads are allocated explicitly: --n-jobs cores in total, --trial-threads XGBoost threads per trial, and
+    n_jobs // trial_threads trials at a time. Every finished trial is appended to --trials (JSON lines) with the
+    fold boosters saved next to it, so an interrupted search resumes where it stopped. The test rows are only used
+    for the final evaluation.
 
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
+    --baseline also runs the previous RandomizedSearchCV (50 iterations, same folds, n_jobs=-1) and compares the
+    wall-clock times and test scores.
 
-# =============================================
-# 4. Hyperparameter Tuning (RandomizedSearchCV)
-# =============================================
-# Define parameter distributions
-param_dist = {
-    'n_estimators': randint(100, 2000),
+    Example: python train_xgboost_tuning.py --n-configs 50 --n-jobs 8 --trial-threads 2
+'''
+
+DATA_FILE = "../processed_datasets/merge_data/cleaned_merged_data_2020.csv"
+
+# Parameter distributions; the number of rounds is the budget of the search, not a sampled parameter
+PARAM_DIST = {
     'learning_rate': uniform(0.01, 0.3),
     'max_depth': randint(3, 12),
     'subsample': uniform(0.6, 0.4),  # Range: 0.6-1.0
@@ -78,108 +56,362 @@ param_dist = {
     'min_child_weight': randint(1, 20),
 }
 
-# Initialize XGBoost model
-model = xgb.XGBRegressor(
-    random_state=42,
-    n_jobs=-1,
-    early_stopping_rounds=50,
-    eval_metric='rmse'
-)
-
-# Initialize RandomizedSearchCV
-random_search = RandomizedSearchCV(
-    estimator=model,
-    param_distributions=param_dist,
-    n_iter=50,  # Number of parameter combinations to try
-    scoring='neg_mean_squared_error',
-    cv=3,
-    verbose=2,
-    random_state=42,
-    n_jobs=-1
-)
-
-print("\n🎛 Starting RandomizedSearchCV...")
-random_search.fit(
-    X_train_scaled, 
-    y_train,
-    eval_set=[(X_test_scaled, y_test)],
-    verbose=False
-)
-
-# Get best parameters and model
-best_params = random_search.best_params_
-best_model = random_search.best_estimator_
-
-print("\n🏆 Best Parameters Found:")
-print(best_params)
+
+def rung_rounds(min_rounds, max_rounds, eta):
+    """Total boosting rounds of each rung: min_rounds * eta**k, the last one max_rounds"""
+    rounds = [min_rounds]
+    while rounds[-1] < max_rounds:
+        rounds.append(min(rounds[-1] * eta, max_rounds))
+    return rounds
+
+
+def booster_params(params, threads, seed=42):
+    """xgb.train parameters of a sampled parameter set"""
+    return {**params, 'objective': 'reg:squarederror', 'eval_metric': 'rmse', 'tree_method': 'hist',
+            'nthread': threads, 'seed': seed, 'verbosity': 0}
+
+
+class SuccessiveHalving:
+    """
+    Successive-halving search over boosting rounds, with the trials persisted to a JSON lines file.
+
+    A trial trains one parameter set up to the rounds of a rung on every fold, continuing from the boosters of its
+    previous rung, and records the mean validation MSE after each of those rounds. The score of a parameter set
+    is the best mean MSE over all its rounds so far.
+    """
+
+    def __init__(self, X, y, configs, rounds, folds, eta=3, n_jobs=None, trial_threads=1,
+                 trials_file='tuning_trials.jsonl', search_id=None):
+        self.X = X
+        self.y = y
+        self.configs = configs
+        self.rounds = rounds
+        self.eta = eta
+        self.n_jobs = n_jobs or os.cpu_count()
+        self.trial_threads = min(trial_threads, self.n_jobs)
+        self.workers = max(1, self.n_jobs // self.trial_threads)
+        self.folds = folds
+        self.trials_file = trials_file
+        # One directory per search: run() removes it at the end, which must not touch another search's boosters
+        self.booster_dir = os.path.splitext(trials_file)[0] + f'_boosters_{search_id}'
+        self.search_id = search_id
+        self.trials = self._load_trials()
+        self._fold_dmatrices = None
+        self._lock = threading.Lock()
+
+    def _load_trials(self):
+        """Finished trials of this search in trials_file, by (config, rung)"""
+        trials = {}
+        if os.path.exists(self.trials_file):
+            with open(self.trials_file) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    trial = json.loads(line)
+                    if trial['search'] == self.search_id:
+                        trials[(trial['config'], trial['rung'])] = trial
+        if trials:
+            print(f"♻️ Resuming: {len(trials)} finished trials in {self.trials_file}")
+        return trials
+
+    def _fold_matrices(self):
+        """Quantized (train, validation) DMatrix of every fold, built on first use and shared by the worker threads"""
+        with self._lock:
+            if self._fold_dmatrices is None:
+                folds = []
+                for train_rows, valid_rows in self.folds:
+                    dtrain = xgb.QuantileDMatrix(fold_rows(self.X, train_rows), fold_rows(self.y, train_rows),
+                                                 nthread=self.n_jobs)
+                    dvalid = xgb.QuantileDMatrix(fold_rows(self.X, valid_rows), fold_rows(self.y, valid_rows),
+                                                 ref=dtrain, nthread=self.n_jobs)
+                    folds.append((dtrain, dvalid))
+                self._fold_dmatrices = folds
+        return self._fold_dmatrices
+
+    def _booster_path(self, config, fold):
+        return os.path.join(self.booster_dir, f'{config}_{fold}.ubj')
+
+    def run_trial(self, config, rung):
+        """Train config up to the rounds of rung on every fold; returns the trial record"""
+        start = time.perf_counter()
+        target = self.rounds[rung]
+        params = booster_params(self.configs[config], self.trial_threads)
+        fold_curves = []
+        for fold, (dtrain, dvalid) in enumerate(self._fold_matrices()):
+            previous = None
+            path = self._booster_path(config, fold)
+            if rung > 0 and os.path.exists(path):
+                previous = xgb.Booster(model_file=path)
+                if previous.num_boosted_rounds() != self.rounds[rung - 1]:
+                    previous = None
+            done = previous.num_boosted_rounds() if previous is not None else 0
+            history = {}
+            booster = xgb.train(params, dtrain, num_boost_round=target - done, evals=[(dvalid, 'valid')],
+                                evals_result=history, verbose_eval=False, xgb_model=previous)
+            booster.save_model(path)
+            fold_curves.append(np.square(history['valid']['rmse'][-(target - self.first_round(rung)):]))
+
+        curve = np.mean(fold_curves, axis=0)
+        return {
+            'search': self.search_id, 'config': config, 'rung': rung, 'params': self.configs[config],
+            'first_round': self.first_round(rung), 'rounds': target,
+            'curve': [float(f'{mse:.6g}') for mse in curve],
+            'seconds': round(time.perf_counter() - start, 3), 'threads': self.trial_threads,
+        }
+
+    def first_round(self, rung):
+        """First round scored by a trial of rung (the rounds of the previous rungs are already scored)"""
+        return self.rounds[rung - 1] if rung > 0 else 0
+
+    def score(self, config, rung):
+        """(best mean validation MSE, its number of rounds) of config over its trials up to rung"""
+        best = (np.inf, 0)
+        for r in range(rung + 1):
+            trial = self.trials[(config, r)]
+            i = int(np.argmin(trial['curve']))
+            if trial['curve'][i] < best[0]:
+                best = (trial['curve'][i], trial['first_round'] + i + 1)
+        return best
+
+    def _record(self, trial):
+        with self._lock:
+            self.trials[(trial['config'], trial['rung'])] = trial
+            with open(self.trials_file, 'a') as f:
+                f.write(json.dumps(trial) + '\n')
+
+    def run(self):
+        """Run the search; returns (best config, its best number of rounds, its mean validation MSE)"""
+        os.makedirs(self.booster_dir, exist_ok=True)
+        alive = list(range(len(self.configs)))
+        for rung, target in enumerate(self.rounds):
+            todo = [config for config in alive if (config, rung) not in self.trials]
+            print(f"\n🪜 Rung {rung}: {len(alive)} configurations x {target} rounds "
+                  f"({len(todo)} to train, {self.workers} at a time x {self.trial_threads} threads)")
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                # Trials are recorded by the workers, so the ones that finish are kept if the search is interrupted
+                futures = [pool.submit(lambda config: self._record(self.run_trial(config, rung)), config)
+                           for config in todo]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+            ranked = sorted(alive, key=lambda config: self.score(config, rung)[0])
+            best_mse, best_rounds = self.score(ranked[0], rung)
+            print(f"   best so far: config {ranked[0]}, validation MSE {best_mse:.4f} at {best_rounds} rounds")
+            if rung < len(self.rounds) - 1:
+                keep = max(1, len(alive) // self.eta)
+                for config in ranked[keep:]:
+                    for fold in range(len(self.folds)):
+                        if os.path.exists(self._booster_path(config, fold)):
+                            os.remove(self._booster_path(config, fold))
+                alive = ranked[:keep]
+
+        best = alive[0] if len(alive) == 1 else min(alive, key=lambda c: self.score(c, len(self.rounds) - 1)[0])
+        best_mse, best_rounds = self.score(best, len(self.rounds) - 1)
+        # Every trial is recorded, the boosters are only needed to resume an unfinished search
+        shutil.rmtree(self.booster_dir, ignore_errors=True)
+        return best, best_rounds, best_mse
+
+
+def randomized_search_baseline(X_train, y_train, folds, n_iter=50):
+    """
+    The previous search: RandomizedSearchCV, n_estimators up to 2000, n_jobs=-1 on the search and each model. It
+    uses the same temporal folds; its worker processes get the memory-mapped matrix and fold rows by reference.
+    The previous early stopping on the test rows is left out, so the test rows stay out of model selection and
+    the test MSE of both searches can be compared.
+    """
+    param_dist = {'n_estimators': randint(100, 2000), **PARAM_DIST}
+    model = xgb.XGBRegressor(random_state=42, n_jobs=-1, eval_metric='rmse')
+    random_search = RandomizedSearchCV(
+        estimator=model, param_distributions=param_dist, n_iter=n_iter, scoring='neg_mean_squared_error',
+        cv=TemporalCV(folds), verbose=1, random_state=42, n_jobs=-1
+    )
+    start = time.perf_counter()
+    random_search.fit(X_train, y_train)
+    return random_search, time.perf_counter() - start
+
 
 # =============================================
 # 5. Model Evaluation
 # =============================================
-def evaluate_model(model, X_test, y_test):
+def evaluate_model(model, X_test, y_test, plot=True):
     y_pred = model.predict(X_test)
-    
+
+    mse = mean_squared_error(y_test, y_pred)
     metrics = {
-        'MSE': mean_squared_error(y_test, y_pred),
-        'RMSE': mean_squared_error(y_test, y_pred, squared=False),
+        'MSE': mse,
+        'RMSE': np.sqrt(mse),
         'MAE': mean_absolute_error(y_test, y_pred),
         'R²': r2_score(y_test, y_pred)
     }
-    
+    if not plot:
+        return metrics
+
     # Plot feature importance
     fig, ax = plt.subplots(1, 2, figsize=(16, 6))
     xgb.plot_importance(model, ax=ax[0])
     ax[0].set_title("XGBoost Feature Importance")
-    
+
     # Plot actual vs predicted
     ax[1].scatter(y_test, y_pred, alpha=0.5)
     ax[1].plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'r--')
     ax[1].set_xlabel("Actual Fire Size")
     ax[1].set_ylabel("Predicted Fire Size")
     ax[1].set_title("Prediction Accuracy")
-    
+
     plt.tight_layout()
     plt.show()
-    
+
     return metrics
 
-print("\n📊 Model Evaluation:")
-metrics = evaluate_model(best_model, X_test_scaled, y_test)
-for name, value in metrics.items():
-    print(f"{name}: {value:.4f}")
 
-# =============================================
-# 6. Save Model Artifacts
-# =============================================
-artifacts = {
-    'model': 'wildfire_prediction_xgboost.pkl',
-    'scaler': 'feature_scaler.pkl',
-    'features': 'feature_names.json',
-    'params': 'best_params.json'
-}
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune XGBoost with successive halving over boosting rounds")
+    parser.add_argument('--data', default=DATA_FILE)
+    parser.add_argument('--n-configs', type=int, default=50, help="Parameter sets sampled")
+    parser.add_argument('--min-rounds', type=int, default=25, help="Rounds of every set in the first rung")
+    parser.add_argument('--max-rounds', type=int, default=2000, help="Rounds of the last rung")
+    parser.add_argument('--eta', type=int, default=3, help="1/eta of the sets are promoted to eta x more rounds")
+    parser.add_argument('--cv', type=int, default=3, help="Temporal folds of the training rows")
+    parser.add_argument('--gap-days', type=int, default=7, help="Days between training and validation/test days")
+    parser.add_argument('--split', choices=['time', 'random'], default='time',
+                        help="Test rows: the last days of the data, or random rows as in the other scripts")
+    parser.add_argument('--n-jobs', type=int, default=os.cpu_count(), help="Cores used in total")
+    parser.add_argument('--trial-threads', type=int, default=1, help="XGBoost threads of each trial")
+    parser.add_argument('--trials', default='tuning_trials.jsonl', help="Trial results, to resume a search")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the sampled parameter sets")
+    parser.add_argument('--baseline', action='store_true', help="Also run the previous RandomizedSearchCV")
+    parser.add_argument('--no-plots', action='store_true')
+    args = parser.parse_args()
 
-joblib.dump(best_model, artifacts['model'])
-joblib.dump(scaler, artifacts['scaler'])
-with open(artifacts['features'], 'w') as f:
-    json.dump(X.columns.tolist(), f)
-with open(artifacts['params'], 'w') as f:
-    json.dump(best_params, f)
+    # =============================================
+    # 1. Data Loading and Preparation
+    # =============================================
+    print("🔍 Loading and preparing data...")
+    # Cleaning (dropna, drop_duplicates), datetime features, split and scaling are cached (see feature_cache.py)
+    data = load_features(args.data, split=args.split, gap_days=args.gap_days)
+    folds = load_folds(data, args.cv, args.gap_days)
 
-print("\n💾 Saved artifacts:")
-for name, path in artifacts.items():
-    print(f"- {name}: {path}")
+    # Basic data checks
+    print("\n📊 Data Summary:")
+    print(f"- {data.summary()}")
+    print(f"- Features: {data.feature_names}")
+    print(f"- Missing Values:\n{pd.Series(data.meta['nan_counts'])}")
 
-# =============================================
-# 7. Learning Curves Visualization
-# =============================================
-results = best_model.evals_result()
-epochs = len(results['validation_0']['rmse'])
-x_axis = range(0, epochs)
-
-fig, ax = plt.subplots(figsize=(10, 6))
-ax.plot(x_axis, results['validation_0']['rmse'], label='Train')
-ax.plot(x_axis, results['validation_0']['mae'], label='Test')
-ax.legend()
-plt.ylabel('RMSE/MAE')
-plt.title('XGBoost Learning Curve')
-plt.show()
\ No newline at end of file
+    if np.unique(data.y).size <= 1:
+        raise ValueError("Target variable 'fire_size' has no variation!")
+
+    # =============================================
+    # 2. Feature Analysis
+    # =============================================
+    if not args.no_plots:
+        print("\n🔎 Feature Analysis:")
+
+        # Correlation analysis
+        corr_matrix = data.frame().corr()
+        plt.figure(figsize=(12, 8))
+        sns.heatmap(corr_matrix, annot=True, fmt=".2f", cmap="coolwarm")
+        plt.title("Feature Correlation Matrix")
+        plt.show()
+
+    # =============================================
+    # 3. Train-Test Split & Scaling
+    # =============================================
+    X_train_scaled, X_test_scaled = data.X_train, data.X_test
+    y_train, y_test = data.y_train, data.y_test
+    scaler = data.scaler
+
+    # =============================================
+    # 4. Hyperparameter Tuning (successive halving)
+    # =============================================
+    configs = [
+        {name: value.item() if hasattr(value, 'item') else value for name, value in params.items()}
+        for params in ParameterSampler(PARAM_DIST, n_iter=args.n_configs, random_state=args.seed)
+    ]
+    rounds = rung_rounds(args.min_rounds, args.max_rounds, args.eta)
+    # Trials of another data set or search setting are not reused
+    search_id = hashlib.sha256(json.dumps(
+        [os.path.basename(data.path), args.seed, args.n_configs, rounds, args.eta, args.cv, args.gap_days]
+    ).encode()).hexdigest()[:16]
+
+    search = SuccessiveHalving(
+        X_train_scaled, y_train, configs, rounds, folds, args.eta, args.n_jobs, args.trial_threads, args.trials,
+        search_id
+    )
+    print(f"\n🎛 Starting successive halving: {len(configs)} configurations, rungs of {rounds} rounds")
+    start = time.perf_counter()
+    best, best_rounds, best_cv_mse = search.run()
+    search_seconds = time.perf_counter() - start
+    best_params = {**configs[best], 'n_estimators': best_rounds}
+
+    print("\n🏆 Best Parameters Found:")
+    print(best_params)
+    print(f"- Cross-validated MSE: {best_cv_mse:.4f}, search time {search_seconds:.1f}s")
+
+    # Refit on all the training rows; the test rows are only monitored for the learning curve
+    best_model = xgb.XGBRegressor(
+        **best_params, tree_method='hist', random_state=42, n_jobs=args.n_jobs, eval_metric='rmse'
+    )
+    best_model.fit(X_train_scaled, y_train, eval_set=[(X_train_scaled, y_train), (X_test_scaled, y_test)],
+                   verbose=False)
+
+    print("\n📊 Model Evaluation:")
+    metrics = evaluate_model(best_model, X_test_scaled, y_test, plot=not args.no_plots)
+    for name, value in metrics.items():
+        print(f"{name}: {value:.4f}")
+
+    if args.baseline:
+        print("\n⏱ Running the previous RandomizedSearchCV for comparison...")
+        random_search, baseline_seconds = randomized_search_baseline(X_train_scaled, y_train, folds)
+        baseline_metrics = evaluate_model(random_search.best_estimator_, X_test_scaled, y_test, plot=False)
+        comparison = {
+            'successive_halving': {'seconds': search_seconds, 'test_mse': metrics['MSE'], 'params': best_params},
+            'randomized_search': {'seconds': baseline_seconds, 'test_mse': baseline_metrics['MSE'],
+                                  'params': {k: v.item() if hasattr(v, 'item') else v
+                                             for k, v in random_search.best_params_.items()}},
+        }
+        print(f"- Successive halving: {search_seconds:.1f}s, test MSE {metrics['MSE']:.4f}")
+        print(f"- RandomizedSearchCV: {baseline_seconds:.1f}s, test MSE {baseline_metrics['MSE']:.4f}")
+        with open('tuning_comparison.json', 'w') as f:
+            json.dump(comparison, f, indent=2)
+
+    # =============================================
+    # 6. Save Model Artifacts
+    # =============================================
+    artifacts = {
+        'model': 'wildfire_prediction_xgboost.pkl',
+        'scaler': 'feature_scaler.pkl',
+        'features': 'feature_names.json',
+        'params': 'best_params.json'
+    }
+
+    joblib.dump(best_model, artifacts['model'])
+    joblib.dump(scaler, artifacts['scaler'])
+    with open(artifacts['features'], 'w') as f:
+        json.dump(data.feature_names, f)
+    with open(artifacts['params'], 'w') as f:
+        json.dump(best_params, f)
+
+    print("\n💾 Saved artifacts:")
+    for name, path in artifacts.items():
+        print(f"- {name}: {path}")
+
+    # =============================================
+    # 7. Learning Curves Visualization
+    # =============================================
+    if not args.no_plots:
+        results = best_model.evals_result()
+        epochs = len(results['validation_0']['rmse'])
+        x_axis = range(0, epochs)
+
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.plot(x_axis, results['validation_0']['rmse'], label='Train')
+        ax.plot(x_axis, results['validation_1']['rmse'], label='Test')
+        ax.legend()
+        plt.ylabel('RMSE')
+        plt.title('XGBoost Learning Curve')
+        plt.show()